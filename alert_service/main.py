@@ -1,67 +1,315 @@
 from confluent_kafka import Consumer
-import json
 import os
-from prometheus_client import Counter, Gauge, Histogram, start_http_server
+import signal
+import sys
+import threading
+import time
+from multiprocessing import Process
+from pathlib import Path
 
-# Prometheus metrics
-ANOMALY_COUNT = Counter('anomaly_events_total', 'Total anomaly events')
-FAULT_COUNT = Counter('fault_events_total', 'Total fault events')
-RUL_GAUGE = Gauge('rul_estimated', 'Latest RUL estimate', ['host'])
-FAILURE_PROB_HIST = Histogram('failure_probability', 'Failure probability histogram')
+# src/ dùng chung với inference server (repo root khi chạy local, /app/src trong image)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from src.alert_schema import decode_alert, vehicle_key  # noqa: E402
+from src.metrics import (  # noqa: E402
+    collector_registry, mark_process_dead, multiprocess_dir, prepare_multiprocess_dir, remove_multiprocess_dir
+)
 
 KAFKA_BOOTSTRAP = os.environ.get("KAFKA_BOOTSTRAP_SERVERS", "kafka:9092")
 PRED_TOPIC = os.environ.get("PRED_TOPIC", "predictions")
 GROUP = os.environ.get("ALERT_GROUP", "alert-service-group")
 PROM_PORT = int(os.environ.get("PROM_PORT", "9101"))
+# Số consumer processes trong cùng group: mỗi worker sở hữu một phần partitions (tối đa = số partitions)
+ALERT_WORKERS = int(os.environ.get("ALERT_WORKERS", "1"))
+# Mỗi lần consume() lấy tối đa ALERT_BATCH_SIZE message, chờ tối đa ALERT_BATCH_TIMEOUT_MS
+ALERT_BATCH_SIZE = int(os.environ.get("ALERT_BATCH_SIZE", "500"))
+ALERT_BATCH_TIMEOUT = float(os.environ.get("ALERT_BATCH_TIMEOUT_MS", "500")) / 1000
+
+# Nhiều worker: metrics của mọi process gộp qua thư mục multiprocess (phải đặt trước khi import prometheus_client)
+OWNS_METRICS_DIR = ALERT_WORKERS > 1 and multiprocess_dir() is None
+if ALERT_WORKERS > 1:
+    prepare_multiprocess_dir()
+
+from prometheus_client import Counter, Gauge, Histogram, start_http_server  # noqa: E402
+
+# Prometheus metrics
+ANOMALY_COUNT = Counter('anomaly_events_total', 'Total anomaly events')
+FAULT_COUNT = Counter('fault_events_total', 'Total fault events')
+RUL_GAUGE = Gauge('rul_estimated', 'Latest RUL estimate', ['host'], multiprocess_mode='mostrecent')
+FAILURE_PROB_HIST = Histogram('failure_probability', 'Failure probability histogram')
+DECODE_ERRORS = Counter('alert_decode_errors_total', 'Alert messages that could not be decoded')
+EVENTS_PROCESSED = Counter('alert_events_processed_total', 'Alert events processed per consumer worker', ['worker'])
+PARTITIONS_ASSIGNED = Gauge('alert_partitions_assigned', 'Partitions owned by each consumer worker', ['worker'],
+                            multiprocess_mode='livesum')
+VEHICLES_TRACKED = Gauge('alert_vehicles_tracked', 'Vehicles with in-memory state across consumer workers',
+                         multiprocess_mode='livesum')
+OUT_OF_ORDER = Counter('alert_out_of_order_events_total', 'Events older than the last event seen for the same vehicle')
+CONSUMER_LAG = Gauge('alert_consumer_lag', 'Messages behind the partition high watermark', ['partition'],
+                     multiprocess_mode='livesum')
+BATCH_SIZE = Histogram('alert_batch_size', 'Messages per consumed batch',
+                       buckets=(1, 8, 32, 64, 128, 256, 512, 1024, 2048, 4096))
+BATCH_SECONDS = Histogram('alert_batch_processing_seconds', 'Time to decode, process and commit one batch',
+                          buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0))
 
 conf = {
     'bootstrap.servers': KAFKA_BOOTSTRAP,
     'group.id': GROUP,
-    'auto.offset.reset': 'earliest'
+    'auto.offset.reset': 'earliest',
+    # Commit thủ công sau mỗi batch đã xử lý xong (at-least-once)
+    'enable.auto.commit': False,
+    # Rebalance chỉ chuyển các partition cần chuyển: worker giữ nguyên state của phần còn lại
+    'partition.assignment.strategy': 'cooperative-sticky'
 }
 
-def start_consumer():
-    c = Consumer(conf)
-    c.subscribe([PRED_TOPIC])
-    print("Alert Service subscribed to topic:", PRED_TOPIC)
 
-    try:
-        while True:
-            msg = c.poll(timeout=1.0)
-            if not msg:
-                continue
-            if msg.error():
-                print("Kafka error:", msg.error())
-                continue
+class VehicleState:
+    """State của một xe, chỉ nằm trên worker đang sở hữu partition của xe đó."""
 
-            try:
-                data = json.loads(msg.value().decode("utf-8"))
-            except:
-                continue
+    __slots__ = ('last_timestamp', 'alerts', 'faults', 'last_rul')
+
+    def __init__(self):
+        self.last_timestamp = 0
+        self.alerts = 0
+        self.faults = 0
+        self.last_rul = None
+
+
+class VehicleStateStore:
+    """
+    Per-vehicle state theo partition. Message được key theo xe nên mọi event của
+    một xe nằm trên cùng partition, theo thứ tự; khi partition bị revoke, state
+    của các xe thuộc partition đó bị bỏ (worker mới nhận partition tự dựng lại).
+    """
+
+    def __init__(self):
+        self.vehicles = {}
+        self.by_partition = {}
+
+    def get(self, partition, vehicle):
+        state = self.vehicles.get(vehicle)
+        if state is None:
+            state = self.vehicles[vehicle] = VehicleState()
+            self.by_partition.setdefault(partition, set()).add(vehicle)
+            VEHICLES_TRACKED.inc()
+        return state
+
+    def drop_partitions(self, partitions):
+        for partition in partitions:
+            for vehicle in self.by_partition.pop(partition, ()):
+                if self.vehicles.pop(vehicle, None) is not None:
+                    VEHICLES_TRACKED.dec()
 
-            pred = data.get('prediction', {})
-            host = data.get('host', 'unknown')
 
-            anomaly = pred.get('IF_Anomaly')
-            is_fault = pred.get('is_fault')
+def process_batch(messages, store):
+    """
+    Decode + cập nhật metrics / state cho một batch message.
+
+    Counter được cộng một lần mỗi batch; RUL gauge chỉ set giá trị cuối của mỗi host.
+    Message không phải alert hợp lệ (payload / `prediction` không phải object,
+    RUL / failure_prob / timestamp sai kiểu) được đếm là decode lỗi và bỏ qua,
+    không làm hỏng cả batch.
+
+    Returns:
+        (số event xử lý được, số message decode lỗi)
+    """
+    events = []
+    decode_errors = 0
+    last_error = None
+    for msg in messages:
+        if msg.error():
+            print("Kafka error:", msg.error())
+            continue
+        try:
+            # JSON hoặc schema nhị phân (nhận dạng theo byte đầu của message)
+            data = decode_alert(msg.value())
+            if not isinstance(data, dict):
+                raise ValueError(f"alert is not an object: {type(data).__name__}")
+            if not isinstance(data.get('prediction', {}), dict):
+                raise ValueError(f"prediction is not an object: {type(data['prediction']).__name__}")
+            events.append((msg, data))
+        except ValueError as e:
+            decode_errors += 1
+            last_error = e
+
+    anomalies = faults = out_of_order = processed = 0
+    latest_rul = {}
+    for msg, data in events:
+        pred = data.get('prediction', {})
+        host = data.get('host', 'unknown')
+
+        anomaly = pred.get('IF_Anomaly')
+        is_fault = pred.get('is_fault')
+        key = msg.key()
+        vehicle = key.decode('utf-8', 'replace') if key else vehicle_key(data)
+        state = store.get(msg.partition(), vehicle)
+        try:
             rul = pred.get('RUL_estimated')
+            rul = float(rul) if rul is not None else None
             failure_prob = pred.get('failure_prob')
+            failure_prob = float(failure_prob) if failure_prob is not None else None
+            timestamp = data.get('timestamp') or 0
+            late = timestamp < state.last_timestamp
+        except (TypeError, ValueError) as e:
+            decode_errors += 1
+            last_error = e
+            continue
 
-            if anomaly:
-                ANOMALY_COUNT.inc()
-            if is_fault:
-                FAULT_COUNT.inc()
-            if rul is not None:
-                RUL_GAUGE.labels(host=host).set(float(rul))
-            if failure_prob is not None:
-                FAILURE_PROB_HIST.observe(float(failure_prob))
+        if late:
+            out_of_order += 1
+        else:
+            state.last_timestamp = timestamp
+        state.alerts += 1
+        processed += 1
 
-    except KeyboardInterrupt:
-        pass
+        if anomaly:
+            anomalies += 1
+        if is_fault:
+            faults += 1
+            state.faults += 1
+        if rul is not None:
+            state.last_rul = latest_rul[host] = rul
+        if failure_prob is not None:
+            FAILURE_PROB_HIST.observe(failure_prob)
+
+    if decode_errors:
+        DECODE_ERRORS.inc(decode_errors)
+        print(f"Alert decode errors: {decode_errors} in batch (last: {last_error})")
+    if anomalies:
+        ANOMALY_COUNT.inc(anomalies)
+    if faults:
+        FAULT_COUNT.inc(faults)
+    if out_of_order:
+        OUT_OF_ORDER.inc(out_of_order)
+    for host, rul in latest_rul.items():
+        RUL_GAUGE.labels(host=host).set(rul)
+    return processed, decode_errors
+
+
+def _commit(consumer, asynchronous=True):
+    try:
+        consumer.commit(asynchronous=asynchronous)
+    except Exception as e:
+        # Chưa có offset nào để commit (_NO_OFFSET) hoặc đang rebalance
+        print("Offset commit skipped:", e)
+
+
+def _update_lag(consumer, messages, worker):
+    """Consumer lag = high watermark (cached, không gọi broker) - offset kế tiếp, theo partition."""
+    from confluent_kafka import TopicPartition
+
+    last = {}
+    for msg in messages:
+        if not msg.error():
+            last[(msg.topic(), msg.partition())] = msg.offset()
+    for (topic, partition), offset in last.items():
+        try:
+            _, high = consumer.get_watermark_offsets(TopicPartition(topic, partition), cached=True)
+        except Exception:
+            continue
+        if high >= 0:
+            CONSUMER_LAG.labels(partition=str(partition)).set(max(0, high - offset - 1))
+
+
+def run_consumer(c, worker, stop, batch_size=ALERT_BATCH_SIZE, timeout=ALERT_BATCH_TIMEOUT, on_batch=None):
+    """
+    Vòng consume theo batch cho tới khi `stop` (threading.Event) được set.
+
+    Mỗi batch: `consume()` tối đa `batch_size` message (chờ tối đa `timeout` giây),
+    xử lý xong cả batch rồi mới commit offsets (async; commit sync khi dừng).
+    Thoát vì exception thì không commit: batch đang xử lý dở được đọc lại
+    (at-least-once).
+    """
+    store = VehicleStateStore()
+
+    def on_assign(consumer, partitions):
+        PARTITIONS_ASSIGNED.labels(worker=worker).inc(len(partitions))
+        print(f"[worker {worker}] assigned partitions:", [p.partition for p in partitions])
+
+    def on_revoke(consumer, partitions):
+        # Batch trước đã xử lý xong: commit ngay để worker nhận partition không xử lý lại
+        _commit(consumer, asynchronous=False)
+        PARTITIONS_ASSIGNED.labels(worker=worker).dec(len(partitions))
+        store.drop_partitions(p.partition for p in partitions)
+        for p in partitions:
+            CONSUMER_LAG.labels(partition=str(p.partition)).set(0)
+        print(f"[worker {worker}] revoked partitions:", [p.partition for p in partitions])
+
+    c.subscribe([PRED_TOPIC], on_assign=on_assign, on_revoke=on_revoke, on_lost=on_revoke)
+    print(f"Alert Service worker {worker} subscribed to topic: {PRED_TOPIC} (batch {batch_size})")
+
+    processed = EVENTS_PROCESSED.labels(worker=worker)
+    stopped_cleanly = False
+    try:
+        while not stop.is_set():
+            messages = c.consume(num_messages=batch_size, timeout=timeout)
+            if not messages:
+                continue
+            started = time.perf_counter()
+            count, _ = process_batch(messages, store)
+            _commit(c)
+            _update_lag(c, messages, worker)
+            processed.inc(count)
+            BATCH_SIZE.observe(len(messages))
+            BATCH_SECONDS.observe(time.perf_counter() - started)
+            if on_batch is not None:
+                on_batch(len(messages))
+        stopped_cleanly = True
     finally:
+        if stopped_cleanly:
+            _commit(c, asynchronous=False)
+        # close() rời group ngay (partitions được chia lại cho worker khác)
         c.close()
 
+
+def start_consumer(worker_id=0):
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    try:
+        run_consumer(Consumer(conf), str(worker_id), stop)
+    except KeyboardInterrupt:
+        pass
+
+
+def run_workers(workers):
+    """Fork `workers` consumer processes trong cùng group; worker chết được fork lại."""
+    running = True
+
+    def stop(signum, frame):
+        nonlocal running
+        running = False
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    def spawn(worker_id):
+        process = Process(target=start_consumer, args=(worker_id,), name=f"alert-worker-{worker_id}")
+        process.start()
+        return process
+
+    processes = {i: spawn(i) for i in range(workers)}
+    print(f"✅ Alert Service started {workers} consumer workers")
+    while running:
+        time.sleep(1.0)
+        for worker_id, process in list(processes.items()):
+            if not process.is_alive() and running:
+                mark_process_dead(process.pid)
+                print(f"⚠️ Alert worker {worker_id} (pid {process.pid}) exited with {process.exitcode}, restarting")
+                processes[worker_id] = spawn(worker_id)
+
+    for process in processes.values():
+        process.terminate()
+    for process in processes.values():
+        process.join(timeout=30)
+        mark_process_dead(process.pid)
+
+
 if __name__ == "__main__":
-    start_http_server(PROM_PORT)
+    start_http_server(PROM_PORT, registry=collector_registry())
     print(f"Prometheus metrics at :{PROM_PORT}/")
-    start_consumer()
+    if ALERT_WORKERS > 1:
+        try:
+            run_workers(ALERT_WORKERS)
+        finally:
+            if OWNS_METRICS_DIR:
+                remove_multiprocess_dir(multiprocess_dir())
+    else:
+        start_consumer()
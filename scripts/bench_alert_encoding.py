@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Benchmark - alert event encoding: JSON vs schema nhị phân (src/alert_schema.py)
+
+Đo bytes / event, throughput encode (producer) và decode (alert_service) cho
+cùng một tập alert. Kafka nén theo record batch, nên kích thước sau nén được đo
+trên batch `--batch-size` events nối liền: `zlib` (stdlib) luôn có, `lz4` /
+`zstd` nếu package `lz4` / `zstandard` được cài (cùng codec librdkafka dùng).
+
+Events: dòng trong `--rows` (JSON list các dict telemetry) hoặc dòng synthetic
+với mọi field của schema hiện tại.
+
+Usage:
+    python scripts/bench_alert_encoding.py [--events 20000] [--batch-size 500] [--rows rows.json]
+"""
+
+import argparse
+import json
+import random
+import sys
+import time
+import zlib
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.alert_schema import CURRENT_SCHEMA_ID, SCHEMAS, decode_alert, encode_alert  # noqa: E402
+
+LABELS = ["Battery Fault", "Motor Overheat", "Brake Wear", "Sensor Drift", None]
+
+
+def synthetic_rows(n_rows: int, seed: int = 0):
+    rng = random.Random(seed)
+    fields = SCHEMAS[CURRENT_SCHEMA_ID].fields
+    return [{name: rng.uniform(0, 100) for name in fields} for _ in range(n_rows)]
+
+
+def make_events(rows, n_events: int, seed: int = 0):
+    """Alert giống `_score_batch` gửi lên Kafka (input = dòng telemetry gốc)."""
+    rng = random.Random(seed)
+    events = []
+    for i in range(n_events):
+        row = rows[i % len(rows)]
+        label = rng.choice(LABELS)
+        is_fault = label is not None
+        events.append({
+            "timestamp": 1700000000 + i,
+            "host": "fastapi-inference-7d9f",
+            "input": row,
+            "prediction": {
+                "IF_Anomaly": 1,
+                "classifier_label": label,
+                "is_fault": is_fault,
+                "RUL_estimated": rng.uniform(0, 500) if is_fault else None,
+                "failure_prob": row.get("Failure_Probability", 0.0),
+            },
+        })
+    return events
+
+
+def per_second(fn, items):
+    start = time.perf_counter()
+    out = [fn(item) for item in items]
+    return len(items) / (time.perf_counter() - start), out
+
+
+def compressors():
+    codecs = {"zlib": lambda data: zlib.compress(data, 6)}
+    try:
+        import lz4.frame
+        codecs["lz4"] = lz4.frame.compress
+    except ImportError:
+        pass
+    try:
+        import zstandard
+        codecs["zstd"] = zstandard.ZstdCompressor(level=3).compress
+    except ImportError:
+        pass
+    return codecs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=20000)
+    parser.add_argument("--batch-size", type=int, default=500, help="Events mỗi Kafka record batch khi đo nén")
+    parser.add_argument("--rows", default=None, help="JSON list các dòng telemetry")
+    args = parser.parse_args()
+
+    rows = json.load(open(args.rows)) if args.rows else synthetic_rows(256)
+    events = make_events(rows, args.events)
+    codecs = compressors()
+
+    results = {}
+    for encoding, decode in (("json", json.loads), ("binary", decode_alert)):
+        encode_rate, messages = per_second(lambda event: encode_alert(event, encoding), events)
+        decode_rate, _ = per_second(decode, messages)
+        batches = [b"".join(messages[i:i + args.batch_size]) for i in range(0, len(messages), args.batch_size)]
+        compressed = {name: sum(len(fn(batch)) for batch in batches) / len(messages) for name, fn in codecs.items()}
+        results[encoding] = {
+            "bytes": sum(len(m) for m in messages) / len(messages),
+            "encode": encode_rate,
+            "decode": decode_rate,
+            "compressed": compressed,
+        }
+
+    # Sai số float32 so với giá trị gốc (JSON giữ nguyên float64)
+    decoded = decode_alert(encode_alert(events[0]))
+    max_rel_error = max(
+        abs(decoded["input"][k] - v) / max(abs(v), 1e-12)
+        for k, v in events[0]["input"].items() if isinstance(v, float)
+    )
+
+    print(f"{args.events} events, schema id {CURRENT_SCHEMA_ID}, {len(events[0]['input'])} telemetry fields")
+    header = f"{'encoding':<8} {'bytes/event':>12} {'encode/s':>12} {'decode/s':>12}"
+    header += "".join(f" {name + '/event':>12}" for name in codecs)
+    print(header)
+    print("-" * len(header))
+    for encoding, r in results.items():
+        line = f"{encoding:<8} {r['bytes']:>12.1f} {r['encode']:>12.0f} {r['decode']:>12.0f}"
+        line += "".join(f" {r['compressed'][name]:>12.1f}" for name in codecs)
+        print(line)
+
+    j, b = results["json"], results["binary"]
+    print(f"\nbinary vs json: {j['bytes'] / b['bytes']:.1f}x fewer bytes, "
+          f"encode {b['encode'] / j['encode']:.2f}x, decode {b['decode'] / j['decode']:.2f}x")
+    for name in codecs:
+        print(f"  after {name} (batch {args.batch_size}): {j['compressed'][name] / b['compressed'][name]:.1f}x fewer bytes")
+    print(f"float32 max relative error: {max_rel_error:.2e}")
+
+
+if __name__ == "__main__":
+    main()
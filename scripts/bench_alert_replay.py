@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Benchmark - replay alert topic qua vòng consume theo batch của alert_service
+
+Không cần Kafka: publish `--events` alert (encode như inference server, key theo
+xe, thêm một tỉ lệ `--corrupt` message hỏng) vào broker in-process
+(src/inmemory_kafka.py), rồi với mỗi batch size chạy `run_consumer` của
+alert_service/main.py (consumer group mới, đọc từ đầu topic) tới khi mọi offset
+được commit. Batch size 1 tương đương vòng `poll()` từng message cũ.
+
+In ra msgs/s trung bình và throughput bền vững (min / mean theo cửa sổ
+`--window` giây), thời gian xử lý mỗi batch, số decode error, và kiểm tra
+offset commit == end offset của topic.
+
+Usage:
+    python scripts/bench_alert_replay.py [--events 200000] [--partitions 6] [--batch-sizes 1,100,500,1000]
+                                         [--encoding binary] [--corrupt 0.001] [--window 0.5]
+"""
+
+import argparse
+import importlib.util
+import random
+import sys
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from bench_alert_encoding import make_events, synthetic_rows  # noqa: E402  (cùng thư mục scripts/)
+from src.alert_schema import ALERT_ENCODINGS, encode_alert  # noqa: E402
+from src.inmemory_kafka import InMemoryBroker, InMemoryConsumer  # noqa: E402
+
+
+def load_alert_service():
+    spec = importlib.util.spec_from_file_location("alert_service_main", ROOT / "alert_service" / "main.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def replay(service, broker, batch_size: int, window: float, run: int):
+    """Chạy run_consumer trên một group mới tới khi commit hết topic; trả về (giây, rates theo cửa sổ, batch times)."""
+    topic = service.PRED_TOPIC
+    end_offsets = broker.end_offsets(topic)
+    total = sum(end_offsets.values())
+    consumer = InMemoryConsumer(broker, group_id=f"bench-alert-replay-{run}-{batch_size}")
+    stop = threading.Event()
+    state = {"consumed": 0, "window_start": None, "window_count": 0}
+    rates, batch_seconds = [], []
+    last = [time.perf_counter()]
+
+    def on_batch(count):
+        now = time.perf_counter()
+        batch_seconds.append(now - last[0])
+        last[0] = now
+        state["consumed"] += count
+        state["window_count"] += count
+        if now - state["window_start"] >= window:
+            rates.append(state["window_count"] / (now - state["window_start"]))
+            state.update(window_start=now, window_count=0)
+        if state["consumed"] >= total:
+            stop.set()
+
+    started = state["window_start"] = last[0] = time.perf_counter()
+    thread = threading.Thread(target=service.run_consumer, args=(consumer, "bench", stop),
+                              kwargs={"batch_size": batch_size, "timeout": 0.1, "on_batch": on_batch})
+    thread.start()
+    thread.join()
+    elapsed = time.perf_counter() - started
+
+    # close() trong run_consumer xoá positions: đọc offsets đã commit của group trực tiếp từ broker
+    committed = {p: broker.committed.get((consumer.group_id, topic, p), 0) for p in end_offsets}
+    return elapsed, rates, batch_seconds, committed == end_offsets
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=200000)
+    parser.add_argument("--partitions", type=int, default=6)
+    parser.add_argument("--vehicles", type=int, default=500)
+    parser.add_argument("--batch-sizes", default="1,100,500,1000")
+    parser.add_argument("--encoding", choices=ALERT_ENCODINGS, default="binary")
+    parser.add_argument("--corrupt", type=float, default=0.001, help="Tỉ lệ message không decode được")
+    parser.add_argument("--window", type=float, default=0.5, help="Cửa sổ (giây) đo throughput bền vững")
+    args = parser.parse_args()
+
+    service = load_alert_service()
+    broker = InMemoryBroker(partitions=args.partitions)
+    rng = random.Random(0)
+    events = make_events(synthetic_rows(256), args.events)
+    corrupt = 0
+    for i, event in enumerate(events):
+        key = f"EV{i % args.vehicles:05d}"
+        if rng.random() < args.corrupt:
+            broker.append(service.PRED_TOPIC, b"\xea\x01", key=key)
+            corrupt += 1
+        else:
+            broker.append(service.PRED_TOPIC, encode_alert(event, args.encoding), key=key)
+
+    print(f"{args.events} {args.encoding} alerts ({corrupt} corrupt), {args.partitions} partitions, "
+          f"{args.vehicles} vehicles")
+    print(f"{'batch':>6} {'msgs/s':>10} {'sustained min':>14} {'sustained mean':>15} "
+          f"{'batch p50':>10} {'batch p99':>10}  offsets")
+    ok = True
+    for run, batch_size in enumerate(int(b) for b in args.batch_sizes.split(",")):
+        errors_before = service.DECODE_ERRORS._value.get()
+        elapsed, rates, batch_seconds, offsets_ok = replay(service, broker, batch_size, args.window, run)
+        decode_errors = int(service.DECODE_ERRORS._value.get() - errors_before)
+        ok = ok and offsets_ok and decode_errors == corrupt
+        rates = rates or [args.events / elapsed]
+        print(f"{batch_size:>6} {args.events / elapsed:>10.0f} {min(rates):>14.0f} {np.mean(rates):>15.0f} "
+              f"{np.percentile(batch_seconds, 50) * 1000:>8.2f}ms {np.percentile(batch_seconds, 99) * 1000:>8.2f}ms"
+              f"  {'✅' if offsets_ok else '❌'} committed, {decode_errors} decode errors")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
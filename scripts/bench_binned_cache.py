@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Benchmark - cache dataset đã build của LightGBM / XGBoost (src/binned_cache.py)
+
+Trên dataset training (ma trận RUL và tập train của classifier như trong
+trainers), đo thời gian có được `lgb.Dataset` (đã bin) / `xgb.DMatrix`:
+
+- `built`: build từ pandas / numpy (như trước khi có cache) rồi ghi file
+- `disk`: đọc lại file binary (retrain trong process mới, cùng dữ liệu)
+- `memory`: dataset đang giữ trong process (trial tiếp theo của một search)
+
+Sau đó chạy một random search nhỏ (`--trials` bộ params, `--rounds` vòng
+boosting) hai lần: build dataset mỗi trial vs dùng cache, và in phần thời gian
+của mỗi trial dành cho dataset. Với XGBoost, quantile sketch (hist) chạy trong
+lần train đầu trên mỗi DMatrix nên nằm trong thời gian fit.
+
+Trước khi đo, kiểm tra round-trip của artifact: booster train trên dataset
+cache -> `rul._as_regressor` / `classifier._as_classifier` -> pickle -> load,
+rồi `predict` (và `booster_` / `get_booster`) phải khớp booster gốc. `_as_regressor`
+gán thuộc tính private của LGBMRegressor nên chạy lại sau mỗi lần đổi version
+lightgbm (pin trong requirements của training và inference).
+
+Cache được ghi vào thư mục tạm, không đụng tới `BINNED_CACHE_DIR`.
+
+Usage:
+    python scripts/bench_binned_cache.py [--csv src/data/EV_Predictive_Maintenance_Dataset_15min.csv]
+                                         [--trials 6] [--rounds 100]
+"""
+
+import argparse
+import pickle
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src import binned_cache, classifier, rul  # noqa: E402
+from src.dataset_cache import CSV, load_training_frame  # noqa: E402
+
+
+def training_data(csv: Path):
+    """(X, y) của RUL và (Xtr, ytr, weight) của classifier, cùng cách trainers chuẩn bị."""
+    from sklearn.model_selection import train_test_split
+    from sklearn.preprocessing import StandardScaler
+
+    df = load_training_frame(list(dict.fromkeys(classifier.COLUMNS + rul.COLUMNS)), csv=csv)
+    label_col, y, label_encoder = classifier.classifier_labels(df)
+    X_rul, y_rul = rul.rul_matrix(df, label_col, label_encoder)
+
+    features = [c for c in classifier.FEATURES if c in df.columns]
+    Xs = StandardScaler().fit_transform(df[features].fillna(0.0).astype(float))
+    Xtr, _, ytr, _ = train_test_split(Xs, y, test_size=classifier.TEST_SIZE, random_state=classifier.SEED,
+                                      stratify=y if len(np.unique(y)) > 1 else None)
+    weight_map = classifier.class_weight_map(ytr)
+    weight = np.array([weight_map[label] for label in ytr]) if weight_map is not None else None
+    return (X_rul, y_rul), (Xtr, ytr, weight)
+
+
+def search_space(trials: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    return [
+        {
+            "lgb": {"num_leaves": int(rng.choice([15, 31, 63])), "min_data_in_leaf": int(rng.choice([10, 20, 50])),
+                    "learning_rate": float(rng.choice([0.03, 0.05, 0.1]))},
+            "xgb": {"max_depth": int(rng.choice([3, 4, 6])), "learning_rate": float(rng.choice([0.05, 0.12, 0.2]))},
+        }
+        for _ in range(trials)
+    ]
+
+
+def check_round_trip(rul_data, clf_data, cache_dir: Path, rounds: int = 20):
+    """Model từ `lgb.train` / `xgb.train` qua pickle vẫn predict như booster gốc (AssertionError nếu không)."""
+    import lightgbm as lgb
+    import xgboost as xgb
+
+    X_rul = rul_data[0]
+    dataset, _ = binned_cache.lgb_dataset(*rul_data, rul.DATASET_PARAMS, cache_dir=cache_dir)
+    booster = lgb.train(rul.train_params(verbose=-1), dataset, num_boost_round=rounds)
+    model = pickle.loads(pickle.dumps(rul._as_regressor(booster, None)))
+    assert isinstance(model.booster_, lgb.Booster), "RUL: booster_ missing after pickle"
+    assert model.n_features_in_ == X_rul.shape[1], model.n_features_in_
+    np.testing.assert_allclose(model.predict(X_rul), booster.predict(X_rul.values))
+    np.testing.assert_allclose(model.booster_.predict(X_rul.values), booster.predict(X_rul.values))
+
+    Xtr = clf_data[0]
+    dmatrix, _ = binned_cache.xgb_dmatrix(*clf_data, cache_dir=cache_dir)
+    booster = xgb.train(classifier.booster_params(len(np.unique(clf_data[1]))), dmatrix, num_boost_round=rounds)
+    clf = pickle.loads(pickle.dumps(classifier._as_classifier(booster, None)))
+    proba = booster.predict(xgb.DMatrix(Xtr))
+    proba = proba if proba.ndim == 2 else np.column_stack([1 - proba, proba])
+    np.testing.assert_allclose(clf.predict_proba(Xtr), proba, rtol=1e-6)
+    assert isinstance(clf.get_booster(), xgb.Booster), "classifier: booster missing after pickle"
+    print(f"✅ Round-trip (pickle -> load -> predict) OK: lightgbm {lgb.__version__}, xgboost {xgb.__version__}")
+
+
+def run_search(kind: str, data, space, rounds: int, cache_dir: Path, enabled: bool):
+    """Tổng (giây dataset, giây fit) của các trial."""
+    import lightgbm as lgb
+    import xgboost as xgb
+
+    binned_cache.clear_memory()
+    dataset_total = fit_total = 0.0
+    for trial in space:
+        if kind == "lgb":
+            dataset, info = binned_cache.lgb_dataset(*data, rul.DATASET_PARAMS, cache_dir=cache_dir, enabled=enabled)
+            started = time.perf_counter()
+            lgb.train(rul.train_params(**trial["lgb"], verbose=-1), dataset, num_boost_round=rounds)
+        else:
+            dataset, info = binned_cache.xgb_dmatrix(*data, cache_dir=cache_dir, enabled=enabled)
+            started = time.perf_counter()
+            xgb.train(classifier.booster_params(len(np.unique(data[1])), **trial["xgb"]), dataset, num_boost_round=rounds)
+        dataset_total += info["seconds"]
+        fit_total += time.perf_counter() - started
+    return dataset_total, fit_total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--csv", default=None)
+    parser.add_argument("--trials", type=int, default=6)
+    parser.add_argument("--rounds", type=int, default=100)
+    args = parser.parse_args()
+
+    rul_data, clf_data = training_data(Path(args.csv) if args.csv else CSV)
+    print(f"RUL matrix {rul_data[0].shape}, classifier train set {clf_data[0].shape}")
+
+    with tempfile.TemporaryDirectory(prefix="binned-cache-") as tmp:
+        cache_dir = Path(tmp)
+        check_round_trip(rul_data, clf_data, cache_dir / "round-trip")
+        print(f"\n{'dataset':<8} {'built':>8} {'disk':>8} {'memory':>8}  file")
+        for kind, data in (("lgb", rul_data), ("xgb", clf_data)):
+            get = (lambda: binned_cache.lgb_dataset(*data, rul.DATASET_PARAMS, cache_dir=cache_dir)) if kind == "lgb" \
+                else (lambda: binned_cache.xgb_dmatrix(*data, cache_dir=cache_dir))
+            binned_cache.clear_memory()
+            seconds = {}
+            for expected in ("built", "disk", "memory"):
+                if expected == "disk":
+                    binned_cache.clear_memory()
+                _, info = get()
+                assert info["source"] == expected, info
+                seconds[expected] = info["seconds"]
+            size = sum(p.stat().st_size for p in cache_dir.glob(f"{kind}-*.bin"))
+            print(f"{kind:<8} {seconds['built']:>7.3f}s {seconds['disk']:>7.3f}s {seconds['memory']:>7.4f}s  "
+                  f"{size / 1e6:.1f} MB")
+
+        space = search_space(args.trials)
+        print(f"\nsearch: {args.trials} trials x {args.rounds} rounds")
+        print(f"{'dataset':<8} {'cache':<6} {'dataset':>9} {'fit':>9} {'total':>9} {'dataset %':>10}")
+        for kind, data in (("lgb", rul_data), ("xgb", clf_data)):
+            for enabled in (False, True):
+                dataset_seconds, fit_seconds = run_search(kind, data, space, args.rounds, cache_dir, enabled)
+                total = dataset_seconds + fit_seconds
+                print(f"{kind:<8} {'on' if enabled else 'off':<6} {dataset_seconds:>8.2f}s {fit_seconds:>8.2f}s "
+                      f"{total:>8.2f}s {100 * dataset_seconds / total:>9.1f}%")
+
+
+if __name__ == "__main__":
+    main()
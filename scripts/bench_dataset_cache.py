@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Benchmark - load dataset training: CSV (như trước) vs cache Parquet có kiểu (src/dataset_cache.py)
+
+Mỗi cách chạy trong một process riêng để đo peak RSS sạch:
+
+- `csv`: `pd.read_csv` toàn bộ file rồi `df[features].fillna(0.0).astype(float)`
+  cho từng trainer (anomaly, classifier, RUL)
+- `cache`: `load_training_frame` chỉ đọc các cột ba trainer dùng từ cache
+  (build trước nếu chưa có, không tính vào thời gian), rồi cùng các bước trên
+
+In ra thời gian load, thời gian tới khi có đủ ma trận feature, memory của frame
+và peak RSS tăng thêm so với sau khi import (pandas / pyarrow đã import sẵn).
+
+Usage:
+    python scripts/bench_dataset_cache.py [--csv src/data/EV_Predictive_Maintenance_Dataset_15min.csv]
+                                          [--float-dtype float32] [--repeat 3]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+def rss_mb(field: str) -> float:
+    """VmRSS / VmHWM (peak) của process hiện tại, MB (Linux)."""
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def reset_peak_rss():
+    """Đặt lại VmHWM về RSS hiện tại để peak không tính phần import."""
+    with open("/proc/self/clear_refs", "w") as f:
+        f.write("5")
+
+
+def child(mode: str, csv: Path):
+    from src import anomaly, classifier, rul
+    from src.dataset_cache import load_training_frame
+    import pyarrow.parquet  # noqa: F401  (import thư viện không tính vào peak RSS của cả hai cách)
+
+    reset_peak_rss()
+    base_rss = rss_mb("VmRSS")
+    started = time.perf_counter()
+    columns = anomaly.COLUMNS + classifier.COLUMNS + rul.COLUMNS
+    df = load_training_frame(columns if mode == "cache" else None, csv=csv)
+    load_seconds = time.perf_counter() - started
+    frame_bytes = int(df.memory_usage(deep=True).sum())
+    matrices = [df[[c for c in features if c in df.columns]].fillna(0.0).astype(float)
+                for features in (anomaly.FEATURES, classifier.FEATURES, rul.FEATURES)]
+    total_seconds = time.perf_counter() - started
+    peak_rss = rss_mb("VmHWM")
+    print(json.dumps({
+        "load_seconds": load_seconds,
+        "total_seconds": total_seconds,
+        "frame_mb": frame_bytes / 1e6,
+        "columns": len(df.columns),
+        "rows": len(matrices[0]),
+        "peak_rss_mb": peak_rss - base_rss,
+    }))
+
+
+def run(mode: str, csv: Path, float_dtype: str) -> dict:
+    env = dict(os.environ, DATASET_CACHE_FLOAT_DTYPE=float_dtype,
+               TRAIN_DATASET_CACHE="true" if mode == "cache" else "false")
+    out = subprocess.run([sys.executable, __file__, "--child", mode, "--csv", str(csv)],
+                         env=env, capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--csv", default=None)
+    parser.add_argument("--float-dtype", default=os.getenv("DATASET_CACHE_FLOAT_DTYPE", "float32"),
+                        choices=["float32", "float64"])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--child", choices=["csv", "cache"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    from src.dataset_cache import CSV, prepare_dataset
+
+    csv = Path(args.csv) if args.csv else CSV
+    if args.child:
+        child(args.child, csv)
+        return
+
+    started = time.perf_counter()
+    prepare_dataset(csv, float_dtype=args.float_dtype)
+    print(f"cache ready in {time.perf_counter() - started:.2f}s ({csv.stat().st_size / 1e6:.1f} MB CSV)")
+    print(f"{'path':<6} {'load':>8} {'+features':>10} {'frame':>9} {'peak RSS':>10}  columns")
+    for mode in ("csv", "cache"):
+        runs = [run(mode, csv, args.float_dtype) for _ in range(args.repeat)]
+        best = min(runs, key=lambda r: r["total_seconds"])
+        print(f"{mode:<6} {best['load_seconds']:>7.2f}s {best['total_seconds']:>9.2f}s "
+              f"{best['frame_mb']:>7.1f}MB {min(r['peak_rss_mb'] for r in runs):>8.1f}MB  "
+              f"{best['columns']} ({best['rows']} rows)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark - chi phí build feature vector cho một request /predict
+
+So sánh:
+- before: `_build_row` riêng cho anomaly + classifier, RUL tự build list trong vòng lặp
+- after:  `FeatureLayout.parse` một lần + index view cho từng model
+
+Usage:
+    python scripts/bench_feature_layout.py [--rows 1] [--repeat 20000]
+"""
+
+import argparse
+import sys
+import timeit
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from src.feature_layout import FeatureLayout  # noqa: E402
+
+# Feature lists giống hệt các training scripts (src/anomaly.py, src/classifier.py, src/rul.py)
+IF_FEATURES = [
+    "State_of_Charge", "Battery_Temperature", "Motor_Temperature", "Ambient_Temperature",
+    "Odometer", "Speed", "Current", "Voltage", "Health_Index",
+]
+CLF_FEATURES = [
+    "SoC", "SoH", "Battery_Voltage", "Battery_Current", "Battery_Temperature",
+    "Charge_Cycles", "Motor_Temperature", "Motor_Vibration", "Motor_Torque",
+    "Motor_RPM", "Power_Consumption", "Brake_Pad_Wear", "Brake_Pressure",
+    "Reg_Brake_Efficiency", "Tire_Pressure", "Tire_Temperature", "Suspension_Load",
+    "Ambient_Temperature", "Ambient_Humidity", "Load_Weight", "Driving_Speed",
+    "Distance_Traveled", "Idle_Time", "Route_Roughness", "Component_Health_Score",
+    "Failure_Probability", "TTF"
+]
+LABEL_COL = "Maintenance_Type"
+RUL_FEATURES = CLF_FEATURES + [LABEL_COL]
+
+
+def _build_row(feature_list, input_data):
+    return np.array([[float(input_data.get(f, 0)) for f in feature_list]])
+
+
+def before(rows, pred_code=1):
+    for data in rows:
+        _build_row(IF_FEATURES, data)
+        _build_row(CLF_FEATURES, data)
+        x_rul_list = []
+        for f in RUL_FEATURES:
+            if f == LABEL_COL and LABEL_COL and pred_code is not None:
+                x_rul_list.append(float(pred_code))
+            else:
+                x_rul_list.append(float(data.get(f, 0.0)))
+        np.array([x_rul_list])
+
+
+def after(layout, rows, codes):
+    X = layout.parse(rows).X
+    layout.anomaly(X)
+    layout.classifier(X)
+    layout.rul(X, codes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1, help="Số payload mỗi lần gọi")
+    parser.add_argument("--repeat", type=int, default=20000, help="Số lần lặp")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    columns = list(dict.fromkeys(IF_FEATURES + CLF_FEATURES))
+    rows = [{c: float(v) for c, v in zip(columns, rng.normal(size=len(columns)))} for _ in range(args.rows)]
+    codes = np.ones(args.rows)
+
+    layout = FeatureLayout(IF_FEATURES, CLF_FEATURES, RUL_FEATURES, label_col=LABEL_COL)
+    print(f"Union layout: {layout.width} columns "
+          f"(IF={len(IF_FEATURES)}, CLF={len(CLF_FEATURES)}, RUL={len(RUL_FEATURES)})")
+
+    t_before = min(timeit.repeat(lambda: before(rows), number=args.repeat, repeat=3))
+    t_after = min(timeit.repeat(lambda: after(layout, rows, codes), number=args.repeat, repeat=3))
+
+    per_call_before = t_before / args.repeat * 1e6
+    per_call_after = t_after / args.repeat * 1e6
+    print(f"rows/call={args.rows}  repeat={args.repeat}")
+    print(f"before: {per_call_before:8.2f} us/call  ({per_call_before / args.rows:6.2f} us/row)")
+    print(f"after:  {per_call_after:8.2f} us/call  ({per_call_after / args.rows:6.2f} us/row)")
+    print(f"speedup: {t_before / t_after:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
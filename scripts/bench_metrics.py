@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Benchmark - chi phí Prometheus metrics mỗi request: in-process vs multiprocess (src/metrics.py)
+
+Mỗi mode chạy trong một interpreter riêng (prometheus_client chọn kiểu value
+lúc import): đo ns/op cho `Counter.inc`, `Histogram.observe`,
+`Counter.labels(...).inc` và tổ hợp middleware (counter + histogram) như
+`prometheus_middleware` trong src/inference_server.py. Multiprocess mode còn đo
+thời gian render `/metrics` khi có `--workers` process đã ghi metrics.
+
+Exit 1 nếu tổ hợp middleware vượt `--max-overhead-us`.
+
+Usage:
+    python scripts/bench_metrics.py [--iterations 200000] [--workers 4] [--max-overhead-us 5]
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+PROBE = """
+import json, os, sys, time
+sys.path.insert(0, {root!r})
+if {multiproc_dir!r}:
+    from src.metrics import prepare_multiprocess_dir
+    prepare_multiprocess_dir({multiproc_dir!r})
+from prometheus_client import Counter, Histogram
+
+requests = Counter("bench_requests_total", "bench")
+latency = Histogram("bench_request_latency_seconds", "bench")
+by_route = Counter("bench_requests_by_route_total", "bench", ["route", "status"])
+
+def per_op(fn, n):
+    start = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - start) / n * 1e9
+
+def middleware():
+    requests.inc()
+    latency.observe(0.0012)
+
+n = {iterations}
+result = {{
+    "Counter.inc": per_op(requests.inc, n),
+    "Histogram.observe": per_op(lambda: latency.observe(0.0012), n),
+    "Counter.labels().inc": per_op(lambda: by_route.labels("/predict", "200").inc(), n),
+    "middleware (inc + observe)": per_op(middleware, n),
+}}
+
+if {multiproc_dir!r}:
+    for _ in range({workers}):
+        pid = os.fork()
+        if pid == 0:
+            for _ in range(1000):
+                middleware()
+                by_route.labels("/predict", "200").inc()
+            os._exit(0)
+        os.waitpid(pid, 0)
+    from src.metrics import render_latest
+    render_latest()
+    start = time.perf_counter()
+    for _ in range(20):
+        body, _ = render_latest()
+    result["render /metrics (ms)"] = (time.perf_counter() - start) / 20 * 1e3
+    result["render /metrics (bytes)"] = len(body)
+
+print(json.dumps(result))
+"""
+
+
+def run_mode(multiproc_dir: str, iterations: int, workers: int) -> dict:
+    code = PROBE.format(root=str(REPO_ROOT), multiproc_dir=multiproc_dir, iterations=iterations, workers=workers)
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=200000)
+    parser.add_argument("--workers", type=int, default=4, help="Số process ghi metrics trước khi đo render")
+    parser.add_argument("--max-overhead-us", type=float, default=5.0)
+    args = parser.parse_args()
+
+    in_process = run_mode("", args.iterations, args.workers)
+    with tempfile.TemporaryDirectory(prefix="bench-prometheus-") as tmp:
+        multiprocess = run_mode(tmp, args.iterations, args.workers)
+
+    print(f"{'operation':<28} {'in-process':>12} {'multiprocess':>14}")
+    print("-" * 56)
+    for op, value in in_process.items():
+        print(f"{op:<28} {value:>10.0f}ns {multiprocess[op]:>12.0f}ns")
+    print(f"{'render /metrics':<28} {'':>12} {multiprocess['render /metrics (ms)']:>12.2f}ms "
+          f"({args.workers + 1} processes, {multiprocess['render /metrics (bytes)']} bytes)")
+
+    overhead_us = multiprocess["middleware (inc + observe)"] / 1000
+    ok = overhead_us <= args.max_overhead_us
+    print(f"{'✅' if ok else '❌'} multiprocess middleware overhead {overhead_us:.2f}us/request "
+          f"(budget {args.max_overhead_us:g}us)")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Benchmark - pre-fork multi-worker serving (src/prefork.py)
+
+Với mỗi số workers: khởi động `python -m src.prefork`, chờ `/ready`, đo RSS /
+PSS / shared memory của master và từng worker (models được chia sẻ
+copy-on-write), rồi bắn tải từ nhiều client processes (HTTP keep-alive) trong
+một khoảng thời gian cố định. In throughput từng worker (theo header
+`X-Worker-Id`) và tổng, cùng latency p50/p99.
+
+Payload: dòng trong `--rows` (JSON list các dict telemetry), hoặc dòng synthetic
+sinh từ feature lists + scaler trong `--models-dir`.
+
+Chạy từ thư mục có `models/` (hoặc với env MLflow Registry như server thật).
+
+Usage:
+    python scripts/bench_prefork.py [--workers 1,2,4] [--clients 8] [--duration 10]
+                                    [--endpoint predict|batch] [--batch-size 32] [--rows rows.json]
+"""
+
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import signal
+import subprocess
+import sys
+import time
+import urllib.request
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+
+def synthetic_rows(models_dir: Path, n_rows: int = 256, seed: int = 0):
+    """Dòng telemetry quanh mean của scaler (anomaly + classifier features)."""
+    import joblib
+
+    rng = np.random.default_rng(seed)
+    columns = {}
+    for features_file, scaler_file in (("anomaly/isofeat.joblib", "anomaly/scaler.joblib"),
+                                       ("classifier/features.joblib", "classifier/scaler.joblib")):
+        features = list(joblib.load(models_dir / features_file))
+        scaler = joblib.load(models_dir / scaler_file)
+        for i, name in enumerate(features):
+            columns.setdefault(name, (float(scaler.mean_[i]), float(scaler.scale_[i])))
+    return [
+        {name: float(rng.normal(mean, scale)) for name, (mean, scale) in columns.items()}
+        for _ in range(n_rows)
+    ]
+
+
+def memory_mb(pid: int):
+    """(rss, pss, shared) MB từ /proc/<pid>/smaps_rollup."""
+    values = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[0].endswith(":"):
+                    values[parts[0][:-1]] = int(parts[1]) / 1024
+    except OSError:
+        return None
+    return values.get("Rss", 0.0), values.get("Pss", 0.0), values.get("Shared_Clean", 0.0) + values.get("Shared_Dirty", 0.0)
+
+
+def children(pid: int):
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(p) for p in f.read().split()]
+    except OSError:
+        return []
+
+
+def wait_ready(port: int, workers: int, master: subprocess.Popen, timeout: float = 180.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if master.poll() is not None:
+            raise RuntimeError(f"src.prefork exited with {master.returncode}")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/ready", timeout=2) as r:
+                if r.status == 200 and len(children(master.pid)) >= workers:
+                    return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise TimeoutError("server not ready")
+
+
+def client(args):
+    """Một client process: gửi request liên tục tới hết duration; trả về (latencies, workers, errors)."""
+    port, path, bodies, duration = args
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    latencies, per_worker, errors = [], Counter(), 0
+    deadline = time.perf_counter() + duration
+    i = 0
+    while time.perf_counter() < deadline:
+        body = bodies[i % len(bodies)]
+        i += 1
+        start = time.perf_counter()
+        try:
+            conn.request("POST", path, body=body, headers={"Content-Type": "application/json"})
+            response = conn.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            conn.close()
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+            continue
+        latencies.append(time.perf_counter() - start)
+        if response.status == 200:
+            per_worker[response.getheader("x-worker-id", "?")] += 1
+        else:
+            errors += 1
+    conn.close()
+    return latencies, per_worker, errors
+
+
+def run(workers: int, args, bodies, path: str, rows_per_request: int):
+    port = args.port
+    env = dict(os.environ, PYTHONPATH=str(REPO_ROOT), UVICORN_LOG_LEVEL="warning")
+    master = subprocess.Popen(
+        [sys.executable, "-m", "src.prefork", "--workers", str(workers), "--host", "127.0.0.1", "--port", str(port)],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        wait_ready(port, workers, master)
+        memory = {"master": memory_mb(master.pid)}
+        memory.update({f"worker pid {pid}": memory_mb(pid) for pid in children(master.pid)})
+
+        with multiprocessing.Pool(args.clients) as pool:
+            results = pool.map(client, [(port, path, bodies, args.duration)] * args.clients)
+    finally:
+        master.send_signal(signal.SIGTERM)
+        try:
+            master.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            master.kill()
+
+    latencies = np.array([lat for r in results for lat in r[0]])
+    per_worker = sum((r[1] for r in results), Counter())
+    errors = sum(r[2] for r in results)
+    total = sum(per_worker.values())
+
+    print(f"\n=== {workers} worker(s), {args.clients} clients, {args.duration:g}s, "
+          f"{rows_per_request} row(s)/request ===")
+    print(f"{'process':<18} {'rss':>8} {'pss':>8} {'shared':>8}")
+    for name, values in memory.items():
+        if values:
+            print(f"{name:<18} {values[0]:>6.0f}MB {values[1]:>6.0f}MB {values[2]:>6.0f}MB")
+    for worker_id, count in sorted(per_worker.items()):
+        print(f"worker {worker_id:<4} {count / args.duration:>10.1f} req/s")
+    print(f"aggregate   {total / args.duration:>10.1f} req/s  {total * rows_per_request / args.duration:>10.1f} rows/s  "
+          f"errors={errors}")
+    if len(latencies):
+        print(f"latency     p50={np.percentile(latencies, 50) * 1000:.2f}ms  "
+              f"p99={np.percentile(latencies, 99) * 1000:.2f}ms")
+    return total / args.duration
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", default="1,2,4")
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--endpoint", choices=["predict", "batch"], default="predict")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--rows", default=None, help="JSON list các dòng telemetry")
+    parser.add_argument("--models-dir", default="models")
+    parser.add_argument("--port", type=int, default=8790)
+    args = parser.parse_args()
+
+    rows = json.load(open(args.rows)) if args.rows else synthetic_rows(Path(args.models_dir))
+    if args.endpoint == "predict":
+        path, rows_per_request = "/predict", 1
+        bodies = [json.dumps({"data": row}) for row in rows]
+    else:
+        path, rows_per_request = "/predict/batch", args.batch_size
+        bodies = [
+            json.dumps({"rows": [rows[(i + j) % len(rows)] for j in range(args.batch_size)]})
+            for i in range(0, len(rows), args.batch_size)
+        ]
+
+    throughput = {}
+    for workers in [int(w) for w in args.workers.split(",") if w.strip()]:
+        throughput[workers] = run(workers, args, bodies, path, rows_per_request)
+
+    base = next(iter(throughput.values()))
+    print("\nworkers  req/s      speedup")
+    for workers, value in throughput.items():
+        print(f"{workers:>7}  {value:>9.1f}  {value / base:>6.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Benchmark - MLflow pyfunc wrapper vs native flavor loader (src/mlflow_utils.py)
+
+Với mỗi model (anomaly/sklearn, classifier/xgboost, rul/lightgbm), load cùng một
+MLflow model hai cách: `mlflow.pyfunc.load_model` và `load_native_model`, rồi đo
+latency predict cho batch size 1, 32, 1024 và kiểm tra prediction giống nhau.
+
+Mặc định model được lấy từ `models/*.joblib` và lưu tạm thành MLflow model theo
+flavor trong MODEL_FLAVORS; `--stage` thì load thẳng từ MLflow Model Registry.
+
+Usage:
+    python scripts/bench_pyfunc_vs_native.py [--models-dir models] [--stage Production] [--batch-sizes 1,32,1024]
+"""
+
+import argparse
+import sys
+import tempfile
+import time
+import warnings
+from pathlib import Path
+
+import joblib
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from src.mlflow_utils import MODEL_FLAVORS, MODEL_NAMES, load_native_model  # noqa: E402
+
+MODELS = {
+    "anomaly": "anomaly/isolation_forest.joblib",
+    "classifier": "classifier/classifier.joblib",
+    "rul": "rul/lgbm_rul.joblib",
+}
+
+
+def time_per_call(fn, X, min_time=0.5):
+    fn(X)  # warm-up
+    calls = 0
+    start = time.perf_counter()
+    while True:
+        fn(X)
+        calls += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time and calls >= 3:
+            return elapsed / calls
+
+
+def save_local(model, flavor: str, path: Path) -> str:
+    import mlflow
+
+    if flavor == "sklearn":
+        import mlflow.sklearn
+        mlflow.sklearn.save_model(
+            model, str(path), serialization_format=mlflow.sklearn.SERIALIZATION_FORMAT_CLOUDPICKLE
+        )
+    elif flavor == "xgboost":
+        import mlflow.xgboost
+        mlflow.xgboost.save_model(model, str(path))
+    else:
+        import mlflow.lightgbm
+        mlflow.lightgbm.save_model(model, str(path))
+    return str(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--models-dir", default="models")
+    parser.add_argument("--stage", default=None, help="Load từ MLflow Registry thay vì models/")
+    parser.add_argument("--batch-sizes", default="1,32,1024")
+    args = parser.parse_args()
+    batch_sizes = [int(b) for b in args.batch_sizes.split(",")]
+
+    warnings.filterwarnings("ignore")
+    import mlflow.pyfunc
+
+    tmp = tempfile.TemporaryDirectory()
+    print(f"{'model':<11} {'rows':>6} {'pyfunc':>12} {'native':>12} {'speedup':>8}")
+    print("-" * 53)
+    for name, rel_path in MODELS.items():
+        flavor = MODEL_FLAVORS[name]
+        if args.stage:
+            uri = f"models:/{MODEL_NAMES[name]}/{args.stage}"
+        else:
+            path = Path(args.models_dir) / rel_path
+            if not path.exists():
+                print(f"{name:<11} missing {path}")
+                continue
+            uri = save_local(joblib.load(path), flavor, Path(tmp.name) / name)
+
+        start = time.perf_counter()
+        pyfunc_model = mlflow.pyfunc.load_model(uri)
+        t_load_pyfunc = time.perf_counter() - start
+        start = time.perf_counter()
+        native_model = load_native_model(uri, flavor=flavor)
+        t_load_native = time.perf_counter() - start
+
+        n_features = int(getattr(native_model, "n_features_in_", 0))
+        X = np.random.default_rng(0).normal(size=(max(batch_sizes), n_features))
+        same = np.array_equal(
+            np.asarray(pyfunc_model.predict(X)).reshape(-1), np.asarray(native_model.predict(X)).reshape(-1)
+        )
+
+        for n in batch_sizes:
+            t_pyfunc = time_per_call(pyfunc_model.predict, X[:n])
+            t_native = time_per_call(native_model.predict, X[:n])
+            print(f"{name:<11} {n:>6} {t_pyfunc * 1e6:>10.1f}us {t_native * 1e6:>10.1f}us "
+                  f"{t_pyfunc / t_native:>7.2f}x")
+        print(f"{name:<11} flavor={flavor} ({type(native_model).__name__}) "
+              f"load pyfunc={t_load_pyfunc:.2f}s native={t_load_native:.2f}s same_predictions={same}")
+        print("-" * 53)
+    tmp.cleanup()
+
+
+if __name__ == "__main__":
+    main()
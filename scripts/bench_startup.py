@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Benchmark - cold start của inference server (import time + RSS)
+
+1. Mỗi module nặng được import trong một interpreter riêng: thời gian import
+   và RSS tăng thêm so với interpreter rỗng.
+2. Cold start của `src.inference_server`: import module (không được load model
+   hay import mlflow/confluent_kafka/sklearn/xgboost/lightgbm), rồi chạy startup
+   hooks (Kafka + load models) như uvicorn; in thời gian, RSS và các module nặng
+   đã bị import ở mỗi bước.
+3. `--importtime N`: N module tốn nhiều thời gian nhất theo `python -X importtime`.
+
+`--max-import-ms` / `--max-rss-mb` đặt ngưỡng cho bước import server; vượt
+ngưỡng hoặc có module nặng bị import sớm thì exit 1 (dùng trong CI để bắt regression).
+
+Usage:
+    python scripts/bench_startup.py [--modules numpy,mlflow,...] [--repeat 3] [--importtime 15]
+                                    [--max-import-ms 1500] [--max-rss-mb 200]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+DEFAULT_MODULES = [
+    "numpy", "pydantic", "fastapi", "prometheus_client", "yaml", "joblib",
+    "sklearn.ensemble", "xgboost", "lightgbm", "onnxruntime", "confluent_kafka",
+    "mlflow", "src.mlflow_utils", "src.inference_server",
+]
+
+# Không được import khi chỉ `import src.inference_server`
+LAZY_MODULES = ["mlflow", "confluent_kafka", "joblib", "sklearn", "xgboost", "lightgbm", "onnxruntime"]
+
+_RSS = """
+def _rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+"""
+
+IMPORT_PROBE = """
+import importlib, json, os, sys, time
+sys.path.insert(0, {root!r})
+""" + _RSS + """
+rss0 = _rss_mb()
+t0 = time.perf_counter()
+importlib.import_module({module!r})
+print(json.dumps({{"ms": (time.perf_counter() - t0) * 1000, "rss_mb": _rss_mb() - rss0}}))
+"""
+
+COLD_START_PROBE = """
+import asyncio, json, os, sys, time
+sys.path.insert(0, {root!r})
+""" + _RSS + """
+def _loaded():
+    return sorted(m for m in {lazy!r} if m in sys.modules)
+
+def _run_hooks(hooks):  # như uvicorn gọi on_event("startup"/"shutdown")
+    for hook in hooks:
+        result = hook()
+        if asyncio.iscoroutine(result):
+            asyncio.run(result)
+
+rss0 = _rss_mb()
+t0 = time.perf_counter()
+import src.inference_server as server
+t1 = time.perf_counter()
+rss1, loaded1 = _rss_mb(), _loaded()
+_run_hooks(server.app.router.on_startup)
+while server.model_store.current is None and server.model_store.reloading:  # FAST_START: load ở background
+    time.sleep(0.01)
+t2 = time.perf_counter()
+bundle = server.model_store.current
+print(json.dumps({{
+    "import_ms": (t1 - t0) * 1000, "import_rss_mb": rss1 - rss0, "import_loaded": loaded1,
+    "startup_ms": (t2 - t1) * 1000, "total_rss_mb": _rss_mb() - rss0, "startup_loaded": _loaded(),
+    "ready": bundle is not None and bundle.anomaly_ready,
+    "timings": bundle.timings if bundle is not None else None,
+}}))
+_run_hooks(server.app.router.on_shutdown)
+"""
+
+
+def run_probe(code: str) -> dict:
+    result = subprocess.run(
+        [sys.executable, "-c", code], cwd=os.getcwd(), capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "failed")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def bench_modules(modules, repeat: int):
+    print(f"{'module':<24} {'import':>10} {'rss':>9}")
+    print("-" * 45)
+    for module in modules:
+        try:
+            runs = [run_probe(IMPORT_PROBE.format(root=str(REPO_ROOT), module=module)) for _ in range(repeat)]
+        except RuntimeError as e:
+            print(f"{module:<24} {'n/a':>10} {'':>9}  ({e})")
+            continue
+        best = min(runs, key=lambda r: r["ms"])
+        print(f"{module:<24} {best['ms']:>8.0f}ms {best['rss_mb']:>7.1f}MB")
+
+
+def bench_importtime(top: int):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c",
+         f"import sys; sys.path.insert(0, {str(REPO_ROOT)!r}); import src.inference_server"],
+        cwd=os.getcwd(), capture_output=True, text=True
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = [part.strip() for part in line[len("import time:"):].split("|")]
+        rows.append((int(cumulative_us), int(self_us), name))
+    print(f"\nTop {top} imports of src.inference_server (python -X importtime, cumulative)")
+    print(f"{'module':<40} {'cumulative':>11} {'self':>9}")
+    print("-" * 62)
+    for cumulative_us, self_us, name in sorted(rows, reverse=True)[:top]:
+        print(f"{name:<40} {cumulative_us / 1000:>9.1f}ms {self_us / 1000:>7.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modules", default=",".join(DEFAULT_MODULES))
+    parser.add_argument("--repeat", type=int, default=3, help="Số lần đo mỗi module (lấy min)")
+    parser.add_argument("--importtime", type=int, default=0, help="In N import chậm nhất (0 = tắt)")
+    parser.add_argument("--max-import-ms", type=float, default=None)
+    parser.add_argument("--max-rss-mb", type=float, default=None)
+    args = parser.parse_args()
+
+    bench_modules([m.strip() for m in args.modules.split(",") if m.strip()], args.repeat)
+    if args.importtime:
+        bench_importtime(args.importtime)
+
+    print("\nCold start: src.inference_server")
+    cold = run_probe(COLD_START_PROBE.format(root=str(REPO_ROOT), lazy=LAZY_MODULES))
+    print(f"  import   {cold['import_ms']:>8.0f}ms  rss +{cold['import_rss_mb']:.1f}MB  "
+          f"heavy modules: {', '.join(cold['import_loaded']) or 'none'}")
+    print(f"  startup  {cold['startup_ms']:>8.0f}ms  rss +{cold['total_rss_mb']:.1f}MB  "
+          f"heavy modules: {', '.join(cold['startup_loaded']) or 'none'}  ready={cold['ready']}")
+    if cold["timings"]:
+        print("  bundle   " + "  ".join(f"{k}={v:.3f}s" for k, v in cold["timings"].items()))
+
+    ok = not cold["import_loaded"]
+    if not ok:
+        print(f"❌ Imported eagerly: {', '.join(cold['import_loaded'])}")
+    if args.max_import_ms is not None and cold["import_ms"] > args.max_import_ms:
+        print(f"❌ Import {cold['import_ms']:.0f}ms > budget {args.max_import_ms:.0f}ms")
+        ok = False
+    if args.max_rss_mb is not None and cold["import_rss_mb"] > args.max_rss_mb:
+        print(f"❌ Import RSS {cold['import_rss_mb']:.1f}MB > budget {args.max_rss_mb:.0f}MB")
+        ok = False
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
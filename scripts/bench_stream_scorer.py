@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Benchmark - streaming scorer (src/stream_scorer.py) trên broker in-process
+
+Không cần Kafka: dùng src/inmemory_kafka.py cho cả topic telemetry lẫn topic
+alert. Publish `--records` dòng telemetry (key theo xe), chạy StreamScorer tới
+khi mọi offset được commit, rồi in records/s, lag end-to-end p50/p99 và kiểm tra:
+
+- mọi offset đã commit đúng bằng end offset của topic
+- alert sinh ra giống hệt khi score cùng các dòng qua `_score_batch` (như
+  `/predict/batch`), kể cả khi `--failure-rate` > 0 làm batch bị score lại
+  (at-least-once: so sánh trên tập alert duy nhất)
+
+Chạy từ thư mục có `models/` (hoặc với env MLflow Registry như server thật).
+
+Usage:
+    python scripts/bench_stream_scorer.py [--records 20000] [--partitions 4] [--batch-size 500]
+                                          [--max-wait-ms 50] [--failure-rate 0.001] [--rows rows.json]
+"""
+
+import argparse
+import json
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import src.inference_server as server  # noqa: E402
+from src.alert_schema import decode_alert  # noqa: E402
+from src.inmemory_kafka import InMemoryBroker, InMemoryConsumer, InMemoryProducer  # noqa: E402
+from src.stream_scorer import StreamScorer  # noqa: E402
+
+TELEMETRY_TOPIC = "raw_sensor_data"
+
+
+def synthetic_rows(bundle, n_rows: int = 256, seed: int = 0):
+    """Dòng telemetry quanh mean của scaler (anomaly + classifier features)."""
+    rng = np.random.default_rng(seed)
+    columns = {}
+    for features, scaler in ((bundle.if_features, bundle.if_scaler), (bundle.clf_features, bundle.clf_scaler)):
+        if features is None or scaler is None:
+            continue
+        for i, name in enumerate(features):
+            columns.setdefault(name, (float(scaler.mean_[i]), float(scaler.scale_[i])))
+    return [{name: float(rng.normal(mean, scale)) for name, (mean, scale) in columns.items()}
+            for _ in range(n_rows)]
+
+
+def alert_signature(value: bytes):
+    event = decode_alert(value)
+    return json.dumps([event["input"], event["prediction"]], sort_keys=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=20000)
+    parser.add_argument("--partitions", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--max-wait-ms", type=float, default=50.0)
+    parser.add_argument("--vehicles", type=int, default=100)
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Tỉ lệ alert có delivery lỗi (giả lập)")
+    parser.add_argument("--rows", default=None, help="JSON list các dòng telemetry")
+    args = parser.parse_args()
+
+    server.reload_models()
+    bundle = server.model_store.current
+    if bundle is None or not bundle.anomaly_ready:
+        sys.exit("❌ Anomaly model/scaler/features missing (run from a directory with models/)")
+
+    base_rows = json.load(open(args.rows)) if args.rows else synthetic_rows(bundle)
+    rows = [dict(base_rows[i % len(base_rows)], Vehicle_ID=f"EV{i % args.vehicles:05d}") for i in range(args.records)]
+
+    # Alert tham chiếu: cùng các dòng qua _score_batch (như /predict/batch), gửi lên một broker riêng
+    reference = InMemoryBroker(partitions=args.partitions)
+    server.init_kafka_producer(lambda: InMemoryProducer(reference))
+    for start in range(0, len(rows), args.batch_size):
+        server._score_batch(rows[start:start + args.batch_size])
+    server.kafka_producer.stop()
+    expected = Counter(alert_signature(m.value()) for m in reference.messages(server.KAFKA_TOPIC))
+
+    broker = InMemoryBroker(partitions=args.partitions)
+    server.init_kafka_producer(lambda: InMemoryProducer(broker, failure_rate=args.failure_rate))
+    for row in rows:
+        broker.append(TELEMETRY_TOPIC, json.dumps({"data": row}), key=row["Vehicle_ID"])
+
+    consumer = InMemoryConsumer(broker, group_id="bench-stream-scorer")
+    consumer.subscribe([TELEMETRY_TOPIC])
+    scorer = StreamScorer(
+        consumer, server._score_batch, flush_alerts=server.kafka_producer.flush,
+        batch_size=args.batch_size, max_wait_ms=args.max_wait_ms, retry_backoff=0.0
+    )
+    lags, batches = [], []
+
+    def on_batch(result):
+        lags.extend(result.lags)
+        batches.append(result)
+        if sum(b.records for b in batches) >= args.records:
+            scorer.stop()
+
+    started = time.perf_counter()
+    thread = threading.Thread(target=scorer.run, kwargs={"on_batch": on_batch})
+    thread.start()
+    thread.join()
+    elapsed = time.perf_counter() - started
+    server.kafka_producer.stop()
+
+    end_offsets = broker.end_offsets(TELEMETRY_TOPIC)
+    committed = {p: offset for (_, p), offset in consumer.committed_offsets().items()}
+    produced = Counter(alert_signature(m.value()) for m in broker.messages(server.KAFKA_TOPIC))
+
+    lags = np.array(lags) if lags else np.zeros(1)
+    print(f"{args.records} records, {args.partitions} partitions, batch {args.batch_size}, "
+          f"{len(batches)} committed batches, failure rate {args.failure_rate:g}")
+    print(f"throughput  {args.records / elapsed:>10.1f} records/s ({elapsed:.2f}s)")
+    print(f"batch       mean {np.mean([b.seconds for b in batches]) * 1000:.2f}ms "
+          f"(score + deliver alerts + commit)")
+    print(f"lag         p50={np.percentile(lags, 50):.3f}s  p99={np.percentile(lags, 99):.3f}s  "
+          f"(records published up front: lag includes backlog)")
+    offsets_ok = committed == end_offsets
+    alerts_ok = set(produced) == set(expected) and all(produced[k] >= v for k, v in expected.items())
+    print(f"{'✅' if offsets_ok else '❌'} committed offsets {committed} / end offsets {end_offsets}")
+    print(f"{'✅' if alerts_ok else '❌'} alerts: {sum(produced.values())} produced "
+          f"({sum(produced.values()) - sum(expected.values())} duplicates from retries), "
+          f"{sum(expected.values())} expected from _score_batch")
+    sys.exit(0 if offsets_ok and alerts_ok else 1)
+
+
+if __name__ == "__main__":
+    main()
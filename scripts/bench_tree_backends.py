@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Benchmark - native vs compiled (src/tree_compiler.py) vs ONNX Runtime (src/onnx_backend.py)
+
+Load các model trong `models/` (IsolationForest, XGBClassifier, LGBMRegressor),
+compile sang NumPy node arrays và đo latency predict cho batch size 1, 32, 1024.
+Input được sinh quanh các split threshold nên đi qua đủ các nhánh của cây.
+Cột onnx chỉ có khi đã export `.onnx` và cài onnxruntime; graph ONNX của
+anomaly/classifier gồm cả scaler nên số đo bao gồm bước scale.
+
+Usage:
+    python scripts/bench_tree_backends.py [--models-dir models] [--batch-sizes 1,32,1024]
+"""
+
+import argparse
+import sys
+import time
+import warnings
+from pathlib import Path
+
+import joblib
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from src.tree_compiler import compile_model, verify_compiled  # noqa: E402
+from src.onnx_backend import ONNX_FILES, load_onnx_predictor  # noqa: E402
+
+MODELS = {
+    "anomaly": "anomaly/isolation_forest.joblib",
+    "classifier": "classifier/classifier.joblib",
+    "rul": "rul/lgbm_rul.joblib",
+}
+
+
+def time_per_call(fn, X, min_time=0.5):
+    fn(X)  # warm-up
+    calls = 0
+    start = time.perf_counter()
+    while True:
+        fn(X)
+        calls += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time and calls >= 3:
+            return elapsed / calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--models-dir", default="models")
+    parser.add_argument("--batch-sizes", default="1,32,1024")
+    args = parser.parse_args()
+    batch_sizes = [int(b) for b in args.batch_sizes.split(",")]
+
+    warnings.filterwarnings("ignore")
+
+    print(f"{'model':<11} {'rows':>6} {'native':>12} {'compiled':>12} {'speedup':>8} {'onnx':>12}")
+    print("-" * 66)
+    for name, rel_path in MODELS.items():
+        path = Path(args.models_dir) / rel_path
+        if not path.exists():
+            print(f"{name:<11} missing {path}")
+            continue
+        model = joblib.load(path)
+        try:
+            compiled = compile_model(model)
+        except NotImplementedError as e:
+            print(f"{name:<11} not compilable: {e}")
+            continue
+        parity = "ok" if verify_compiled(compiled) else "MISMATCH"
+        onnx_path = Path(args.models_dir) / ONNX_FILES[name]
+        onnx = load_onnx_predictor(onnx_path, name) if onnx_path.exists() else None
+
+        X = compiled.trees.probe(max(batch_sizes), seed=1)
+        for n in batch_sizes:
+            t_native = time_per_call(model.predict, X[:n])
+            t_compiled = time_per_call(compiled._predict, X[:n])
+            t_onnx = f"{time_per_call(onnx.predict, X[:n]) * 1e6:>10.1f}us" if onnx else f"{'-':>12}"
+            print(f"{name:<11} {n:>6} {t_native * 1e6:>10.1f}us {t_compiled * 1e6:>10.1f}us "
+                  f"{t_native / t_compiled:>7.2f}x {t_onnx}")
+        print(f"{name:<11} trees={compiled.trees.n_trees} max_depth={compiled.trees.max_depth} parity={parity}")
+        print("-" * 66)
+
+
+if __name__ == "__main__":
+    main()
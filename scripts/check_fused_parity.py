@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Parity check - fused scaler+model pipeline vs đường cũ (scaler.transform -> predict)
+
+Load artifacts trong `models/` (anomaly + classifier), sinh các dòng quanh phân
+phối training và kiểm tra input đã scale lẫn prediction giống nhau bit-by-bit,
+cả khi gọi từng dòng (như /predict) và theo batch. Exit code 1 nếu có lệch.
+
+Usage:
+    python scripts/check_fused_parity.py [--models-dir models] [--rows 10000]
+"""
+
+import argparse
+import sys
+import time
+import warnings
+from pathlib import Path
+
+import joblib
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from src.feature_layout import FeatureLayout  # noqa: E402
+from src.fused_pipeline import FusedPipeline  # noqa: E402
+
+
+def load_or_none(path: Path):
+    return joblib.load(path) if path.exists() else None
+
+
+def check_stage(name, scaler, model, layout, index, n_rows, seed=42):
+    pipeline = FusedPipeline(scaler, model, index, name=name)
+    if not pipeline.fused:
+        print(f"❌ {name}: scaler is not a fitted StandardScaler, cannot fuse")
+        return False
+
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(n_rows, layout.width))
+    X[:, index] = X[:, index] * pipeline.scale * 3 + pipeline.mean
+
+    expected_X = scaler.transform(X[:, index])
+    expected = np.asarray(model.predict(expected_X)).reshape(-1)
+
+    ok_batch = (
+        np.array_equal(pipeline.transform(X), expected_X)
+        and np.array_equal(pipeline.predict(X), expected)
+    )
+
+    n_single = min(n_rows, 1000)
+    t0 = time.perf_counter()
+    two_step = [model.predict(scaler.transform(X[i:i + 1, index]))[0] for i in range(n_single)]
+    t_two_step = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    fused = [pipeline.predict(X[i:i + 1])[0] for i in range(n_single)]
+    t_fused = time.perf_counter() - t0
+    ok_single = np.array_equal(np.asarray(two_step), np.asarray(fused))
+
+    status = "✅" if ok_batch and ok_single else "❌"
+    print(f"{status} {name}: batch parity={ok_batch} ({n_rows} rows), "
+          f"single-row parity={ok_single} ({n_single} rows)")
+    print(f"   single-row latency: two-step {t_two_step / n_single * 1e6:.1f} us, "
+          f"fused {t_fused / n_single * 1e6:.1f} us")
+    return ok_batch and ok_single
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--models-dir", default="models")
+    parser.add_argument("--rows", type=int, default=10000)
+    args = parser.parse_args()
+
+    # StandardScaler fit trên DataFrame sẽ warn về feature names ở mỗi transform
+    warnings.filterwarnings("ignore", message="X does not have valid feature names")
+
+    model_dir = Path(args.models_dir)
+    isof = load_or_none(model_dir / "anomaly" / "isolation_forest.joblib")
+    if_scaler = load_or_none(model_dir / "anomaly" / "scaler.joblib")
+    if_features = load_or_none(model_dir / "anomaly" / "isofeat.joblib")
+    clf_model = load_or_none(model_dir / "classifier" / "classifier.joblib")
+    clf_scaler = load_or_none(model_dir / "classifier" / "scaler.joblib")
+    clf_features = load_or_none(model_dir / "classifier" / "features.joblib")
+    clf_label_col = load_or_none(model_dir / "classifier" / "label_col.joblib")
+    rul_features = load_or_none(model_dir / "rul" / "rul_features.joblib")
+
+    layout = FeatureLayout(if_features, clf_features, rul_features, label_col=clf_label_col)
+
+    results = []
+    if isof is not None and if_scaler is not None and if_features:
+        results.append(check_stage("anomaly", if_scaler, isof, layout, layout.if_index, args.rows))
+    else:
+        print("⚠️ Skipping anomaly: artifacts missing")
+    if clf_model is not None and clf_scaler is not None and clf_features:
+        results.append(check_stage("classifier", clf_scaler, clf_model, layout, layout.clf_index, args.rows))
+    else:
+        print("⚠️ Skipping classifier: artifacts missing")
+
+    if not results:
+        print("❌ No models found in", model_dir)
+        sys.exit(1)
+    sys.exit(0 if all(results) else 1)
+
+
+if __name__ == "__main__":
+    main()
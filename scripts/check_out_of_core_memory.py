@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Check - training out-of-core chạy dưới trần memory (src/out_of_core.py)
+
+Sinh CSV giả lập với các cột mà ba trainers dùng (`--rows` dòng, ghi theo
+chunk), rồi trong một process riêng với `TRAIN_MEMORY_LIMIT_MB=--memory-limit-mb`:
+build cache, `should_run_out_of_core` (phải chọn out-of-core) và
+`run_out_of_core` (anomaly -> classifier -> RUL). Models được ghi vào thư mục tạm.
+
+Peak RSS của process con (VmHWM, tính cả import pandas / sklearn / XGBoost /
+LightGBM / MLflow) phải không vượt trần. Script in kèm kích thước dataset: CSV,
+frame float64 của các cột dùng và ước lượng memory mà chế độ in-memory cần.
+Exit code 1 nếu vượt trần, không chọn out-of-core hoặc thiếu artifact.
+
+MLflow log vào `MLFLOW_TRACKING_URI` nếu có, nếu không thì vào file store trong thư mục tạm.
+
+Usage:
+    python scripts/check_out_of_core_memory.py [--rows 4000000] [--memory-limit-mb 1024] [--keep]
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+ARTIFACTS = ["anomaly/isolation_forest.joblib", "classifier/classifier.joblib", "rul/lgbm_rul.joblib"]
+
+
+def write_synthetic_csv(path: Path, rows: int, chunk_rows: int = 200_000, seed: int = 0):
+    """CSV có schema như dataset thật (feature số, Maintenance_Type có giá trị thiếu, RUL)."""
+    from src import anomaly, classifier
+
+    rng = np.random.default_rng(seed)
+    features = list(dict.fromkeys(anomaly.FEATURES + classifier.FEATURES))
+    types = np.array(["Battery", "Motor", "Brake", None], dtype=object)
+    for start in range(0, rows, chunk_rows):
+        n = min(chunk_rows, rows - start)
+        X = rng.normal(50, 10, size=(n, len(features)))
+        df = pd.DataFrame(X, columns=features)
+        df.insert(0, "Vehicle_ID", [f"EV{i % 500:05d}" for i in range(start, start + n)])
+        df.insert(0, "Timestamp", pd.date_range("2024-01-01", periods=n, freq="15min").astype(str))
+        df["Maintenance_Type"] = types[rng.choice(4, size=n, p=[0.15, 0.1, 0.15, 0.6])]
+        df["RUL"] = np.clip(1000 - 8 * X[:, 0] + 4 * X[:, 1] + rng.normal(0, 50, n), 0, None)
+        df.to_csv(path, mode="w" if start == 0 else "a", header=start == 0, index=False, float_format="%.6g")
+
+
+def child(csv: Path, work_dir: Path):
+    from src.dataset_cache import prepare_dataset
+    from src.out_of_core import MEMORY_LIMIT_MB, ParquetChunks, estimate_in_memory_mb, rss_mb, should_run_out_of_core
+    from src.training_pipeline import dataset_columns, run_out_of_core
+
+    import_rss = rss_mb()
+    started = time.perf_counter()
+    chunks = ParquetChunks(prepare_dataset(csv, cache_dir=work_dir / "cache"), dataset_columns())
+    build_seconds = time.perf_counter() - started
+    chunked, reason = should_run_out_of_core(chunks.rows, len(chunks.columns))
+    timings = run_out_of_core(chunks, models_dir=work_dir / "models") if chunked else {}
+    print(json.dumps({
+        "rows": chunks.rows,
+        "columns": len(chunks.columns),
+        "out_of_core": chunked,
+        "reason": reason,
+        "limit_mb": MEMORY_LIMIT_MB,
+        "import_rss_mb": import_rss,
+        "peak_rss_mb": rss_mb("VmHWM"),
+        "frame_float64_mb": chunks.rows * len(chunks.columns) * 8 / 1e6,
+        "in_memory_estimate_mb": estimate_in_memory_mb(chunks.rows, len(chunks.columns)),
+        "build_seconds": build_seconds,
+        "timings": timings,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=4_000_000)
+    parser.add_argument("--memory-limit-mb", type=float, default=1024)
+    parser.add_argument("--work-dir", default=None, help="Thư mục làm việc (mặc định: thư mục tạm)")
+    parser.add_argument("--keep", action="store_true", help="Giữ thư mục tạm (CSV / cache / models) sau khi chạy")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    work_dir = Path(args.work_dir or tempfile.mkdtemp(prefix="ooc-check-"))
+    csv = work_dir / "synthetic_fleet.csv"
+    if args.child:
+        child(csv, work_dir)
+        return
+
+    work_dir.mkdir(parents=True, exist_ok=True)
+    try:
+        started = time.perf_counter()
+        write_synthetic_csv(csv, args.rows)
+        print(f"Synthetic CSV: {args.rows} rows, {csv.stat().st_size / 1e6:.0f} MB "
+              f"in {time.perf_counter() - started:.1f}s")
+
+        env = dict(os.environ, TRAIN_MEMORY_LIMIT_MB=str(args.memory_limit_mb), TRAIN_OUT_OF_CORE="auto")
+        env.setdefault("MLFLOW_TRACKING_URI", (work_dir / "mlruns").as_uri())
+        proc = subprocess.run([sys.executable, __file__, "--child", "--work-dir", str(work_dir)],
+                              env=env, capture_output=True, text=True)
+        if proc.returncode != 0:
+            print(proc.stdout[-4000:], proc.stderr[-4000:])
+            print(f"❌ Training process failed (exit {proc.returncode})")
+            sys.exit(1)
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+
+        print(f"Dataset: {result['rows']} rows x {result['columns']} columns, "
+              f"float64 frame {result['frame_float64_mb']:.0f} MB, "
+              f"in-memory training estimate {result['in_memory_estimate_mb']:.0f} MB "
+              f"({result['in_memory_estimate_mb'] / args.memory_limit_mb:.1f}x the limit)")
+        print(f"Mode: {'out-of-core' if result['out_of_core'] else 'in-memory'} ({result['reason']})")
+        print(f"Cache build {result['build_seconds']:.1f}s; " +
+              ", ".join(f"{stage} {seconds:.1f}s" for stage, seconds in result["timings"].items()))
+        print(f"RSS after imports {result['import_rss_mb']:.0f} MB, peak {result['peak_rss_mb']:.0f} MB "
+              f"(limit {args.memory_limit_mb:.0f} MB)")
+
+        missing = [a for a in ARTIFACTS if not (work_dir / "models" / a).exists()]
+        ok = result["out_of_core"] and result["peak_rss_mb"] <= args.memory_limit_mb and not missing
+        if missing:
+            print("❌ Missing artifacts:", ", ".join(missing))
+        print(f"{'✅' if ok else '❌'} peak RSS {result['peak_rss_mb']:.0f} MB "
+              f"{'<=' if result['peak_rss_mb'] <= args.memory_limit_mb else '>'} {args.memory_limit_mb:.0f} MB")
+        sys.exit(0 if ok else 1)
+    finally:
+        if args.work_dir is None and not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Pre-populate local model cache (src/model_cache.py) từ MLflow Model Registry.
+
+Resolve version hiện tại của từng model ở stage đã chọn và download model +
+companion artifacts vào cache, để inference server khởi động không cần kéo
+lại từ MLflow/MinIO. Dùng lúc build image (RUN ...) hoặc một init job ghi
+vào volume cache dùng chung giữa các pod.
+
+Usage:
+    python scripts/prefetch_model_cache.py [--cache-dir .model_cache] [--stage Production]
+                                           [--models anomaly,classifier,rul] [--max-mb 2048] [--verify]
+"""
+
+import argparse
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from src.mlflow_utils import MODEL_NAMES, download_model_version, get_model_info  # noqa: E402
+from src.model_cache import ModelCache  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cache-dir", default=os.getenv("MODEL_CACHE_DIR", ".model_cache"))
+    parser.add_argument("--stage", default=os.getenv("MLFLOW_MODEL_STAGE", "Production"))
+    parser.add_argument("--models", default=",".join(MODEL_NAMES))
+    parser.add_argument("--max-mb", type=int, default=int(os.getenv("MODEL_CACHE_MAX_MB", "2048")))
+    parser.add_argument("--verify", action="store_true", help="Kiểm tra sha256 của entries sau khi tải")
+    args = parser.parse_args()
+
+    cache = ModelCache(args.cache_dir, max_bytes=args.max_mb * 1024 * 1024)
+    ok = True
+    for model_name in [m.strip() for m in args.models.split(",") if m.strip()]:
+        info = get_model_info(model_name, stage=args.stage)
+        if "version" not in info:
+            print(f"❌ {model_name}: {info.get('error')}")
+            ok = False
+            continue
+        version = info["version"]
+        registered_name = MODEL_NAMES[model_name]
+        path = cache.fetch(
+            registered_name, version,
+            lambda dst: download_model_version(model_name, version, dst)
+        )
+        status = ""
+        if args.verify:
+            verified = cache.verify(registered_name, version)
+            ok &= verified
+            status = " (verified)" if verified else " (CHECKSUM MISMATCH)"
+        print(f"✅ {registered_name} v{version} -> {path}{status}")
+
+    print(f"Cache size: {cache.size_bytes() / 1024 / 1024:.1f} MB in {args.cache_dir}")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -24,4 +24,10 @@ for t in "${TOPICS[@]}"; do
   docker run --rm --network host bitnami/kafka:latest kafka-topics.sh --create --topic ${t} --bootstrap-server ${KAFKA_BOOTSTRAP} --partitions 3 --replication-factor 1 || true
 done
 
+# Alert topic: key theo xe, partitions = số consumer workers tối đa của alert-service
+ALERT_TOPIC=${ALERT_TOPIC:-ev_predictions}
+ALERT_PARTITIONS=${ALERT_PARTITIONS:-6}
+echo "Creating topic: ${ALERT_TOPIC} (${ALERT_PARTITIONS} partitions)"
+docker run --rm --network host bitnami/kafka:latest kafka-topics.sh --create --topic ${ALERT_TOPIC} --bootstrap-server ${KAFKA_BOOTSTRAP} --partitions ${ALERT_PARTITIONS} --replication-factor 1 || true
+
 echo "Setup complete."
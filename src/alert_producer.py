@@ -0,0 +1,276 @@
+"""
+Kafka alert producer không chặn request thread.
+
+`/predict` chỉ đưa alert (dict) vào một queue giới hạn kích thước; một thread
+nền serialize (`serializer`, mặc định JSON), gọi `produce()` và `poll()` để
+librdkafka gom batch (linger / batch size / compression) và chạy delivery
+callbacks. Khi shutdown, queue được drain rồi `flush()` trong giới hạn thời gian.
+
+Khi queue đầy (alert storm hoặc broker chậm), `QUEUE_FULL_POLICY` quyết định:
+
+- `drop_newest` (mặc định): bỏ alert mới, request không bao giờ bị chặn
+- `drop_oldest`: bỏ alert cũ nhất trong queue để nhận alert mới
+- `block`: chờ tối đa `block_timeout_ms` rồi mới bỏ alert mới
+
+Mọi alert bị bỏ đều được đếm theo lý do trong `kafka_alerts_dropped_total`.
+"""
+
+import json
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from prometheus_client import Counter, Gauge, Histogram
+
+# =======================
+# MONITORING METRICS
+# =======================
+
+KAFKA_QUEUE_DEPTH = Gauge(
+    "kafka_alert_queue_depth",
+    "Number of alerts waiting in the in-memory producer queue",
+    multiprocess_mode="livesum"
+)
+
+KAFKA_SEND_LATENCY = Histogram(
+    "kafka_alert_send_latency_seconds",
+    "Time from enqueueing an alert to its Kafka delivery report",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+)
+
+KAFKA_DELIVERED = Counter(
+    "kafka_alerts_delivered_total",
+    "Alerts acknowledged by the Kafka broker"
+)
+
+KAFKA_DELIVERY_FAILURES = Counter(
+    "kafka_alert_delivery_failures_total",
+    "Alerts whose Kafka delivery report carried an error"
+)
+
+KAFKA_DROPPED = Counter(
+    "kafka_alerts_dropped_total",
+    "Alerts dropped before reaching Kafka",
+    ["reason"]  # queue_full | serialize | produce_error | shutdown
+)
+
+QUEUE_FULL_POLICIES = ("drop_newest", "drop_oldest", "block")
+
+# Mặc định cho throughput alert: gom batch nhỏ (linger) + nén, không retry vô hạn
+DEFAULT_PRODUCER_CONFIG = {
+    "linger.ms": 20,
+    "batch.num.messages": 10000,
+    "batch.size": 262144,
+    "compression.type": "lz4",
+    "acks": "1",
+    # Cùng hash với Java client: key -> partition ổn định giữa các producer
+    "partitioner": "murmur2_random",
+    "queue.buffering.max.messages": 100000,
+    "message.timeout.ms": 30000,
+}
+
+# Log drop tối đa một lần mỗi khoảng này (alert storm không được làm ngập stdout)
+_DROP_LOG_INTERVAL = 10.0
+
+
+class AlertProducer:
+    """
+    Queue giới hạn + thread nền gửi alert lên một Kafka topic.
+
+    Args:
+        producer_factory: hàm không tham số trả về producer kiểu confluent_kafka
+            (`produce`, `poll`, `flush`); được gọi trong `start()`
+        topic: Kafka topic
+        max_queue_size: số alert tối đa chờ trong queue
+        queue_full_policy: `drop_newest` | `drop_oldest` | `block`
+        block_timeout_ms: thời gian chờ tối đa với policy `block`
+        serializer: hàm dict -> bytes (mặc định JSON UTF-8)
+        headers: Kafka headers gắn vào mọi message (vd. content type + schema id)
+        key_fn: hàm dict -> message key (cùng key -> cùng partition, giữ thứ tự)
+    """
+
+    def __init__(
+        self,
+        producer_factory: Callable[[], Any],
+        topic: str,
+        max_queue_size: int = 10000,
+        queue_full_policy: str = "drop_newest",
+        block_timeout_ms: float = 50.0,
+        serializer: Optional[Callable[[Dict[str, Any]], bytes]] = None,
+        headers: Optional[List[Tuple[str, bytes]]] = None,
+        key_fn: Optional[Callable[[Dict[str, Any]], Optional[str]]] = None
+    ):
+        if queue_full_policy not in QUEUE_FULL_POLICIES:
+            raise ValueError(f"queue_full_policy must be one of {QUEUE_FULL_POLICIES}, got {queue_full_policy!r}")
+        self.producer_factory = producer_factory
+        self.topic = topic
+        self.queue_full_policy = queue_full_policy
+        self.block_timeout = max(0.0, float(block_timeout_ms)) / 1000.0
+        self.serializer = serializer or (lambda payload: json.dumps(payload).encode("utf-8"))
+        self.headers = headers
+        self.key_fn = key_fn
+        self.producer = None
+        self._queue: "queue.Queue[Tuple[Dict[str, Any], float]]" = queue.Queue(maxsize=max(1, int(max_queue_size)))
+        self._stop = threading.Event()
+        self._thread = None
+        self._last_drop_log = 0.0
+        self._dropped_since_log = 0
+        # Alert không tới được broker (delivery lỗi, queue đầy, produce lỗi) kể từ lần flush() trước
+        self._undelivered = 0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def start(self):
+        """Tạo producer và thread gửi (gọi trong process phục vụ, sau fork)."""
+        if self.running:
+            return
+        self.producer = self.producer_factory()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="kafka-alert-producer", daemon=True)
+        self._thread.start()
+
+    def send(self, payload: Dict[str, Any]) -> bool:
+        """
+        Đưa alert vào queue (không serialize, không I/O trên thread của caller).
+
+        Returns:
+            False nếu alert bị bỏ (producer đã dừng hoặc queue đầy theo policy)
+        """
+        if self._stop.is_set() or self._thread is None:
+            self._drop("shutdown")
+            return False
+        item = (payload, time.perf_counter())
+        try:
+            if self.queue_full_policy == "block":
+                self._queue.put(item, timeout=self.block_timeout)
+            else:
+                self._queue.put_nowait(item)
+        except queue.Full:
+            if self.queue_full_policy != "drop_oldest":
+                self._drop("queue_full")
+                return False
+            # Nhường chỗ cho alert mới; thread gửi có thể đã lấy mất phần tử cũ
+            try:
+                self._queue.get_nowait()
+                self._queue.task_done()
+                KAFKA_QUEUE_DEPTH.dec()
+                self._drop("queue_full")
+            except queue.Empty:
+                pass
+            try:
+                self._queue.put_nowait(item)
+            except queue.Full:
+                self._drop("queue_full")
+                return False
+        KAFKA_QUEUE_DEPTH.inc()
+        return True
+
+    def stop(self, timeout: float = 10.0):
+        """Ngừng nhận alert, drain queue rồi flush producer trong tối đa `timeout` giây."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+            self._thread = None
+        # Thread không drain kịp: phần còn lại được tính là drop
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                break
+            self._queue.task_done()
+            KAFKA_QUEUE_DEPTH.dec()
+            self._drop("shutdown")
+        if self.producer is not None:
+            remaining = self.producer.flush(timeout)
+            if remaining:
+                KAFKA_DROPPED.labels(reason="shutdown").inc(remaining)
+                print(f"[WARN] Kafka flush timed out, {remaining} alert(s) not delivered to {self.topic}")
+            self.producer = None
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """
+        Chờ thread gửi hết queue và broker xác nhận mọi message (không dừng producer).
+
+        Returns:
+            True nếu mọi alert nhận từ lần `flush()` trước đã được broker xác nhận;
+            False nếu hết `timeout` hoặc có alert bị bỏ / delivery lỗi trong khoảng đó
+        """
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if time.monotonic() >= deadline or not self.running:
+                return False
+            time.sleep(0.001)
+        producer = self.producer
+        if producer is None or producer.flush(max(0.0, deadline - time.monotonic())) > 0:
+            return False
+        undelivered, self._undelivered = self._undelivered, 0
+        return undelivered == 0
+
+    def _run(self):
+        producer = self.producer
+        while not self._stop.is_set() or not self._queue.empty():
+            try:
+                payload, enqueued = self._queue.get(timeout=0.1)
+            except queue.Empty:
+                producer.poll(0)
+                continue
+            KAFKA_QUEUE_DEPTH.dec()
+            self._produce(producer, payload, enqueued)
+            self._queue.task_done()
+            # Delivery callbacks chạy trong poll(): giữ ở thread này
+            producer.poll(0)
+
+    def _produce(self, producer, payload: Dict[str, Any], enqueued: float):
+        try:
+            value = self.serializer(payload)
+            key = self.key_fn(payload) if self.key_fn is not None else None
+        except Exception as e:
+            self._drop("serialize", e)
+            return
+
+        def on_delivery(err, msg):
+            if err is not None:
+                KAFKA_DELIVERY_FAILURES.inc()
+                self._undelivered += 1
+                print(f"[ERROR] Kafka delivery failed: {err}")
+                return
+            KAFKA_DELIVERED.inc()
+            KAFKA_SEND_LATENCY.observe(time.perf_counter() - enqueued)
+
+        retry_deadline = None
+        while True:
+            try:
+                producer.produce(self.topic, value=value, key=key, headers=self.headers, on_delivery=on_delivery)
+                return
+            except BufferError as e:
+                # Queue nội bộ của librdkafka đầy: chờ broker nhận bớt rồi thử lại
+                # (backpressure dồn về queue của AlertProducer, không về request)
+                if self._stop.is_set():
+                    retry_deadline = retry_deadline or time.monotonic() + 5.0
+                    if time.monotonic() > retry_deadline:
+                        self._drop("produce_error", e)
+                        return
+                producer.poll(0.1)
+            except Exception as e:
+                self._drop("produce_error", e)
+                return
+
+    def _drop(self, reason: str, error: Any = None):
+        KAFKA_DROPPED.labels(reason=reason).inc()
+        if reason != "serialize":  # alert lỗi serialize gửi lại cũng không được
+            self._undelivered += 1
+        self._dropped_since_log += 1
+        now = time.monotonic()
+        if now - self._last_drop_log >= _DROP_LOG_INTERVAL:
+            detail = f": {error}" if error is not None else ""
+            print(f"[WARN] Dropped {self._dropped_since_log} Kafka alert(s) for {self.topic} "
+                  f"(last reason: {reason}{detail})")
+            self._last_drop_log = now
+            self._dropped_since_log = 0
@@ -0,0 +1,215 @@
+"""
+Encoding nhị phân có version cho alert events trên topic `ev_predictions`.
+
+JSON lặp lại tên của mọi field telemetry trong từng message; schema nhị phân
+cố định thứ tự field theo `schema id` nên chỉ còn giá trị float32:
+
+    magic (0xEA) | schema id (uint16) | timestamp (uint32) | flags (uint8)
+    | RUL (float32) | failure_prob (float32) | host (uint8 len + utf-8)
+    | classifier_label (uint16 len + utf-8) | presence bitmap (1 bit / field)
+    | float32 cho mỗi field có mặt, theo thứ tự schema
+    | extras (uint32 len + JSON): field ngoài schema hoặc không phải số
+
+Little-endian. `decode_alert` nhận cả JSON (message bắt đầu bằng `{`) lẫn nhị
+phân, nên producer và consumer có thể deploy lệch nhau. Schema chỉ được thêm
+version mới (append field), không sửa field của version đã phát hành.
+
+Module chỉ dùng stdlib để alert_service dùng chung mà không cần cài gì thêm.
+Nén (lz4 / zstd) do Kafka producer làm theo record batch (`compression.type`).
+"""
+
+import json
+import math
+import struct
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+MAGIC = 0xEA
+CONTENT_TYPE_JSON = "application/json"
+CONTENT_TYPE_BINARY = "application/x-ev-alert"
+ALERT_ENCODINGS = ("binary", "json")
+
+# Field trong `input` định danh xe (Kafka message key); không có thì dùng `host`
+VEHICLE_KEY_FIELDS = ("Vehicle_ID", "vehicle_id", "VIN", "vin", "device_id")
+
+# Telemetry của dataset (anomaly + classifier/RUL features); thứ tự là một phần của schema
+TELEMETRY_FIELDS_V1 = (
+    "State_of_Charge", "Battery_Temperature", "Motor_Temperature", "Ambient_Temperature",
+    "Odometer", "Speed", "Current", "Voltage", "Health_Index",
+    "SoC", "SoH", "Battery_Voltage", "Battery_Current", "Charge_Cycles",
+    "Motor_Vibration", "Motor_Torque", "Motor_RPM", "Power_Consumption",
+    "Brake_Pad_Wear", "Brake_Pressure", "Reg_Brake_Efficiency", "Tire_Pressure",
+    "Tire_Temperature", "Suspension_Load", "Ambient_Humidity", "Load_Weight",
+    "Driving_Speed", "Distance_Traveled", "Idle_Time", "Route_Roughness",
+    "Component_Health_Score", "Failure_Probability", "TTF",
+)
+
+_HEAD = struct.Struct("<BHIBffB")
+_U16 = struct.Struct("<H")
+_U32 = struct.Struct("<I")
+
+_FLAG_ANOMALY = 1
+_FLAG_FAULT = 2
+_FLAG_LABEL = 4
+_FLAG_RUL = 8
+_FLAG_FAILURE_PROB = 16
+
+_FLOAT32_MAX = 3.4028234663852886e38
+
+
+class AlertSchema:
+    """Một version của schema: danh sách field telemetry cố định thứ tự."""
+
+    def __init__(self, schema_id: int, fields: Sequence[str]):
+        self.schema_id = schema_id
+        self.fields = tuple(fields)
+        self.index = {name: i for i, name in enumerate(self.fields)}
+        self.bitmap_size = (len(self.fields) + 7) // 8
+        self.headers = [("content-type", CONTENT_TYPE_BINARY.encode()), ("schema-id", str(schema_id).encode())]
+
+    def encode(self, event: Dict[str, Any]) -> bytes:
+        prediction = event.get("prediction") or {}
+        flags = 0
+        if prediction.get("IF_Anomaly"):
+            flags |= _FLAG_ANOMALY
+        if prediction.get("is_fault"):
+            flags |= _FLAG_FAULT
+        label = prediction.get("classifier_label")
+        label_bytes = b""
+        if label is not None:
+            flags |= _FLAG_LABEL
+            label_bytes = str(label).encode("utf-8")[:0xFFFF]
+        rul = _as_float(prediction.get("RUL_estimated"))
+        if rul is not None:
+            flags |= _FLAG_RUL
+        failure_prob = _as_float(prediction.get("failure_prob"))
+        if failure_prob is not None:
+            flags |= _FLAG_FAILURE_PROB
+        host = str(event.get("host", "unknown")).encode("utf-8")[:0xFF]
+
+        slots: List[Optional[float]] = [None] * len(self.fields)
+        extras = {}
+        for name, value in (event.get("input") or {}).items():
+            i = self.index.get(name)
+            if (i is not None and isinstance(value, (int, float)) and not isinstance(value, bool)
+                    and abs(value) <= _FLOAT32_MAX):
+                slots[i] = value
+            else:
+                extras[name] = value
+        present = 0
+        values = []
+        for i, value in enumerate(slots):
+            if value is not None:
+                present |= 1 << i
+                values.append(value)
+        extras_bytes = json.dumps(extras).encode("utf-8") if extras else b""
+
+        return b"".join((
+            _HEAD.pack(MAGIC, self.schema_id, int(event.get("timestamp") or 0), flags,
+                       rul if rul is not None else 0.0, failure_prob if failure_prob is not None else 0.0, len(host)),
+            host,
+            _U16.pack(len(label_bytes)),
+            label_bytes,
+            present.to_bytes(self.bitmap_size, "little"),
+            struct.pack(f"<{len(values)}f", *values),
+            _U32.pack(len(extras_bytes)),
+            extras_bytes,
+        ))
+
+    def decode(self, data: bytes) -> Dict[str, Any]:
+        _, _, timestamp, flags, rul, failure_prob, host_len = _HEAD.unpack_from(data, 0)
+        offset = _HEAD.size
+        host = data[offset:offset + host_len].decode("utf-8")
+        offset += host_len
+        (label_len,) = _U16.unpack_from(data, offset)
+        offset += _U16.size
+        label = data[offset:offset + label_len].decode("utf-8") if flags & _FLAG_LABEL else None
+        offset += label_len
+        present = int.from_bytes(data[offset:offset + self.bitmap_size], "little")
+        offset += self.bitmap_size
+        names = [name for i, name in enumerate(self.fields) if present >> i & 1]
+        values = struct.unpack_from(f"<{len(names)}f", data, offset)
+        offset += 4 * len(names)
+        row = dict(zip(names, values))
+        (extras_len,) = _U32.unpack_from(data, offset)
+        offset += _U32.size
+        if extras_len:
+            row.update(json.loads(data[offset:offset + extras_len]))
+
+        return {
+            "timestamp": timestamp,
+            "host": host,
+            "input": row,
+            "prediction": {
+                "IF_Anomaly": 1 if flags & _FLAG_ANOMALY else 0,
+                "classifier_label": label,
+                "is_fault": bool(flags & _FLAG_FAULT),
+                "RUL_estimated": rul if flags & _FLAG_RUL else None,
+                "failure_prob": failure_prob if flags & _FLAG_FAILURE_PROB else None,
+            },
+        }
+
+
+SCHEMAS = {1: AlertSchema(1, TELEMETRY_FIELDS_V1)}
+CURRENT_SCHEMA_ID = 1
+
+JSON_HEADERS = [("content-type", CONTENT_TYPE_JSON.encode())]
+
+
+def _fits_float32(value: float) -> bool:
+    return not (math.isfinite(value) and abs(value) > _FLOAT32_MAX)
+
+
+def _as_float(value) -> Optional[float]:
+    """Giá trị float32 được (gồm NaN / inf) hoặc None."""
+    if value is None or isinstance(value, bool):
+        return None
+    try:
+        value = float(value)
+    except (TypeError, ValueError, OverflowError):
+        return None
+    return value if _fits_float32(value) else None
+
+
+def encode_alert(event: Dict[str, Any], encoding: str = "binary") -> bytes:
+    """Serialize một alert event theo `encoding` (`binary` = schema hiện tại, `json`)."""
+    if encoding == "json":
+        return json.dumps(event).encode("utf-8")
+    return SCHEMAS[CURRENT_SCHEMA_ID].encode(event)
+
+
+def alert_headers(encoding: str = "binary") -> List[Tuple[str, bytes]]:
+    """Kafka headers đi kèm message (content type + schema id)."""
+    return JSON_HEADERS if encoding == "json" else SCHEMAS[CURRENT_SCHEMA_ID].headers
+
+
+def vehicle_key(event: Dict[str, Any], key_fields: Sequence[str] = VEHICLE_KEY_FIELDS) -> str:
+    """Định danh xe của alert: field đầu tiên có giá trị trong `input`, không có thì `host`."""
+    row = event.get("input") or {}
+    for name in key_fields:
+        value = row.get(name)
+        if value is not None and value != "":
+            return str(value)
+    return str(event.get("host", "unknown"))
+
+
+def decode_alert(data: bytes) -> Dict[str, Any]:
+    """
+    Parse một message từ topic alert, JSON hoặc nhị phân (nhận dạng qua byte đầu).
+
+    Raises:
+        ValueError: message rỗng, magic lạ, schema id không biết hoặc bị cắt cụt
+    """
+    if not data:
+        raise ValueError("empty alert message")
+    if data[0] != MAGIC:
+        return json.loads(data)
+    if len(data) < _HEAD.size:
+        raise ValueError("truncated alert message")
+    (schema_id,) = _U16.unpack_from(data, 1)
+    schema = SCHEMAS.get(schema_id)
+    if schema is None:
+        raise ValueError(f"unknown alert schema id {schema_id}")
+    try:
+        return schema.decode(data)
+    except (struct.error, UnicodeDecodeError) as e:
+        raise ValueError(f"malformed alert message (schema {schema_id}): {e}") from e
@@ -2,6 +2,7 @@
 import os
 import random
 from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
 import joblib
 import pandas as pd
 import numpy as np
@@ -15,6 +16,13 @@ from sklearn.metrics import (
 )
 import mlflow
 
+try:
+    from src.dataset_cache import load_training_frame
+    from src.out_of_core import IF_SAMPLE_ROWS, ParquetChunks, ReservoirSample
+except ImportError:
+    from dataset_cache import load_training_frame
+    from out_of_core import IF_SAMPLE_ROWS, ParquetChunks, ReservoirSample
+
 SEED = 42
 
 
@@ -24,18 +32,11 @@ def set_seed(seed: int = SEED):
     os.environ["PYTHONHASHSEED"] = str(seed)
 
 
-set_seed()
-
 # Resolve paths relative to repository root for Docker/local consistency
 ROOT = Path(__file__).resolve().parent
 CSV = ROOT / "data" / "EV_Predictive_Maintenance_Dataset_15min.csv"
 OUT_PARQUET = ROOT.parent / "data" / "features_with_anomaly.parquet"
 MODEL_DIR = ROOT.parent / "models" / "anomaly"
-MODEL_DIR.mkdir(parents=True, exist_ok=True)
-OUT_PARQUET.parent.mkdir(parents=True, exist_ok=True)
-
-print("Loading:", CSV)
-df = pd.read_csv(CSV)
 
 # Exact numeric features from your CSV
 FEATURES = [
@@ -49,82 +50,173 @@ FEATURES = [
     "Voltage",
     "Health_Index",
 ]
+# Cột cần đọc từ dataset (Anomaly: ground truth để đánh giá, nếu có)
+COLUMNS = FEATURES + ["Anomaly"]
 
-# Keep only features that exist (defensive)
-FEATURES = [c for c in FEATURES if c in df.columns]
-if not FEATURES:
-    raise RuntimeError("No feature columns found in dataset.")
-
-X = df[FEATURES].fillna(0.0).astype(float)
-
-print("Using features:", FEATURES)
-
-# Scale
-scaler = StandardScaler()
-Xs = scaler.fit_transform(X)
-
-# Train IsolationForest
-iso_params = {
+ISO_PARAMS = {
     "n_estimators": 200,
     "contamination": 0.02,
     "random_state": SEED
 }
-iso = IsolationForest(**iso_params)
-iso.fit(Xs)
-
-# Predict: sklearn returns 1 normal, -1 anomaly -> convert to 0/1
-if_pred = iso.predict(Xs)
-df["IF_Anomaly"] = (if_pred == -1).astype(int)
-anomaly_rate = float(df["IF_Anomaly"].mean())
-
-# Optional evaluation if ground-truth Anomaly label exists
-metrics = {
-    "anomaly_rate": anomaly_rate,
-    "precision": None,
-    "recall": None,
-    "f1": None
-}
-conf_mat = None
-label_col = "Anomaly" if "Anomaly" in df.columns else None
-if label_col:
-    y_true = df[label_col].fillna(0).astype(int)
-    y_pred = df["IF_Anomaly"].astype(int)
-    metrics["precision"] = precision_score(y_true, y_pred, zero_division=0)
-    metrics["recall"] = recall_score(y_true, y_pred, zero_division=0)
-    metrics["f1"] = f1_score(y_true, y_pred, zero_division=0)
-    conf_mat = confusion_matrix(y_true, y_pred)
-    print("Anomaly ground-truth available -> logging metrics")
-    print("Precision:", metrics["precision"])
-    print("Recall:", metrics["recall"])
-    print("F1:", metrics["f1"])
-
-# Save artifacts
-joblib.dump(iso, os.path.join(MODEL_DIR, "isolation_forest.joblib"))
-joblib.dump(scaler, os.path.join(MODEL_DIR, "scaler.joblib"))
-joblib.dump(FEATURES, os.path.join(MODEL_DIR, "isofeat.joblib"))
-df.to_parquet(OUT_PARQUET, index=False)
-
-print("Saved:", OUT_PARQUET)
-print("Models saved to:", MODEL_DIR)
-print("IF anomaly rate:", anomaly_rate)
-
-# MLflow logging (separate run for anomaly training)
-mlflow.set_tracking_uri(os.getenv("MLFLOW_TRACKING_URI", "http://localhost:6969"))
-mlflow.set_experiment(os.getenv("MLFLOW_EXPERIMENT", "predictive-maintenance"))
-with mlflow.start_run(run_name="anomaly"):
-    # Set tags for filtering in MLflow UI
-    dataset_name = CSV.stem  # e.g., "EV_Predictive_Maintenance_Dataset_15min"
-    mlflow.set_tag("dataset", dataset_name)
-    mlflow.set_tag("model", "IsolationForest")
-    
-    mlflow.log_params({
-        "model": "IsolationForest",
-        **iso_params,
-        "feature_count": len(FEATURES)
-    })
-    mlflow.log_metrics({k: v for k, v in metrics.items() if v is not None})
-    if conf_mat is not None:
-        cm_path = MODEL_DIR / "confusion_matrix_anomaly.csv"
-        pd.DataFrame(conf_mat, columns=["pred_normal", "pred_anomaly"], index=["true_normal", "true_anomaly"]).to_csv(cm_path)
-        mlflow.log_artifact(cm_path)
 
+
+def train_anomaly(df: pd.DataFrame, model_dir: Path = MODEL_DIR, n_jobs: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Train IsolationForest, thêm cột `IF_Anomaly` (0/1) vào `df` (in-place) cho
+    classifier / RUL, lưu artifacts vào `model_dir` và log run "anomaly" lên MLflow.
+
+    Args:
+        n_jobs: số process/thread của IsolationForest (None = 1)
+
+    Returns:
+        metrics (anomaly_rate, precision / recall / f1 nếu có cột Anomaly)
+    """
+    set_seed()
+
+    # Keep only features that exist (defensive)
+    features = [c for c in FEATURES if c in df.columns]
+    if not features:
+        raise RuntimeError("No feature columns found in dataset.")
+
+    X = df[features].fillna(0.0).astype(float)
+
+    print("Using features:", features)
+
+    # Scale
+    scaler = StandardScaler()
+    Xs = scaler.fit_transform(X)
+
+    # Train IsolationForest
+    iso = IsolationForest(**ISO_PARAMS, n_jobs=n_jobs)
+    iso.fit(Xs)
+
+    # Predict: sklearn returns 1 normal, -1 anomaly -> convert to 0/1
+    if_pred = iso.predict(Xs)
+    df["IF_Anomaly"] = (if_pred == -1).astype(int)
+
+    # Optional evaluation if ground-truth Anomaly label exists
+    y_true = df["Anomaly"].fillna(0).astype(int) if "Anomaly" in df.columns else None
+    metrics, conf_mat = anomaly_metrics(df["IF_Anomaly"].astype(int), y_true)
+    _save_and_log(iso, scaler, features, metrics, conf_mat, Path(model_dir))
+    return metrics
+
+
+def train_anomaly_chunked(
+    chunks: ParquetChunks,
+    work_dir: Path,
+    model_dir: Path = MODEL_DIR,
+    n_jobs: Optional[int] = None,
+    sample_rows: int = IF_SAMPLE_ROWS
+) -> Dict[str, Any]:
+    """
+    Bản out-of-core của `train_anomaly` (src/out_of_core.py): lượt đọc thứ nhất
+    `partial_fit` scaler và lấy reservoir sample `sample_rows` dòng để fit
+    IsolationForest; lượt thứ hai predict từng chunk. `IF_Anomaly` được ghi vào
+    `work_dir/if_anomaly.npy` (memmap int8) và gắn vào `chunks.extra`.
+    """
+    set_seed()
+
+    features = [c for c in FEATURES if c in chunks.columns]
+    if not features:
+        raise RuntimeError("No feature columns found in dataset.")
+
+    print("Using features:", features)
+
+    scaler = StandardScaler()
+    reservoir = ReservoirSample(sample_rows, SEED)
+    for _, chunk in chunks.iter_columns(features):
+        X = chunk[features].fillna(0.0).astype(float)
+        scaler.partial_fit(X)
+        reservoir.add(X.values)
+
+    sample = pd.DataFrame(reservoir.sample, columns=features)
+    print(f"Fitting IsolationForest on a reservoir sample of {len(sample)} / {chunks.rows} rows")
+    iso = IsolationForest(**ISO_PARAMS, n_jobs=n_jobs)
+    iso.fit(scaler.transform(sample))
+
+    if_anomaly = np.lib.format.open_memmap(Path(work_dir) / "if_anomaly.npy", mode="w+",
+                                           dtype=np.int8, shape=(chunks.rows,))
+    y_true = [] if "Anomaly" in chunks.columns else None
+    for index, chunk in chunks.iter_columns(features + ["Anomaly"]):
+        start, stop = chunks.bounds(index)
+        Xs = scaler.transform(chunk[features].fillna(0.0).astype(float))
+        if_anomaly[start:stop] = iso.predict(Xs) == -1
+        if y_true is not None:
+            y_true.append(chunk["Anomaly"].fillna(0).astype(int).values)
+    if_anomaly.flush()
+    chunks.extra["IF_Anomaly"] = if_anomaly
+
+    metrics, conf_mat = anomaly_metrics(np.asarray(if_anomaly, dtype=int),
+                                        np.concatenate(y_true) if y_true is not None else None)
+    _save_and_log(iso, scaler, features, metrics, conf_mat, Path(model_dir),
+                  extra_params={"out_of_core": True, "sample_rows": len(sample)})
+    return metrics
+
+
+def anomaly_metrics(y_pred, y_true=None) -> Tuple[Dict[str, Any], Optional[np.ndarray]]:
+    """anomaly_rate và precision / recall / f1 + confusion matrix khi có ground truth."""
+    metrics = {
+        "anomaly_rate": float(np.mean(y_pred)),
+        "precision": None,
+        "recall": None,
+        "f1": None
+    }
+    conf_mat = None
+    if y_true is not None:
+        metrics["precision"] = precision_score(y_true, y_pred, zero_division=0)
+        metrics["recall"] = recall_score(y_true, y_pred, zero_division=0)
+        metrics["f1"] = f1_score(y_true, y_pred, zero_division=0)
+        conf_mat = confusion_matrix(y_true, y_pred)
+        print("Anomaly ground-truth available -> logging metrics")
+        print("Precision:", metrics["precision"])
+        print("Recall:", metrics["recall"])
+        print("F1:", metrics["f1"])
+    return metrics, conf_mat
+
+
+def _save_and_log(iso, scaler, features, metrics, conf_mat, model_dir: Path, extra_params: Optional[Dict] = None):
+    model_dir.mkdir(parents=True, exist_ok=True)
+
+    # Save artifacts
+    joblib.dump(iso, os.path.join(model_dir, "isolation_forest.joblib"))
+    joblib.dump(scaler, os.path.join(model_dir, "scaler.joblib"))
+    joblib.dump(features, os.path.join(model_dir, "isofeat.joblib"))
+
+    print("Models saved to:", model_dir)
+    print("IF anomaly rate:", metrics["anomaly_rate"])
+
+    # MLflow logging (separate run for anomaly training; nested khi chạy trong run của pipeline)
+    mlflow.set_tracking_uri(os.getenv("MLFLOW_TRACKING_URI", "http://localhost:6969"))
+    mlflow.set_experiment(os.getenv("MLFLOW_EXPERIMENT", "predictive-maintenance"))
+    with mlflow.start_run(run_name="anomaly", nested=mlflow.active_run() is not None):
+        # Set tags for filtering in MLflow UI
+        dataset_name = CSV.stem  # e.g., "EV_Predictive_Maintenance_Dataset_15min"
+        mlflow.set_tag("dataset", dataset_name)
+        mlflow.set_tag("model", "IsolationForest")
+
+        mlflow.log_params({
+            "model": "IsolationForest",
+            **ISO_PARAMS,
+            "feature_count": len(features),
+            **(extra_params or {})
+        })
+        mlflow.log_metrics({k: v for k, v in metrics.items() if v is not None})
+        if conf_mat is not None:
+            cm_path = model_dir / "confusion_matrix_anomaly.csv"
+            pd.DataFrame(conf_mat, columns=["pred_normal", "pred_anomaly"], index=["true_normal", "true_anomaly"]).to_csv(cm_path)
+            mlflow.log_artifact(cm_path)
+
+
+def save_annotated(df: pd.DataFrame, path: Path = OUT_PARQUET):
+    """Lưu frame đã có IF_Anomaly cho classifier / RUL chạy riêng lẻ."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    df.to_parquet(path, index=False)
+    print("Saved:", path)
+
+
+if __name__ == "__main__":
+    # Mọi cột: parquet được classifier.py / rul.py chạy riêng lẻ đọc lại
+    df = load_training_frame(csv=CSV)
+    train_anomaly(df)
+    save_annotated(df)
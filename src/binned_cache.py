@@ -0,0 +1,173 @@
+"""
+Cache dataset đã build của LightGBM / XGBoost cho trainers.
+
+Mỗi lần train, `lgb.Dataset` / `xgb.DMatrix` được build lại từ pandas; với
+LightGBM đó là cả bước bin histogram (quantile từng feature). Dataset đã build
+được lưu ra file binary (`Dataset.save_binary` / `DMatrix.save_binary`), key
+là fingerprint của dữ liệu: SHA-256 của ma trận feature, label, weight, cùng
+danh sách feature, params ảnh hưởng tới việc bin và version của thư viện. Lần
+retrain sau với cùng dữ liệu (hoặc mỗi trial của hyperparameter search) chỉ
+đọc lại file thay vì bin lại. Dataset gần nhất của mỗi loại cũng được giữ
+trong process (`lgb.Dataset` dùng lại được qua nhiều lần `lgb.train`; XGBoost
+giữ gradient index của `tree_method="hist"` trong DMatrix sau lần train đầu).
+
+XGBoost không lưu được `QuantileDMatrix` (chỉ `DMatrix` thường), nên với
+XGBoost file cache bỏ qua bước pandas -> DMatrix còn quantile sketch vẫn chạy
+ở lần train đầu của mỗi process.
+
+| Env | Mặc định | Ý nghĩa |
+|-----|----------|---------|
+| `TRAIN_BINNED_CACHE` | `true` | `false` = luôn build dataset (không đọc / ghi file) |
+| `BINNED_CACHE_DIR` | `data/cache/binned` | Thư mục file binary |
+| `BINNED_CACHE_MAX_FILES` | `8` | Số file tối đa; file lâu không dùng nhất bị xóa trước |
+"""
+
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+try:
+    from src.dataset_cache import CACHE_DIR
+except ImportError:
+    from dataset_cache import CACHE_DIR
+
+USE_BINNED_CACHE = os.getenv("TRAIN_BINNED_CACHE", "true").lower() == "true"
+BINNED_CACHE_DIR = Path(os.getenv("BINNED_CACHE_DIR", str(CACHE_DIR / "binned")))
+MAX_FILES = int(os.getenv("BINNED_CACHE_MAX_FILES", "8"))
+
+# Dataset gần nhất theo loại ("lgb" / "xgb"): (fingerprint, dataset)
+_MEMORY: Dict[str, Tuple[str, Any]] = {}
+
+
+def fingerprint(arrays: Iterable[Optional[np.ndarray]], **meta) -> str:
+    """SHA-256 của các mảng (dtype, shape, bytes) và `meta` (JSON, key đã sort)."""
+    digest = hashlib.sha256(json.dumps(meta, sort_keys=True, default=str).encode())
+    for array in arrays:
+        if array is None:
+            digest.update(b"none")
+            continue
+        array = np.ascontiguousarray(array)
+        digest.update(f"{array.dtype.str}{array.shape}".encode())
+        digest.update(memoryview(array).cast("B"))
+    return digest.hexdigest()
+
+
+def _evict(cache_dir: Path, keep: int = MAX_FILES):
+    files = sorted((p for p in cache_dir.glob("*.bin") if p.is_file()), key=lambda p: p.stat().st_mtime)
+    for path in files[:max(0, len(files) - keep)]:
+        path.unlink(missing_ok=True)
+
+
+def _cached(kind: str, make_key, build, save, load, cache_dir: Path, enabled: bool) -> Tuple[Any, Dict[str, Any]]:
+    """
+    Dataset theo thứ tự: trong process -> file binary -> build (rồi lưu file).
+    Thời gian trả về tính cả fingerprint (hash dữ liệu).
+    """
+    started = time.perf_counter()
+    if not enabled:
+        return build(), {"source": "built", "seconds": time.perf_counter() - started, "key": None}
+
+    key = make_key()
+    held = _MEMORY.get(kind)
+    if held is not None and held[0] == key:
+        return held[1], {"source": "memory", "seconds": time.perf_counter() - started, "key": key}
+
+    path = Path(cache_dir) / f"{kind}-{key[:24]}.bin"
+    source = "built"
+    dataset = None
+    if path.exists():
+        try:
+            dataset = load(path)
+            source = "disk"
+            os.utime(path)  # cho `_evict` (file dùng gần đây nhất được giữ)
+        except Exception as e:
+            print(f"⚠️ Binned cache {path.name} unreadable, rebuilding: {e}")
+            dataset = None
+    if dataset is None:
+        dataset = build()
+        tmp_path = path.with_suffix(f".tmp{os.getpid()}")
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            save(dataset, tmp_path)
+            os.replace(tmp_path, path)  # process song song không đọc file ghi dở
+            _evict(path.parent)
+        except Exception as e:
+            tmp_path.unlink(missing_ok=True)
+            print(f"[WARN] Could not write binned cache {path}: {e}")
+
+    _MEMORY[kind] = (key, dataset)
+    return dataset, {"source": source, "seconds": time.perf_counter() - started, "key": key}
+
+
+def lgb_dataset(
+    X: pd.DataFrame,
+    y,
+    params: Dict[str, Any],
+    cache_dir: Path = BINNED_CACHE_DIR,
+    enabled: bool = USE_BINNED_CACHE
+) -> Tuple[Any, Dict[str, Any]]:
+    """
+    `lgb.Dataset` (đã construct, tức đã bin) của (X, y), qua cache.
+
+    Args:
+        params: params của Dataset (vd. seed, max_bin); phải trùng các params
+            dataset của lần `lgb.train` (LightGBM báo lỗi nếu đổi sau khi bin)
+
+    Returns:
+        (dataset, info) với info = {"source": "memory" | "disk" | "built", "seconds", "key"}
+    """
+    import lightgbm as lgb
+
+    label = np.asarray(y, dtype=np.float64)
+
+    def make_key():
+        return fingerprint([X.to_numpy(dtype=np.float64), label], kind="lgb", version=lgb.__version__,
+                           features=list(X.columns), params=params)
+
+    def build():
+        return lgb.Dataset(X, label=label, params=params, free_raw_data=True).construct()
+
+    def load(path: Path):
+        dataset = lgb.Dataset(str(path), params=params).construct()
+        if dataset.num_data() != len(label):
+            raise ValueError(f"{dataset.num_data()} rows, expected {len(label)}")
+        return dataset
+
+    return _cached("lgb", make_key, build, lambda d, path: d.save_binary(str(path)), load, cache_dir, enabled)
+
+
+def xgb_dmatrix(
+    X: np.ndarray,
+    y: np.ndarray,
+    weight: Optional[np.ndarray] = None,
+    n_jobs: Optional[int] = None,
+    cache_dir: Path = BINNED_CACHE_DIR,
+    enabled: bool = USE_BINNED_CACHE
+) -> Tuple[Any, Dict[str, Any]]:
+    """`xgb.DMatrix` của (X, y, weight), qua cache. Returns (dmatrix, info) như `lgb_dataset`."""
+    import xgboost as xgb
+
+    def make_key():
+        return fingerprint([X, y, weight], kind="xgb", version=xgb.__version__)
+
+    def build():
+        return xgb.DMatrix(X, label=y, weight=weight, nthread=n_jobs or 0)
+
+    def load(path: Path):
+        dmatrix = xgb.DMatrix(str(path), nthread=n_jobs or 0)
+        if dmatrix.num_row() != len(y):
+            raise ValueError(f"{dmatrix.num_row()} rows, expected {len(y)}")
+        return dmatrix
+
+    return _cached("xgb", make_key, build, lambda d, path: d.save_binary(str(path), silent=True), load, cache_dir, enabled)
+
+
+def clear_memory():
+    """Bỏ các dataset đang giữ trong process (file cache không đổi)."""
+    _MEMORY.clear()
@@ -5,12 +5,15 @@
 
 import os
 import random
+import time
 from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
 import joblib
 import pandas as pd
 import numpy as np
 from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import StandardScaler, LabelEncoder
+import xgboost as xgb
 from xgboost import XGBClassifier
 from sklearn.metrics import (
     classification_report,
@@ -22,6 +25,15 @@ from sklearn.metrics import (
 from sklearn.utils.class_weight import compute_class_weight
 import mlflow
 
+try:
+    from src.binned_cache import xgb_dmatrix
+    from src.dataset_cache import label_strings, load_training_frame, read_parquet_columns
+    from src.out_of_core import ParquetChunks, holdout_rows
+except ImportError:
+    from binned_cache import xgb_dmatrix
+    from dataset_cache import label_strings, load_training_frame, read_parquet_columns
+    from out_of_core import ParquetChunks, holdout_rows
+
 SEED = 42
 
 
@@ -31,30 +43,11 @@ def set_seed(seed: int = SEED):
     os.environ["PYTHONHASHSEED"] = str(seed)
 
 
-set_seed()
-
 # Resolve paths relative to repository root to avoid CWD issues (Docker/local)
 ROOT = Path(__file__).resolve().parent
 BASE_CSV = ROOT / "data" / "EV_Predictive_Maintenance_Dataset_15min.csv"
 PARQUET_IF = ROOT.parent / "data" / "features_with_anomaly.parquet"
 MODEL_DIR = ROOT.parent / "models" / "classifier"
-MODEL_DIR.mkdir(parents=True, exist_ok=True)
-
-# Load data: prefer annotated parquet (contains IF_Anomaly)
-if PARQUET_IF.exists():
-    df = pd.read_parquet(PARQUET_IF)
-    print("Loaded annotated data:", PARQUET_IF)
-else:
-    df = pd.read_csv(BASE_CSV)
-    print("Loaded CSV:", BASE_CSV)
-
-# Determine label: prefer Maintenance_Type -> else Anomaly -> else IF_Anomaly
-label_candidates = ["Maintenance_Type", "Anomaly", "IF_Anomaly"]
-label_col = next((c for c in label_candidates if c in df.columns), None)
-if label_col is None:
-    raise RuntimeError("No suitable label found for classifier. Expected Maintenance_Type or Anomaly or IF_Anomaly.")
-
-print("Training classifier using label:", label_col)
 
 # Features to use (numeric list)
 FEATURES = [
@@ -66,47 +59,11 @@ FEATURES = [
     "Distance_Traveled", "Idle_Time", "Route_Roughness", "Component_Health_Score",
     "Failure_Probability", "TTF"
 ]
-features = [c for c in FEATURES if c in df.columns]
-if not features:
-    raise RuntimeError("No numeric features available for classifier.")
-
-X = df[features].fillna(0.0).astype(float)
-y_raw = df[label_col].copy()
-
-# If label is Maintenance_Type (likely string), encode it
-label_encoder = None
-if y_raw.dtype == object or not np.issubdtype(y_raw.dtype, np.number):
-    label_encoder = LabelEncoder()
-    y = label_encoder.fit_transform(y_raw.astype(str))
-else:
-    y = y_raw.astype(int).values
-
-# Keep track of what value is 'normal' (most frequent label) — treat as non-fault
-unique, counts = np.unique(y, return_counts=True)
-normal_label = unique[np.argmax(counts)]
-print("Inferred normal label (most frequent class) ->", normal_label)
-
-# Split and scale
-scaler = StandardScaler()
-Xs = scaler.fit_transform(X)
-Xtr, Xte, ytr, yte = train_test_split(
-    Xs,
-    y,
-    test_size=0.2,
-    random_state=SEED,
-    stratify=y if len(np.unique(y)) > 1 else None
-)
-
-# Handle class imbalance with class weights (only if >1 class)
-sample_weight = None
-if len(np.unique(ytr)) > 1:
-    class_weights = compute_class_weight(class_weight="balanced", classes=np.unique(ytr), y=ytr)
-    weight_map = {cls: w for cls, w in zip(np.unique(ytr), class_weights)}
-    sample_weight = np.array([weight_map[label] for label in ytr])
-    print("Computed class weights:", weight_map)
+LABEL_CANDIDATES = ["Maintenance_Type", "Anomaly", "IF_Anomaly"]
+COLUMNS = FEATURES + LABEL_CANDIDATES
 
-# Train a fast XGBoost classifier
-clf_params = {
+TEST_SIZE = 0.2
+CLF_PARAMS = {
     "n_estimators": 150,
     "max_depth": 4,
     "learning_rate": 0.12,
@@ -116,60 +73,322 @@ clf_params = {
     "tree_method": "hist",
     "random_state": SEED
 }
-clf = XGBClassifier(**clf_params)
-clf.fit(Xtr, ytr, sample_weight=sample_weight)
-
-pred = clf.predict(Xte)
-acc = accuracy_score(yte, pred)
-report = classification_report(yte, pred, zero_division=1, output_dict=True)
-macro_f1 = report.get("macro avg", {}).get("f1-score", 0.0)
-
-# Fault recall (treat anything != normal_label as fault)
-fault_mask = yte != normal_label
-fault_recall = None
-if fault_mask.any():
-    fault_recall = recall_score(
-        (yte != normal_label).astype(int),
-        (pred != normal_label).astype(int),
-        zero_division=0
+
+
+def load_data() -> pd.DataFrame:
+    """Load data (chỉ các cột cần dùng): prefer annotated parquet (contains IF_Anomaly)."""
+    if PARQUET_IF.exists():
+        df = read_parquet_columns(PARQUET_IF, COLUMNS)
+        print("Loaded annotated data:", PARQUET_IF)
+    else:
+        df = load_training_frame(COLUMNS, csv=BASE_CSV)
+    return df
+
+
+def classifier_labels(df: pd.DataFrame) -> Tuple[str, np.ndarray, Optional[LabelEncoder]]:
+    """
+    Label của classifier (không cần fit model): label_col, y đã encode, label_encoder
+    (None nếu label đã là số). RUL chỉ cần label_col / label_encoder nên pipeline
+    gọi hàm này để chạy RUL song song với classifier.
+    """
+    # Determine label: prefer Maintenance_Type -> else Anomaly -> else IF_Anomaly
+    label_col = next((c for c in LABEL_CANDIDATES if c in df.columns), None)
+    if label_col is None:
+        raise RuntimeError("No suitable label found for classifier. Expected Maintenance_Type or Anomaly or IF_Anomaly.")
+
+    y_raw = df[label_col].copy()
+
+    # If label is Maintenance_Type (likely string / category), encode it
+    label_encoder = None
+    if not pd.api.types.is_numeric_dtype(y_raw) or pd.api.types.is_bool_dtype(y_raw):
+        label_encoder = LabelEncoder()
+        y = label_encoder.fit_transform(label_strings(y_raw))
+    else:
+        y = y_raw.astype(int).values
+    return label_col, y, label_encoder
+
+
+def train_classifier(df: pd.DataFrame, model_dir: Path = MODEL_DIR, n_jobs: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Train XGBoost classifier trên `df` (không sửa `df`), lưu artifacts vào
+    `model_dir` và log run "classifier" lên MLflow.
+
+    Args:
+        n_jobs: số thread XGBoost (None = mặc định của XGBoost)
+
+    Returns:
+        dict gồm label_col, label_encoder (None nếu label đã là số), normal_label
+        (cho RUL) và metrics
+    """
+    set_seed()
+
+    label_col, y, label_encoder = classifier_labels(df)
+
+    print("Training classifier using label:", label_col)
+
+    features = [c for c in FEATURES if c in df.columns]
+    if not features:
+        raise RuntimeError("No numeric features available for classifier.")
+
+    X = df[features].fillna(0.0).astype(float)
+
+    # Keep track of what value is 'normal' (most frequent label) — treat as non-fault
+    unique, counts = np.unique(y, return_counts=True)
+    normal_label = unique[np.argmax(counts)]
+    print("Inferred normal label (most frequent class) ->", normal_label)
+
+    # Split and scale
+    scaler = StandardScaler()
+    Xs = scaler.fit_transform(X)
+    Xtr, Xte, ytr, yte = train_test_split(
+        Xs,
+        y,
+        test_size=TEST_SIZE,
+        random_state=SEED,
+        stratify=y if len(np.unique(y)) > 1 else None
     )
 
-print("Classifier accuracy:", acc)
-print(classification_report(yte, pred, zero_division=1))
-
-# Save artifacts: model, scaler, features, label encoder, normal_label
-joblib.dump(clf, os.path.join(MODEL_DIR, "classifier.joblib"))
-joblib.dump(scaler, os.path.join(MODEL_DIR, "scaler.joblib"))
-joblib.dump(features, os.path.join(MODEL_DIR, "features.joblib"))
-joblib.dump(label_col, os.path.join(MODEL_DIR, "label_col.joblib"))
-joblib.dump(normal_label, os.path.join(MODEL_DIR, "normal_label.joblib"))
-if label_encoder is not None:
-    joblib.dump(label_encoder, os.path.join(MODEL_DIR, "label_encoder.joblib"))
-
-print("Saved classifier artifacts to", MODEL_DIR)
-
-# Persist diagnostics
-conf_mat = confusion_matrix(yte, pred)
-cm_path = os.path.join(MODEL_DIR, "confusion_matrix_classifier.csv")
-pd.DataFrame(conf_mat).to_csv(cm_path, index=False)
-
-# MLflow logging
-mlflow.set_tracking_uri(os.getenv("MLFLOW_TRACKING_URI", "http://localhost:6969"))
-mlflow.set_experiment(os.getenv("MLFLOW_EXPERIMENT", "predictive-maintenance"))
-with mlflow.start_run(run_name="classifier"):
-    # Set tags for filtering in MLflow UI
-    dataset_name = BASE_CSV.stem  # e.g., "EV_Predictive_Maintenance_Dataset_15min"
-    mlflow.set_tag("dataset", dataset_name)
-    mlflow.set_tag("model", "XGBoost")
-    
-    mlflow.log_params({
-        **clf_params,
-        "feature_count": len(features),
-        "label_col": label_col
-    })
-    mlflow.log_metrics({
+    # Handle class imbalance with class weights (only if >1 class)
+    weight_map = class_weight_map(ytr)
+    sample_weight = None
+    if weight_map is not None:
+        sample_weight = np.array([weight_map[label] for label in ytr])
+
+    # Train a fast XGBoost classifier (DMatrix của tập train qua cache, src/binned_cache.py)
+    dtrain, dataset_info = xgb_dmatrix(Xtr, ytr, sample_weight, n_jobs)
+    started = time.perf_counter()
+    booster = xgb.train(booster_params(len(np.unique(ytr)), n_jobs), dtrain, num_boost_round=CLF_PARAMS["n_estimators"])
+    clf = _as_classifier(booster, n_jobs)
+    fit_seconds = time.perf_counter() - started
+    print(f"⏱️ Classifier dataset {dataset_info['seconds']:.2f}s ({dataset_info['source']}), fit {fit_seconds:.2f}s")
+
+    pred = clf.predict(Xte)
+    metrics, conf_mat = classifier_metrics(yte, pred, normal_label)
+    _save_and_log(clf, scaler, features, label_col, normal_label, label_encoder, metrics, conf_mat, Path(model_dir),
+                  extra_params={"dataset_cache": dataset_info["source"]},
+                  extra_metrics={"dataset_seconds": dataset_info["seconds"], "fit_seconds": fit_seconds})
+
+    return {
+        "label_col": label_col,
+        "label_encoder": label_encoder,
+        "normal_label": normal_label,
+        "metrics": metrics
+    }
+
+
+def booster_params(n_classes: int, n_jobs: Optional[int] = None, **overrides) -> Dict[str, Any]:
+    """Params của `xgb.train` tương ứng `XGBClassifier(**CLF_PARAMS)` (+ `overrides`, vd. trong search)."""
+    params = XGBClassifier(**{**CLF_PARAMS, **overrides}, n_jobs=n_jobs).get_xgb_params()
+    if n_classes > 2:
+        params.update(objective="multi:softprob", num_class=n_classes)
+    return params
+
+
+def _as_classifier(booster: xgb.Booster, n_jobs: Optional[int]) -> XGBClassifier:
+    """Booster train bằng `xgb.train` -> XGBClassifier (artifact như `fit`: predict_proba, get_booster)."""
+    clf = XGBClassifier(**CLF_PARAMS, n_jobs=n_jobs)
+    clf.load_model(bytearray(booster.save_raw("json")))
+    return clf
+
+
+def classifier_labels_chunked(chunks: ParquetChunks) -> Tuple[str, np.ndarray, Optional[LabelEncoder]]:
+    """
+    `classifier_labels` cho out-of-core: chỉ đọc cột label, hai lượt nếu label là
+    chuỗi (lấy classes rồi encode). y là int32 theo thứ tự dòng của `chunks`.
+    """
+    label_col = next((c for c in LABEL_CANDIDATES if c in chunks.available), None)
+    if label_col is None:
+        raise RuntimeError("No suitable label found for classifier. Expected Maintenance_Type or Anomaly or IF_Anomaly.")
+
+    y_raw = chunks.read(0, [label_col])[label_col] if len(chunks) else pd.Series(dtype=float)
+    label_encoder = None
+    if not pd.api.types.is_numeric_dtype(y_raw) or pd.api.types.is_bool_dtype(y_raw):
+        classes = set()
+        for _, chunk in chunks.iter_columns([label_col]):
+            classes.update(label_strings(chunk[label_col]).unique())
+        # fit trên classes đã sort = cùng classes_ như fit_transform trên toàn bộ label
+        label_encoder = LabelEncoder().fit(np.array(sorted(classes)))
+        parts = [label_encoder.transform(label_strings(chunk[label_col])).astype(np.int32)
+                 for _, chunk in chunks.iter_columns([label_col])]
+    else:
+        parts = [chunk[label_col].astype(np.int32).values for _, chunk in chunks.iter_columns([label_col])]
+    y = np.concatenate(parts) if parts else np.empty(0, dtype=np.int32)
+    return label_col, y, label_encoder
+
+
+class _TrainChunks(xgb.DataIter):
+    """Train rows (đã scale, kèm label / weight) của từng chunk cho ExtMemQuantileDMatrix."""
+
+    def __init__(self, chunks: ParquetChunks, features, scaler, y, holdout, weight_map, cache_prefix: Path):
+        self.chunks = chunks
+        self.features = features
+        self.scaler = scaler
+        self.y = y
+        self.holdout = holdout
+        self.weight_map = weight_map
+        self._index = 0
+        super().__init__(cache_prefix=str(cache_prefix), release_data=True)
+
+    def next(self, input_data) -> bool:
+        while self._index < len(self.chunks):
+            index = self._index
+            self._index += 1
+            start, stop = self.chunks.bounds(index)
+            train = ~self.holdout[start:stop]
+            if not train.any():
+                continue
+            chunk = self.chunks.read(index, self.features)
+            Xs = self.scaler.transform(chunk[self.features].fillna(0.0).astype(float))[train]
+            ytr = self.y[start:stop][train]
+            weight = None
+            if self.weight_map is not None:
+                weight = np.array([self.weight_map[label] for label in ytr])
+            input_data(data=Xs, label=ytr, weight=weight)
+            return True
+        return False
+
+    def reset(self):
+        self._index = 0
+
+
+def train_classifier_chunked(
+    chunks: ParquetChunks,
+    work_dir: Path,
+    model_dir: Path = MODEL_DIR,
+    n_jobs: Optional[int] = None,
+    labels: Optional[Tuple[str, np.ndarray, Optional[LabelEncoder]]] = None
+) -> Dict[str, Any]:
+    """
+    Bản out-of-core của `train_classifier` (src/out_of_core.py): scaler
+    `partial_fit` theo chunk, XGBoost train từ `ExtMemQuantileDMatrix` (cache
+    trang dữ liệu trong `work_dir`), holdout đánh giá theo chunk.
+
+    Args:
+        labels: kết quả `classifier_labels_chunked` nếu đã tính (pipeline dùng chung với RUL)
+    """
+    set_seed()
+
+    label_col, y, label_encoder = labels or classifier_labels_chunked(chunks)
+
+    print("Training classifier using label:", label_col)
+
+    features = [c for c in FEATURES if c in chunks.columns]
+    if not features:
+        raise RuntimeError("No numeric features available for classifier.")
+
+    unique, counts = np.unique(y, return_counts=True)
+    normal_label = np.int64(unique[np.argmax(counts)])
+    print("Inferred normal label (most frequent class) ->", normal_label)
+
+    # Scaler fit trên toàn bộ dòng (như in-memory), split cố định theo chunk
+    scaler = StandardScaler()
+    for _, chunk in chunks.iter_columns(features):
+        scaler.partial_fit(chunk[features].fillna(0.0).astype(float))
+    holdout = holdout_rows(chunks, TEST_SIZE, SEED)
+    ytr = y[~holdout]
+    weight_map = class_weight_map(ytr)
+
+    params = booster_params(len(np.unique(ytr)), n_jobs)
+    train_iter = _TrainChunks(chunks, features, scaler, y, holdout, weight_map, Path(work_dir) / "xgb_classifier")
+    dtrain = xgb.ExtMemQuantileDMatrix(train_iter, nthread=n_jobs or 0)
+    booster = xgb.train(params, dtrain, num_boost_round=CLF_PARAMS["n_estimators"])
+    del dtrain
+
+    clf = _as_classifier(booster, n_jobs)
+
+    preds = []
+    for index, chunk in chunks.iter_columns(features):
+        start, stop = chunks.bounds(index)
+        mask = holdout[start:stop]
+        if mask.any():
+            preds.append(clf.predict(scaler.transform(chunk[features].fillna(0.0).astype(float))[mask]))
+    pred = np.concatenate(preds) if preds else np.empty(0, dtype=y.dtype)
+    metrics, conf_mat = classifier_metrics(y[holdout], pred, normal_label)
+    _save_and_log(clf, scaler, features, label_col, normal_label, label_encoder, metrics, conf_mat, Path(model_dir),
+                  extra_params={"out_of_core": True})
+
+    return {
+        "label_col": label_col,
+        "label_encoder": label_encoder,
+        "normal_label": normal_label,
+        "metrics": metrics
+    }
+
+
+def class_weight_map(ytr: np.ndarray) -> Optional[Dict[Any, float]]:
+    """Class weights "balanced" theo label của tập train (None nếu chỉ có một class)."""
+    if len(np.unique(ytr)) <= 1:
+        return None
+    class_weights = compute_class_weight(class_weight="balanced", classes=np.unique(ytr), y=ytr)
+    weight_map = {cls: w for cls, w in zip(np.unique(ytr), class_weights)}
+    print("Computed class weights:", weight_map)
+    return weight_map
+
+
+def classifier_metrics(yte: np.ndarray, pred: np.ndarray, normal_label) -> Tuple[Dict[str, float], np.ndarray]:
+    """accuracy, macro F1, fault recall (label != normal_label là fault) + confusion matrix trên holdout."""
+    acc = accuracy_score(yte, pred)
+    report = classification_report(yte, pred, zero_division=1, output_dict=True)
+    macro_f1 = report.get("macro avg", {}).get("f1-score", 0.0)
+
+    # Fault recall (treat anything != normal_label as fault)
+    fault_mask = yte != normal_label
+    fault_recall = None
+    if fault_mask.any():
+        fault_recall = recall_score(
+            (yte != normal_label).astype(int),
+            (pred != normal_label).astype(int),
+            zero_division=0
+        )
+
+    print("Classifier accuracy:", acc)
+    print(classification_report(yte, pred, zero_division=1))
+
+    metrics = {
         "accuracy": acc,
         "macro_f1": macro_f1,
         "fault_recall": fault_recall if fault_recall is not None else 0.0
-    })
-    mlflow.log_artifact(cm_path)
+    }
+    return metrics, confusion_matrix(yte, pred)
+
+
+def _save_and_log(clf, scaler, features, label_col, normal_label, label_encoder, metrics, conf_mat,
+                  model_dir: Path, extra_params: Optional[Dict] = None, extra_metrics: Optional[Dict] = None):
+    model_dir.mkdir(parents=True, exist_ok=True)
+
+    # Save artifacts: model, scaler, features, label encoder, normal_label
+    joblib.dump(clf, os.path.join(model_dir, "classifier.joblib"))
+    joblib.dump(scaler, os.path.join(model_dir, "scaler.joblib"))
+    joblib.dump(features, os.path.join(model_dir, "features.joblib"))
+    joblib.dump(label_col, os.path.join(model_dir, "label_col.joblib"))
+    joblib.dump(normal_label, os.path.join(model_dir, "normal_label.joblib"))
+    if label_encoder is not None:
+        joblib.dump(label_encoder, os.path.join(model_dir, "label_encoder.joblib"))
+
+    print("Saved classifier artifacts to", model_dir)
+
+    # Persist diagnostics
+    cm_path = os.path.join(model_dir, "confusion_matrix_classifier.csv")
+    pd.DataFrame(conf_mat).to_csv(cm_path, index=False)
+
+    # MLflow logging (nested khi chạy trong run của pipeline)
+    mlflow.set_tracking_uri(os.getenv("MLFLOW_TRACKING_URI", "http://localhost:6969"))
+    mlflow.set_experiment(os.getenv("MLFLOW_EXPERIMENT", "predictive-maintenance"))
+    with mlflow.start_run(run_name="classifier", nested=mlflow.active_run() is not None):
+        # Set tags for filtering in MLflow UI
+        dataset_name = BASE_CSV.stem  # e.g., "EV_Predictive_Maintenance_Dataset_15min"
+        mlflow.set_tag("dataset", dataset_name)
+        mlflow.set_tag("model", "XGBoost")
+
+        mlflow.log_params({
+            **CLF_PARAMS,
+            "feature_count": len(features),
+            "label_col": label_col,
+            **(extra_params or {})
+        })
+        mlflow.log_metrics({**metrics, **(extra_metrics or {})})
+        mlflow.log_artifact(cm_path)
+
+
+if __name__ == "__main__":
+    train_classifier(load_data())
@@ -0,0 +1,279 @@
+"""
+Cache Parquet có kiểu cho dataset training.
+
+`pd.read_csv` đọc mọi cột của CSV thành float64 / object rồi mỗi trainer chỉ
+dùng một phần. Dataset được chuyển một lần sang Parquet (cột float -> float32,
+cột int thu nhỏ, cột chuỗi -> category) và trainers chỉ đọc các cột cần dùng
+(`load_columns`). Cache gắn với SHA-256 của CSV nguồn (lưu trong metadata của
+file Parquet): CSV đổi thì cache được build lại; size + mtime trùng thì không
+cần hash lại.
+
+Cache được build theo chunk (một lượt suy kiểu cột, một lượt ghi) nên CSV lớn
+hơn RAM vẫn build được; mỗi chunk là một row group, đơn vị đọc của training
+out-of-core (src/out_of_core.py).
+
+| Env | Mặc định | Ý nghĩa |
+|-----|----------|---------|
+| `TRAIN_DATASET_CACHE` | `true` | Pipeline đọc dataset qua cache (`false` = `pd.read_csv` như cũ) |
+| `DATASET_CACHE_DIR` | `data/cache` | Thư mục cache |
+| `DATASET_CACHE_FLOAT_DTYPE` | `float32` | Kiểu của cột số thực (`float64` = giữ nguyên giá trị CSV) |
+| `DATASET_CACHE_ROW_GROUP_ROWS` | `131072` | Số dòng mỗi chunk khi build / row group của file Parquet |
+
+Usage:
+    python src/dataset_cache.py [--csv path.csv] [--force]    # build / kiểm tra cache
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parent
+CSV = ROOT / "data" / "EV_Predictive_Maintenance_Dataset_15min.csv"
+CACHE_DIR = Path(os.getenv("DATASET_CACHE_DIR", str(ROOT.parent / "data" / "cache")))
+FLOAT_DTYPE = os.getenv("DATASET_CACHE_FLOAT_DTYPE", "float32")
+USE_CACHE = os.getenv("TRAIN_DATASET_CACHE", "true").lower() == "true"
+ROW_GROUP_ROWS = int(os.getenv("DATASET_CACHE_ROW_GROUP_ROWS", "131072"))
+
+# Tăng khi cách chuyển kiểu thay đổi (cache cũ bị build lại)
+CACHE_FORMAT_VERSION = 2
+METADATA_KEY = b"ev_dataset_cache"
+
+
+def file_sha256(path: Path, chunk_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cache_path_for(csv: Path, cache_dir: Path = CACHE_DIR) -> Path:
+    return Path(cache_dir) / f"{Path(csv).stem}.parquet"
+
+
+def read_cache_metadata(cache_path: Path) -> Optional[Dict[str, Any]]:
+    """Metadata của cache (source hash, dtype, ...; key-value của file Parquet); None nếu chưa có / không đọc được."""
+    import pyarrow.parquet as pq
+
+    try:
+        metadata = pq.read_metadata(cache_path).metadata or {}
+        return json.loads(metadata[METADATA_KEY])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def _int_dtype(lo: int, hi: int) -> str:
+    """Kiểu int nhỏ nhất chứa được [lo, hi] (như `pd.to_numeric(downcast="integer")`)."""
+    for dtype in ("int8", "int16", "int32"):
+        info = np.iinfo(dtype)
+        if info.min <= lo and hi <= info.max:
+            return dtype
+    return "int64"
+
+
+def infer_column_types(csv: Path, chunk_rows: int = ROW_GROUP_ROWS) -> Dict[str, Dict[str, Any]]:
+    """
+    Một lượt đọc CSV theo chunk, suy ra kiểu của từng cột giống khi `pd.read_csv`
+    cả file: {"kind": "float" | "int" | "bool" | "str", "dtype": kiểu int thu nhỏ}.
+
+    Chunk toàn giá trị thiếu không quyết định kiểu; cột có giá trị thiếu không
+    thể là int / bool.
+    """
+    seen: Dict[str, Dict[str, Any]] = {}
+    for chunk in pd.read_csv(csv, chunksize=chunk_rows):
+        for name, col in chunk.items():
+            info = seen.setdefault(name, {"kinds": set(), "has_nan": False, "lo": None, "hi": None})
+            missing = col.isna()
+            info["has_nan"] = info["has_nan"] or bool(missing.any())
+            if missing.all():
+                continue
+            if pd.api.types.is_bool_dtype(col):
+                info["kinds"].add("bool")
+            elif pd.api.types.is_integer_dtype(col):
+                info["kinds"].add("int")
+                lo, hi = int(col.min()), int(col.max())
+                info["lo"] = lo if info["lo"] is None else min(info["lo"], lo)
+                info["hi"] = hi if info["hi"] is None else max(info["hi"], hi)
+            elif pd.api.types.is_float_dtype(col):
+                info["kinds"].add("float")
+            else:
+                info["kinds"].add("str")
+
+    types = {}
+    for name, info in seen.items():
+        kinds = info["kinds"]
+        if "str" in kinds or ("bool" in kinds and (kinds != {"bool"} or info["has_nan"])):
+            types[name] = {"kind": "str"}
+        elif kinds == {"bool"}:
+            types[name] = {"kind": "bool"}
+        elif kinds == {"int"} and not info["has_nan"]:
+            types[name] = {"kind": "int", "dtype": _int_dtype(info["lo"], info["hi"])}
+        else:
+            types[name] = {"kind": "float"}
+    return types
+
+
+def typed_chunk(df: pd.DataFrame, types: Dict[str, Dict[str, Any]], float_dtype: str = FLOAT_DTYPE) -> pd.DataFrame:
+    """float -> `float_dtype`, int -> kiểu thu nhỏ của cả file, chuỗi giữ nguyên (ghi thành dictionary)."""
+    columns = {}
+    for name, col in df.items():
+        kind = types[name]["kind"]
+        if kind == "float":
+            columns[name] = col.astype(float_dtype)
+        elif kind == "int":
+            columns[name] = col.astype(types[name]["dtype"])
+        else:
+            columns[name] = col
+    return pd.DataFrame(columns)
+
+
+def arrow_schema(types: Dict[str, Dict[str, Any]], float_dtype: str = FLOAT_DTYPE):
+    """Schema của cache: chuỗi -> dictionary (đọc lại thành category)."""
+    import pyarrow as pa
+
+    fields = []
+    for name, info in types.items():
+        if info["kind"] == "str":
+            fields.append(pa.field(name, pa.dictionary(pa.int32(), pa.string())))
+        elif info["kind"] == "bool":
+            fields.append(pa.field(name, pa.bool_()))
+        else:
+            dtype = float_dtype if info["kind"] == "float" else info["dtype"]
+            fields.append(pa.field(name, pa.from_numpy_dtype(np.dtype(dtype))))
+    return pa.schema(fields)
+
+
+def label_strings(series: pd.Series) -> pd.Series:
+    """
+    Label dạng chuỗi cho LabelEncoder, giá trị thiếu -> "None" bất kể cột là
+    object (CSV / parquet) hay category (cache).
+    """
+    return series.astype(object).where(series.notna(), "None").astype(str)
+
+
+def _source_info(csv: Path) -> Dict[str, Any]:
+    stat = csv.stat()
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def prepare_dataset(
+    csv: Path = CSV,
+    cache_dir: Path = CACHE_DIR,
+    float_dtype: str = FLOAT_DTYPE,
+    force: bool = False,
+    row_group_rows: int = ROW_GROUP_ROWS
+) -> Path:
+    """
+    Build cache cho `csv` nếu chưa có hoặc đã cũ; trả về path của file Parquet.
+
+    Cache còn dùng được khi format / dtype trùng và CSV có cùng size + mtime,
+    hoặc cùng SHA-256 (vd. file được copy lại với mtime mới).
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    csv = Path(csv)
+    cache_path = cache_path_for(csv, cache_dir)
+    source = _source_info(csv)
+    meta = None if force else read_cache_metadata(cache_path)
+    if meta is not None and meta.get("format") == CACHE_FORMAT_VERSION and meta.get("float_dtype") == float_dtype:
+        if meta.get("size") == source["size"] and meta.get("mtime_ns") == source["mtime_ns"]:
+            return cache_path
+        if meta.get("size") == source["size"] and meta.get("sha256") == file_sha256(csv):
+            return cache_path
+
+    started = time.perf_counter()
+    types = infer_column_types(csv, row_group_rows)
+    schema = arrow_schema(types, float_dtype)
+    # Đọc lại với dtype cố định: mọi chunk cùng kiểu, chuỗi giữ nguyên như khi đọc cả file
+    read_dtypes = {name: {"str": str, "bool": bool, "int": "int64"}.get(info["kind"], "float64")
+                   for name, info in types.items()}
+
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = cache_path.with_suffix(f".tmp{os.getpid()}")
+    rows = 0
+    with pq.ParquetWriter(tmp_path, schema) as writer:
+        for chunk in pd.read_csv(csv, chunksize=row_group_rows, dtype=read_dtypes):
+            chunk = typed_chunk(chunk, types, float_dtype)
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+            rows += len(chunk)
+        meta = {
+            "format": CACHE_FORMAT_VERSION,
+            "float_dtype": float_dtype,
+            "source": str(csv),
+            "sha256": file_sha256(csv),
+            "rows": rows,
+            **source,
+        }
+        writer.add_key_value_metadata({METADATA_KEY: json.dumps(meta)})
+    os.replace(tmp_path, cache_path)  # reader song song không thấy file ghi dở
+    print(f"✅ Dataset cache built: {cache_path} ({rows} rows, {len(types)} columns, "
+          f"{float_dtype}) in {time.perf_counter() - started:.2f}s")
+    return cache_path
+
+
+def read_parquet_columns(path: Path, columns: Optional[Iterable[str]] = None) -> pd.DataFrame:
+    """Chỉ đọc `columns` của file Parquet; cột không có trong file bị bỏ qua, None = mọi cột."""
+    import pyarrow.parquet as pq
+
+    if columns is not None:
+        available = set(pq.read_schema(path).names)
+        columns = [c for c in dict.fromkeys(columns) if c in available]
+    return pd.read_parquet(path, columns=columns)
+
+
+def load_columns(
+    columns: Optional[Iterable[str]] = None,
+    csv: Path = CSV,
+    cache_dir: Path = CACHE_DIR,
+    float_dtype: str = FLOAT_DTYPE
+) -> pd.DataFrame:
+    """Đọc `columns` từ cache (build nếu cần)."""
+    return read_parquet_columns(prepare_dataset(csv, cache_dir, float_dtype), columns)
+
+
+def load_training_frame(columns: Optional[Iterable[str]] = None, csv: Path = CSV) -> pd.DataFrame:
+    """
+    Dataset cho trainers: qua cache nếu `TRAIN_DATASET_CACHE`, nếu không thì
+    `pd.read_csv` toàn bộ như trước (giá trị thiếu của cột chuỗi -> None như
+    khi đọc lại parquet, để label encoder có cùng classes).
+    """
+    csv = Path(csv)
+    started = time.perf_counter()
+    if USE_CACHE:
+        df = load_columns(columns, csv)
+    else:
+        df = pd.read_csv(csv)
+        for col in df.columns[df.dtypes == object]:
+            df[col] = df[col].where(df[col].notna(), None)
+    print(f"Loaded {csv.name} ({'cache' if USE_CACHE else 'csv'}): {len(df)} rows x {len(df.columns)} columns, "
+          f"{df.memory_usage(deep=True).sum() / 1e6:.1f} MB in {time.perf_counter() - started:.2f}s")
+    return df
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--csv", default=str(CSV))
+    parser.add_argument("--cache-dir", default=str(CACHE_DIR))
+    parser.add_argument("--float-dtype", default=FLOAT_DTYPE, choices=["float32", "float64"])
+    parser.add_argument("--force", action="store_true", help="Build lại kể cả khi cache còn mới")
+    args = parser.parse_args()
+
+    cache_path = prepare_dataset(Path(args.csv), Path(args.cache_dir), args.float_dtype, force=args.force)
+    meta = read_cache_metadata(cache_path)
+    df = pd.read_parquet(cache_path)
+    print(f"📦 {cache_path}: {meta['rows']} rows, sha256 {meta['sha256'][:12]}…, "
+          f"{cache_path.stat().st_size / 1e6:.1f} MB on disk, "
+          f"{df.memory_usage(deep=True).sum() / 1e6:.1f} MB in memory")
+    print(df.dtypes.value_counts().to_string())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Feature layout dùng chung cho cả 3 models (anomaly, classifier, RUL).
+
+Được build một lần khi load models: tính union của `if_features`,
+`clf_features` và `rul_features`, parse mỗi payload thành một mảng float
+liên tục đúng một lần, rồi trả cho từng model một view theo index đã tính sẵn.
+"""
+
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Union
+
+import numpy as np
+
+Index = Union[slice, np.ndarray]
+
+
+class ParsedRows(NamedTuple):
+    """Kết quả parse: ma trận float và mask các ô không parse được (None nếu tất cả hợp lệ)."""
+    X: np.ndarray
+    invalid: Optional[np.ndarray] = None
+    errors: Optional[Dict[int, str]] = None
+
+
+def _as_index(positions: Sequence[int]) -> Index:
+    """Dùng slice (view, không copy) nếu các cột liền nhau, ngược lại dùng index array."""
+    positions = list(positions)
+    if positions and positions == list(range(positions[0], positions[0] + len(positions))):
+        return slice(positions[0], positions[0] + len(positions))
+    return np.asarray(positions, dtype=np.intp)
+
+
+class FeatureLayout:
+    """
+    Layout cột hợp nhất cho cascade anomaly -> classifier -> RUL.
+
+    Args:
+        if_features: features của Isolation Forest (isofeat.joblib)
+        clf_features: features của classifier (features.joblib)
+        rul_features: features của RUL model (rul_features.joblib)
+        label_col: cột label của classifier; trong RUL cột này được điền bằng
+            code dự đoán của classifier nên không bao giờ parse từ payload
+    """
+
+    def __init__(
+        self,
+        if_features: Optional[Sequence[str]],
+        clf_features: Optional[Sequence[str]],
+        rul_features: Optional[Sequence[str]],
+        label_col: Optional[str] = None
+    ):
+        self.if_features = list(if_features or [])
+        self.clf_features = list(clf_features or [])
+        self.rul_features = list(rul_features or [])
+        self.label_col = label_col
+
+        # Classifier trước (lớn nhất, thường trùng RUL) để view của nó là slice
+        parsed_rul = [f for f in self.rul_features if f != label_col]
+        self.columns: List[str] = list(dict.fromkeys(self.clf_features + parsed_rul + self.if_features))
+        position = {f: i for i, f in enumerate(self.columns)}
+
+        self.if_index = _as_index([position[f] for f in self.if_features])
+        self.clf_index = _as_index([position[f] for f in self.clf_features])
+        self.rul_index = np.asarray(
+            [position.get(f, 0) for f in self.rul_features], dtype=np.intp
+        )
+        self.rul_label_pos = (
+            self.rul_features.index(label_col)
+            if label_col and label_col in self.rul_features else None
+        )
+
+    @property
+    def width(self) -> int:
+        return len(self.columns)
+
+    def parse(self, rows: List[Dict[str, Any]]) -> ParsedRows:
+        """
+        Parse payloads thành ma trận C-contiguous (n_rows x width), missing -> 0.
+
+        Giá trị không phải số không làm fail cả batch: ô đó thành NaN và được
+        đánh dấu trong `invalid`, để mỗi stage tự quyết định xử lý như trước
+        (anomaly -> lỗi 500, classifier/RUL -> lỗi riêng của dòng đó).
+        """
+        columns = self.columns
+        try:
+            flat = [float(get(f, 0)) for get in (r.get for r in rows) for f in columns]
+            return ParsedRows(np.array(flat, dtype=float).reshape(len(rows), len(columns)))
+        except (TypeError, ValueError):
+            return self._parse_slow(rows)
+
+    def _parse_slow(self, rows: List[Dict[str, Any]]) -> ParsedRows:
+        X = np.empty((len(rows), self.width), dtype=float)
+        invalid = np.zeros(X.shape, dtype=bool)
+        errors: Dict[int, str] = {}
+        for i, row in enumerate(rows):
+            for j, f in enumerate(self.columns):
+                try:
+                    X[i, j] = float(row.get(f, 0))
+                except (TypeError, ValueError) as e:
+                    X[i, j] = np.nan
+                    invalid[i, j] = True
+                    errors.setdefault(i, str(e))
+        return ParsedRows(X, invalid, errors)
+
+    def invalid_rows(self, parsed: ParsedRows, stage: str) -> Optional[np.ndarray]:
+        """Mask theo dòng: dòng nào có feature không hợp lệ cho `stage` (anomaly/classifier/rul)."""
+        if parsed.invalid is None:
+            return None
+        index = {"anomaly": self.if_index, "classifier": self.clf_index}.get(stage)
+        if index is None:
+            index = self.rul_index if self.rul_label_pos is None else np.delete(self.rul_index, self.rul_label_pos)
+        return parsed.invalid[:, index].any(axis=1)
+
+    def anomaly(self, X: np.ndarray) -> np.ndarray:
+        return X[:, self.if_index]
+
+    def classifier(self, X: np.ndarray) -> np.ndarray:
+        return X[:, self.clf_index]
+
+    def rul(self, X: np.ndarray, codes: Optional[np.ndarray] = None) -> np.ndarray:
+        """Ma trận RUL (luôn là copy), cột label được điền bằng code của classifier."""
+        x_rul = X[:, self.rul_index]
+        if self.rul_label_pos is not None:
+            x_rul[:, self.rul_label_pos] = codes if codes is not None else 0.0
+        return x_rul
@@ -0,0 +1,148 @@
+"""
+Fused scaler + model cho hot path của inference.
+
+`StandardScaler.transform` rồi `model.predict` cấp phát ma trận trung gian ở
+mỗi request (copy feature view, copy để scale, validation của sklearn).
+`FusedPipeline` chép feature view thẳng vào một buffer dựng sẵn (theo thread),
+scale in-place với đúng phép tính của `StandardScaler.transform`
+(`X -= mean_; X /= scale_`) rồi gọi model trên buffer đó.
+
+Fold scaling vào threshold của cây không bit-compatible: sklearn/XGBoost ép
+input *đã scale* về float32 trước khi so sánh, nên ngưỡng tương đương trên
+input gốc lệch ở sát biên. Vì vậy ở đây giữ nguyên phép scale, chỉ bỏ cấp phát.
+"""
+
+import threading
+from typing import Optional, Union
+
+import numpy as np
+
+Index = Union[slice, np.ndarray]
+
+
+def _is_standard_scaler(scaler) -> bool:
+    return (
+        scaler is not None
+        and hasattr(scaler, "with_mean")
+        and hasattr(scaler, "with_std")
+        and (not scaler.with_mean or getattr(scaler, "mean_", None) is not None)
+        and (not scaler.with_std or getattr(scaler, "scale_", None) is not None)
+    )
+
+
+class FusedPipeline:
+    """
+    Scaler + model với buffer dựng sẵn.
+
+    Args:
+        scaler: StandardScaler đã fit (scaler.joblib)
+        model: model có `predict` (IsolationForest, XGBClassifier, ...)
+        index: cột của model trong ma trận đã parse (xem `FeatureLayout`)
+        name: tên dùng khi log
+    """
+
+    def __init__(self, scaler, model, index: Index, name: str = "model"):
+        self.scaler = scaler
+        self.model = model
+        self.index = index
+        self.name = name
+        self.n_features = (
+            index.stop - index.start if isinstance(index, slice) else len(index)
+        )
+        self.mean = None
+        self.scale = None
+        self.fused = _is_standard_scaler(scaler)
+        if self.fused:
+            if scaler.with_mean:
+                self.mean = np.ascontiguousarray(scaler.mean_, dtype=float)
+            if scaler.with_std:
+                self.scale = np.ascontiguousarray(scaler.scale_, dtype=float)
+        self._local = threading.local()
+
+    def _buffer(self, n_rows: int) -> np.ndarray:
+        buf = getattr(self._local, "buf", None)
+        if buf is None or buf.shape[0] < n_rows:
+            # Grow theo lũy thừa 2 để batch kích thước thay đổi không realloc liên tục
+            capacity = 1 << max(0, int(n_rows - 1).bit_length())
+            buf = np.empty((capacity, self.n_features), dtype=float)
+            self._local.buf = buf
+        return buf[:n_rows]
+
+    def transform(self, X: np.ndarray) -> np.ndarray:
+        """
+        Scale các cột `index` của X.
+
+        Kết quả là view vào buffer của thread hiện tại, chỉ hợp lệ tới lần gọi
+        `transform`/`predict` tiếp theo trên cùng thread.
+        """
+        if not self.fused:
+            return self.scaler.transform(X[:, self.index])
+
+        out = self._buffer(X.shape[0])
+        if isinstance(self.index, slice):
+            np.copyto(out, X[:, self.index])
+        else:
+            np.take(X, self.index, axis=1, out=out, mode="clip")
+        if self.mean is not None:
+            out -= self.mean
+        if self.scale is not None:
+            out /= self.scale
+        return out
+
+    def predict(self, X: np.ndarray) -> Optional[np.ndarray]:
+        """Predict trên các dòng của X, luôn trả về mảng 1D (hoặc None nếu model không gọi được)."""
+        Xs = self.transform(X)
+        model = self.model
+        if hasattr(model, "predict"):
+            pred = model.predict(Xs)
+        elif callable(model):
+            pred = model(Xs)
+        else:
+            return None
+        return np.asarray(pred).reshape(-1)
+
+    def verify(self, n_rows: int = 64, seed: int = 0) -> bool:
+        """
+        Parity check với đường cũ (`scaler.transform` rồi `model.predict`).
+
+        So sánh bit-by-bit cả input đã scale lẫn prediction trên các dòng sinh
+        quanh phân phối training; nếu lệch thì tắt fused và dùng lại đường cũ.
+        """
+        if not self.fused:
+            return False
+        rng = np.random.default_rng(seed)
+        width = (
+            self.index.stop if isinstance(self.index, slice)
+            else int(np.max(self.index)) + 1 if len(self.index) else 0
+        )
+        X = rng.normal(size=(n_rows, width))
+        center = self.mean if self.mean is not None else 0.0
+        spread = self.scale if self.scale is not None else 1.0
+        X[:, self.index] = X[:, self.index] * spread * 3 + center
+
+        try:
+            expected_X = self.scaler.transform(X[:, self.index])
+            expected = np.asarray(self.model.predict(expected_X)).reshape(-1)
+            ok = (
+                np.array_equal(self.transform(X), expected_X)
+                and np.array_equal(self.predict(X), expected)
+                and np.array_equal(self.predict(X[:1]), expected[:1])
+            )
+        except Exception as e:
+            print(f"⚠️ Fused {self.name} pipeline check failed: {e}")
+            ok = False
+
+        if not ok:
+            print(f"⚠️ Fused {self.name} pipeline is not bit-compatible, using scaler.transform path")
+            self.fused = False
+        return ok
+
+
+def build_pipeline(scaler, model, index: Index, name: str) -> Optional[FusedPipeline]:
+    """Build + verify pipeline cho một stage; None nếu thiếu scaler hoặc model."""
+    if scaler is None or model is None:
+        return None
+    pipeline = FusedPipeline(scaler, model, index, name=name)
+    if pipeline.verify():
+        print(f"✅ Fused {name} scaler+model pipeline (parity verified)")
+    return pipeline
@@ -1,54 +1,97 @@
 import os
 import time
+import asyncio
 import socket
-import joblib
+import hmac
 import numpy as np
-import subprocess
 import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
 from datetime import datetime
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Query, Request
 from fastapi.responses import Response, JSONResponse
+from starlette.routing import Match
 from pydantic import BaseModel
-from typing import Dict, Any, List, Optional
-from confluent_kafka import Producer
-import mlflow
-from src.mlflow_utils import (
-    load_model_from_registry,
-    get_model_info,
-    MODEL_NAMES
-)
+from typing import Dict, Any, List, Optional, Tuple
+# joblib, mlflow (src.mlflow_utils), confluent_kafka và sklearn/xgboost/lightgbm
+# được import lazy khi load models / khởi tạo Kafka trong startup hook,
+# không phải lúc import module (xem scripts/bench_startup.py)
+from src.mlflow_lite import MODEL_NAMES, get_latest_version_info, load_model_dir
+from src.micro_batcher import BatcherStopped, MicroBatcher
+from src.alert_producer import DEFAULT_PRODUCER_CONFIG, AlertProducer
+from src.alert_schema import ALERT_ENCODINGS, VEHICLE_KEY_FIELDS, alert_headers, encode_alert, vehicle_key
+from src.feature_layout import FeatureLayout
+from src.fused_pipeline import build_pipeline
+from src.tree_compiler import compile_model, select_backend
+from src.onnx_backend import ONNX_FILES, load_onnx_predictor
+from src.model_bundle import ModelBundle, ModelStore
+from src.model_cache import ModelCache
+from src.training_job import run_training
+from src.training_state import TrainingState
 
 # =======================
 # MONITORING
 # =======================
 from prometheus_client import (
     Counter,
-    Histogram,
-    generate_latest,
-    CONTENT_TYPE_LATEST
+    Histogram
 )
+from src.metrics import render_latest
+from src.profiling import SORT_KEYS, RequestProfiler, StackSampler
 
 # ============================================================
 # ----------------------- LOAD MODELS -------------------------
 # ============================================================
 
+PROCESS_START = time.time()  # mốc cho inference_startup_seconds (sau imports)
+
 # MLflow configuration
 MLFLOW_TRACKING_URI = os.getenv("MLFLOW_TRACKING_URI", "http://mlflow:6969")
 MLFLOW_MODEL_STAGE = os.getenv("MLFLOW_MODEL_STAGE", "Production")  # Production, Staging, or None for local
 USE_MLFLOW_REGISTRY = os.getenv("USE_MLFLOW_REGISTRY", "true").lower() == "true"
 
-# Model info from registry
-model_info = {
-    "anomaly": None,
-    "classifier": None,
-    "rul": None
-}
+# Tree inference backend: "native" (sklearn/xgboost/lightgbm), "compiled" (NumPy node arrays)
+# hoặc "onnx" (ONNX Runtime CPU, cần file .onnx export lúc training)
+# Có thể chọn riêng từng model: TREE_BACKEND_ANOMALY, TREE_BACKEND_CLASSIFIER, TREE_BACKEND_RUL
+TREE_BACKEND = os.getenv("TREE_BACKEND", "native").lower()
+TREE_COMPILED_MAX_ROWS = int(os.getenv("TREE_COMPILED_MAX_ROWS", "32"))
+
+def tree_backend(model_name: str) -> str:
+    return os.getenv(f"TREE_BACKEND_{model_name.upper()}", TREE_BACKEND).lower()
+
+# Local model cache (registry name + version -> model + companion artifacts), LRU theo dung lượng
+MODEL_CACHE_DIR = os.getenv("MODEL_CACHE_DIR", ".model_cache")
+MODEL_CACHE_MAX_MB = int(os.getenv("MODEL_CACHE_MAX_MB", "2048"))
+MODEL_CACHE_ENABLED = os.getenv("MODEL_CACHE_ENABLED", "true").lower() == "true"
+
+model_cache = None
+if MODEL_CACHE_ENABLED and USE_MLFLOW_REGISTRY:
+    try:
+        model_cache = ModelCache(MODEL_CACHE_DIR, max_bytes=MODEL_CACHE_MAX_MB * 1024 * 1024)
+    except OSError as e:
+        print(f"[WARN] Model cache disabled ({MODEL_CACHE_DIR}): {e}")
+
+# Startup: fetch 3 models song song (1 = tuần tự), warm-up với các batch size hay dùng
+# trước khi bundle được swap vào; MODEL_WARMUP_BATCH_SIZES="" để tắt warm-up
+MODEL_LOAD_WORKERS = int(os.getenv("MODEL_LOAD_WORKERS", "3"))
+MODEL_WARMUP_BATCH_SIZES = [int(b) for b in os.getenv("MODEL_WARMUP_BATCH_SIZES", "1,64").split(",") if b.strip()]
+MODEL_WARMUP_ROUNDS = int(os.getenv("MODEL_WARMUP_ROUNDS", "2"))
 
 def load_or_none(path):
     """Load model from local filesystem."""
-    return joblib.load(path) if os.path.exists(path) else None
+    if not os.path.exists(path):
+        return None
+    import joblib
+    return joblib.load(path)
 
-def load_model_with_fallback(model_name: str, local_path: str, model_type: str = "sklearn"):
+def _mlflow_utils():
+    """Import mlflow (qua src.mlflow_utils) chỉ khi thực sự cần: registry không qua REST, cache miss, flavor lạ."""
+    import mlflow
+    from src import mlflow_utils
+    mlflow.set_tracking_uri(MLFLOW_TRACKING_URI)
+    return mlflow_utils
+
+def load_model_with_fallback(model_name: str, local_path: str, model_type: str = "sklearn",
+                             model_info: Optional[Dict[str, Any]] = None):
     """
     Load model from MLflow Registry with fallback to local filesystem.
     
@@ -56,6 +99,7 @@ def load_model_with_fallback(model_name: str, local_path: str, model_type: str =
         model_name: Name of the model (anomaly, classifier, rul)
         local_path: Local path to model file
         model_type: Type of model (sklearn, xgboost, lightgbm)
+        model_info: Dict của bundle đang load, nhận registry info của model
     
     Returns:
         Loaded model or None
@@ -63,41 +107,17 @@ def load_model_with_fallback(model_name: str, local_path: str, model_type: str =
     # Try MLflow Registry first if enabled
     if USE_MLFLOW_REGISTRY and MLFLOW_MODEL_STAGE:
         try:
-            mlflow.set_tracking_uri(MLFLOW_TRACKING_URI)
-            model = load_model_from_registry(model_name, stage=MLFLOW_MODEL_STAGE)
-            print(f"✅ Loaded {model_name} from MLflow Registry (stage: {MLFLOW_MODEL_STAGE})")
+            mlflow_utils = _mlflow_utils()
             
-            # Get model info
-            info = get_model_info(model_name, stage=MLFLOW_MODEL_STAGE)
-            model_info[model_name] = info
+            # Get model info (flavor recorded at registration)
+            info = mlflow_utils.get_model_info(model_name, stage=MLFLOW_MODEL_STAGE)
+            if model_info is not None:
+                model_info[model_name] = info
             
-            # Extract actual model from pyfunc wrapper
-            # MLflow pyfunc models wrap the actual model
-            try:
-                if hasattr(model, "_model_impl"):
-                    impl = model._model_impl
-                    # Try different ways to extract the actual model
-                    if hasattr(impl, 'sklearn_model'):
-                        return impl.sklearn_model
-                    elif hasattr(impl, 'xgboost_model'):
-                        return impl.xgboost_model
-                    elif hasattr(impl, 'lightgbm_model'):
-                        return impl.lightgbm_model
-                    elif hasattr(impl, 'model'):
-                        return impl.model
-                    else:
-                        # Return the implementation itself
-                        return impl
-                elif hasattr(model, "predict"):
-                    # If it's already the model or has predict method, use it
-                    return model
-                else:
-                    # Last resort: return as-is (might work for some models)
-                    return model
-            except Exception as extract_error:
-                print(f"⚠️ Error extracting model from wrapper: {extract_error}")
-                # Return wrapper - will need to handle in prediction code
-                return model
+            # Native flavor loader -> raw estimator, no pyfunc/pandas conversion per request
+            model = mlflow_utils.load_model_from_registry(model_name, stage=MLFLOW_MODEL_STAGE, flavor=info.get("flavor"))
+            print(f"✅ Loaded {model_name} from MLflow Registry (stage: {MLFLOW_MODEL_STAGE})")
+            return model
         except Exception as e:
             print(f"⚠️ Failed to load {model_name} from MLflow Registry: {e}")
             print(f"   Falling back to local filesystem: {local_path}")
@@ -105,56 +125,244 @@ def load_model_with_fallback(model_name: str, local_path: str, model_type: str =
     # Fallback to local filesystem
     return load_or_none(local_path)
 
-def reload_models():
-    """Reload tất cả models từ MLflow Registry hoặc local filesystem."""
-    global isof, if_scaler, if_features
-    global clf_model, clf_scaler, clf_features, clf_label_encoder, clf_normal_label, clf_label_col
-    global rul_model, rul_features
-    
+def resolve_model(model_name: str, local_dir: str, local_file: str,
+                  model_info: Dict[str, Any]) -> Tuple[Any, str]:
+    """
+    Load model và trả về thư mục chứa companion artifacts của đúng model đó.
+
+    Khi dùng registry: version của stage được resolve qua `get_model_info`,
+    model + artifacts của version đó lấy từ local model cache (chỉ download
+    lần đầu), nên scaler/features luôn khớp version model. Cache lỗi thì
+    quay về `load_model_with_fallback` + artifacts trong `models/` như trước.
+
+    Cache hit với tracking server http(s) không import mlflow: version được
+    resolve qua REST và model load thẳng từ thư mục cache (`src.mlflow_lite`).
+
+    Returns:
+        (model hoặc None, thư mục artifacts)
+    """
+    if USE_MLFLOW_REGISTRY and MLFLOW_MODEL_STAGE and model_cache is not None:
+        try:
+            info = get_latest_version_info(MLFLOW_TRACKING_URI, MODEL_NAMES[model_name], MLFLOW_MODEL_STAGE)
+            if info is None:
+                info = _mlflow_utils().get_model_info(model_name, stage=MLFLOW_MODEL_STAGE)
+            if "version" not in info:
+                print(f"⚠️ {model_name}: {info.get('error')}; using local filesystem: {local_dir}")
+                return load_or_none(f"{local_dir}/{local_file}"), local_dir
+            version = info["version"]
+            entry = model_cache.fetch(
+                MODEL_NAMES[model_name], version,
+                lambda dst: _mlflow_utils().download_model_version(model_name, version, dst)
+            )
+            model = load_model_dir(entry / "model")
+            if model is None:
+                model = _mlflow_utils().load_native_model(str(entry / "model"), flavor=info.get("flavor"))
+            model_info[model_name] = {**info, "cache_path": str(entry)}
+            print(f"✅ Loaded {model_name} v{version} from model cache (stage: {MLFLOW_MODEL_STAGE})")
+            return model, str(entry / "artifacts")
+        except Exception as e:
+            print(f"⚠️ Model cache unavailable for {model_name}: {e}")
+    return load_model_with_fallback(model_name, f"{local_dir}/{local_file}", model_info=model_info), local_dir
+
+def _load_anomaly_artifacts(model_dir: str, model_info: Dict[str, Any]) -> Tuple[Dict[str, Any], str]:
+    print("Loading anomaly model...")
+    isof, artifact_dir = resolve_model("anomaly", f"{model_dir}/anomaly", "isolation_forest.joblib", model_info)
+    return {
+        "isof": isof,
+        "if_scaler": load_or_none(f"{artifact_dir}/scaler.joblib"),
+        "if_features": load_or_none(f"{artifact_dir}/isofeat.joblib"),
+    }, artifact_dir
+
+def _load_classifier_artifacts(model_dir: str, model_info: Dict[str, Any]) -> Tuple[Dict[str, Any], str]:
+    print("Loading classifier model...")
+    clf_model, artifact_dir = resolve_model("classifier", f"{model_dir}/classifier", "classifier.joblib", model_info)
+    return {
+        "clf_model": clf_model,
+        "clf_scaler": load_or_none(f"{artifact_dir}/scaler.joblib"),
+        "clf_features": load_or_none(f"{artifact_dir}/features.joblib"),
+        "clf_label_encoder": load_or_none(f"{artifact_dir}/label_encoder.joblib"),
+        "clf_normal_label": load_or_none(f"{artifact_dir}/normal_label.joblib"),
+        "clf_label_col": load_or_none(f"{artifact_dir}/label_col.joblib"),
+    }, artifact_dir
+
+def _load_rul_artifacts(model_dir: str, model_info: Dict[str, Any]) -> Tuple[Dict[str, Any], str]:
+    print("Loading RUL model...")
+    rul_model, artifact_dir = resolve_model("rul", f"{model_dir}/rul", "lgbm_rul.joblib", model_info)
+    return {
+        "rul_model": rul_model,
+        "rul_features": load_or_none(f"{artifact_dir}/rul_features.joblib"),
+    }, artifact_dir
+
+def _timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+def load_bundle(version: int) -> ModelBundle:
+    """Load tất cả models từ MLflow Registry hoặc local filesystem thành một bundle mới."""
     MODEL_DIR = "models"
+    model_info = {"anomaly": None, "classifier": None, "rul": None}
+    timings: Dict[str, float] = {}
+    load_start = time.perf_counter()
     
     print("\n" + "="*80)
-    print("LOADING MODELS")
+    print(f"LOADING MODELS (bundle v{version})")
     print("="*80)
     print(f"MLflow Registry: {'Enabled' if USE_MLFLOW_REGISTRY else 'Disabled'}")
     print(f"Model Stage: {MLFLOW_MODEL_STAGE if MLFLOW_MODEL_STAGE else 'Local filesystem'}")
     print()
     
-    # ---- Anomaly (Isolation Forest) ----
-    print("Loading anomaly model...")
-    isof = load_model_with_fallback("anomaly", f"{MODEL_DIR}/anomaly/isolation_forest.joblib")
-    if_scaler = load_or_none(f"{MODEL_DIR}/anomaly/scaler.joblib")  # Always from local (artifact)
-    if_features = load_or_none(f"{MODEL_DIR}/anomaly/isofeat.joblib")  # Always from local (artifact)
-    
-    # ---- Classifier ----
-    print("Loading classifier model...")
-    clf_model = load_model_with_fallback("classifier", f"{MODEL_DIR}/classifier/classifier.joblib")
-    clf_scaler = load_or_none(f"{MODEL_DIR}/classifier/scaler.joblib")  # Always from local
-    clf_features = load_or_none(f"{MODEL_DIR}/classifier/features.joblib")
-    clf_label_encoder = load_or_none(f"{MODEL_DIR}/classifier/label_encoder.joblib")
-    clf_normal_label = load_or_none(f"{MODEL_DIR}/classifier/normal_label.joblib")
-    clf_label_col = load_or_none(f"{MODEL_DIR}/classifier/label_col.joblib")
-    
-    # ---- RUL Predictor ----
-    print("Loading RUL model...")
-    rul_model = load_model_with_fallback("rul", f"{MODEL_DIR}/rul/lgbm_rul.joblib")
-    rul_features = load_or_none(f"{MODEL_DIR}/rul/rul_features.joblib")  # Always from local
+    # ---- Anomaly / Classifier / RUL: fetch song song (registry round-trips chồng lên nhau) ----
+    loaders = {
+        "anomaly": _load_anomaly_artifacts,
+        "classifier": _load_classifier_artifacts,
+        "rul": _load_rul_artifacts,
+    }
+    artifacts: Dict[str, Any] = {}
+    artifact_dirs: Dict[str, str] = {}
+    with ThreadPoolExecutor(max_workers=max(1, MODEL_LOAD_WORKERS), thread_name_prefix="model-fetch") as pool:
+        futures = {name: pool.submit(_timed, fn, MODEL_DIR, model_info) for name, fn in loaders.items()}
+        for name, future in futures.items():
+            (result, artifact_dirs[name]), timings[f"load_{name}"] = future.result()
+            artifacts.update(result)
+    timings["load"] = time.perf_counter() - load_start
+
+    build_start = time.perf_counter()
+    isof, if_scaler, if_features = artifacts["isof"], artifacts["if_scaler"], artifacts["if_features"]
+    clf_model, clf_scaler, clf_features = artifacts["clf_model"], artifacts["clf_scaler"], artifacts["clf_features"]
+    rul_model, rul_features = artifacts["rul_model"], artifacts["rul_features"]
+
+    # ---- Shared feature layout (union of all 3 feature lists) ----
+    feature_layout = FeatureLayout(if_features, clf_features, rul_features, label_col=artifacts["clf_label_col"])
+
+    # ---- Tree backend per model (compiled is parity-checked against native) ----
+    isof_predictor = select_backend(isof, "anomaly", tree_backend("anomaly"), TREE_COMPILED_MAX_ROWS)
+    clf_predictor = select_backend(clf_model, "classifier", tree_backend("classifier"), TREE_COMPILED_MAX_ROWS)
+    rul_predictor = select_backend(rul_model, "rul", tree_backend("rul"), TREE_COMPILED_MAX_ROWS)
+
+    # ---- Fused scaler+model pipelines (parity-checked against scaler.transform) ----
+    if_pipeline = build_pipeline(if_scaler, isof_predictor, feature_layout.if_index, "anomaly")
+    clf_pipeline = build_pipeline(clf_scaler, clf_predictor, feature_layout.clf_index, "classifier")
+
+    # ---- ONNX Runtime backend (agreement-checked against native, fallback = native) ----
+    def onnx_path(name: str) -> str:
+        return os.path.join(artifact_dirs[name], os.path.basename(ONNX_FILES[name]))
+
+    if tree_backend("anomaly") == "onnx" and if_pipeline is not None:
+        if_pipeline = load_onnx_predictor(
+            onnx_path("anomaly"), "anomaly", feature_layout.if_index,
+            reference=if_pipeline.predict,
+            probe=_synthetic_rows(feature_layout, if_scaler, clf_scaler)
+        ) or if_pipeline
+    if tree_backend("classifier") == "onnx" and clf_pipeline is not None:
+        clf_pipeline = load_onnx_predictor(
+            onnx_path("classifier"), "classifier", feature_layout.clf_index,
+            reference=clf_pipeline.predict,
+            probe=_synthetic_rows(feature_layout, if_scaler, clf_scaler)
+        ) or clf_pipeline
+    if tree_backend("rul") == "onnx" and rul_model is not None:
+        rul_predictor = load_onnx_predictor(
+            onnx_path("rul"), "rul",
+            reference=rul_model.predict, probe=_rul_probe_rows(rul_model)
+        ) or rul_predictor
+    timings["build"] = time.perf_counter() - build_start
+
+    bundle = ModelBundle(
+        version=version,
+        loaded_at=time.time(),
+        feature_layout=feature_layout,
+        if_pipeline=if_pipeline,
+        clf_pipeline=clf_pipeline,
+        rul_predictor=rul_predictor,
+        model_info=model_info,
+        timings=timings,
+        **artifacts
+    )
+
+    warmup_start = time.perf_counter()
+    _warm_bundle(bundle, MODEL_WARMUP_BATCH_SIZES, MODEL_WARMUP_ROUNDS)
+    timings["warmup"] = time.perf_counter() - warmup_start
+    timings["total"] = time.perf_counter() - load_start
     
     print("\n" + "="*80)
-    print("MODEL LOADING SUMMARY")
+    print(f"MODEL LOADING SUMMARY (bundle v{version})")
     print("="*80)
     print(f"Anomaly: {'✅' if isof else '❌'}")
     print(f"Classifier: {'✅' if clf_model else '❌'}")
     print(f"RUL: {'✅' if rul_model else '❌'}")
+    print("Timings: " + ", ".join(f"{k}={v:.2f}s" for k, v in timings.items()))
     print()
+    return bundle
+
+def _warm_bundle(bundle: ModelBundle, batch_sizes: List[int], rounds: int = 1):
+    """
+    Chạy dòng synthetic qua parse + từng stage với các batch size hay dùng,
+    trước khi bundle được swap vào (và /ready chuyển sang 200).
+
+    Gọi thẳng các predictor (không qua `_score_batch`) nên không gửi Kafka
+    alert và không tính vào metrics prediction.
+    """
+    layout = bundle.feature_layout
+    if not batch_sizes or layout is None or layout.width == 0:
+        return
+    X_all = _synthetic_rows(layout, bundle.if_scaler, bundle.clf_scaler, n_rows=max(batch_sizes))
+    rows_all = [dict(zip(layout.columns, row)) for row in X_all.tolist()]
+    stages = (
+        ("anomaly", bundle.if_pipeline, lambda p, X: p.predict(X)),
+        ("classifier", bundle.clf_pipeline, lambda p, X: p.predict(X)),
+        ("rul", bundle.rul_predictor,
+         lambda p, X: p.predict(layout.rul(X, np.zeros(X.shape[0], dtype=int)))),
+    )
+    for _ in range(max(1, rounds)):
+        for n in batch_sizes:
+            X = layout.parse(rows_all[:n]).X
+            for name, predictor, warm in stages:
+                if predictor is None:
+                    continue
+                try:
+                    warm(predictor, X)
+                except Exception as e:
+                    print(f"⚠️ Warm-up of {name} (batch {n}) failed: {e}")
+                    return
+
+def _synthetic_rows(feature_layout, if_scaler, clf_scaler, n_rows: int = 512, seed: int = 0) -> np.ndarray:
+    """Dòng synthetic (warm-up, ONNX agreement check), sinh theo mean/scale của các scaler."""
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(n_rows, feature_layout.width))
+    for scaler, index in ((clf_scaler, feature_layout.clf_index), (if_scaler, feature_layout.if_index)):
+        if getattr(scaler, "mean_", None) is not None and getattr(scaler, "scale_", None) is not None:
+            X[:, index] = rng.normal(size=(n_rows, len(scaler.mean_))) * scaler.scale_ * 3 + scaler.mean_
+    return X
+
+
+def _rul_probe_rows(model, n_rows: int = 512, seed: int = 0) -> Optional[np.ndarray]:
+    """Dòng test cho RUL (feature chưa scale): giá trị quanh các split threshold của LightGBM."""
+    try:
+        return compile_model(model).trees.probe(n_rows, seed=seed, boundary_fraction=0.0)
+    except Exception as e:
+        print(f"⚠️ rul: cannot build ONNX probe rows ({e}), skipping agreement check")
+        return None
 
 MODEL_DIR = "models"
 
-# Initialize MLflow tracking URI
-mlflow.set_tracking_uri(MLFLOW_TRACKING_URI)
+# Models được load trong startup hook (không phải lúc import module).
+# FAST_START=true: server nhận request ngay, bundle load ở background,
+# /ready trả 503 tới khi load + warm-up xong; false: startup chờ load xong
+FAST_START = os.getenv("FAST_START", "false").lower() == "true"
+
+# Bundle đang phục vụ; reload load bundle mới ở background rồi swap một lần
+model_store = ModelStore(load_bundle, started_at=PROCESS_START)
 
-# Load models (will try MLflow Registry first, then fallback to local)
-reload_models()
+# Pre-fork multi-worker (src/prefork.py): trong worker, bundle được kế thừa từ
+# master (copy-on-write) và reload được chuyển lên master thay vì load tại chỗ
+prefork_worker = None
+
+def reload_models() -> Optional[ModelBundle]:
+    """Reload tất cả models (blocking) và swap bundle mới vào khi đã load + warm xong."""
+    if prefork_worker is not None:
+        prefork_worker.request_reload().result()
+        return None
+    return model_store.reload()
 
 # ---- Meaningful labels mapping ----
 FAULT_MAP = {
@@ -171,15 +379,65 @@ FAULT_MAP = {
 
 KAFKA_SERVER = os.getenv("KAFKA_BOOTSTRAP_SERVERS", "kafka:9092")
 KAFKA_TOPIC = os.getenv("KAFKA_TOPIC", "ev_predictions")
+# Alert được gửi từ thread nền (src/alert_producer.py); queue đầy -> backpressure policy
+KAFKA_QUEUE_SIZE = int(os.getenv("KAFKA_ALERT_QUEUE_SIZE", "10000"))
+KAFKA_QUEUE_FULL_POLICY = os.getenv("KAFKA_QUEUE_FULL_POLICY", "drop_newest")
+KAFKA_BLOCK_TIMEOUT_MS = float(os.getenv("KAFKA_BLOCK_TIMEOUT_MS", "50"))
+KAFKA_FLUSH_TIMEOUT = float(os.getenv("KAFKA_FLUSH_TIMEOUT", "10"))
+# binary: schema nhị phân có version (src/alert_schema.py); json: format cũ
+ALERT_ENCODING = os.getenv("ALERT_ENCODING", "binary").lower()
+if ALERT_ENCODING not in ALERT_ENCODINGS:
+    print(f"[WARN] Unknown ALERT_ENCODING={ALERT_ENCODING!r}, using binary")
+    ALERT_ENCODING = "binary"
+# Alert được key theo xe (field đầu tiên có trong input, fallback host) -> thứ tự theo xe trong một partition
+ALERT_KEY_FIELDS = tuple(
+    f.strip() for f in os.getenv("ALERT_KEY_FIELDS", ",".join(VEHICLE_KEY_FIELDS)).split(",") if f.strip()
+)
+KAFKA_PRODUCER_CONFIG = {
+    **DEFAULT_PRODUCER_CONFIG,
+    "linger.ms": int(os.getenv("KAFKA_LINGER_MS", DEFAULT_PRODUCER_CONFIG["linger.ms"])),
+    "batch.size": int(os.getenv("KAFKA_BATCH_SIZE", DEFAULT_PRODUCER_CONFIG["batch.size"])),
+    "compression.type": os.getenv("KAFKA_COMPRESSION", DEFAULT_PRODUCER_CONFIG["compression.type"]),
+    "acks": os.getenv("KAFKA_ACKS", DEFAULT_PRODUCER_CONFIG["acks"]),
+}
 
-kafka_producer = None
+kafka_producer: Optional[AlertProducer] = None
 kafka_enabled = True
-try:
-    kafka_producer = Producer({"bootstrap.servers": KAFKA_SERVER})
-except Exception as e:
-    kafka_producer = None
-    kafka_enabled = False
-    print(f"[WARN] Kafka producer init failed, disabled: {e}")
+
+# Kafka tắt: log alert bị bỏ qua tối đa một lần mỗi khoảng này (không phải mỗi dòng anomaly)
+KAFKA_DISABLED_LOG_INTERVAL = 60.0
+_kafka_disabled_logged_at = None
+_kafka_disabled_skipped = 0
+
+def _create_confluent_producer():
+    from confluent_kafka import Producer
+    return Producer({"bootstrap.servers": KAFKA_SERVER, **KAFKA_PRODUCER_CONFIG})
+
+def init_kafka_producer(producer_factory=None):
+    """
+    Tạo Kafka producer + thread gửi (startup hook); confluent_kafka chỉ được import ở đây.
+
+    Args:
+        producer_factory: thay cho confluent_kafka.Producer (vd. broker in-process, src/inmemory_kafka.py)
+    """
+    global kafka_producer, kafka_enabled
+    try:
+        producer = AlertProducer(
+            producer_factory or _create_confluent_producer,
+            KAFKA_TOPIC,
+            max_queue_size=KAFKA_QUEUE_SIZE,
+            queue_full_policy=KAFKA_QUEUE_FULL_POLICY,
+            block_timeout_ms=KAFKA_BLOCK_TIMEOUT_MS,
+            serializer=lambda payload: encode_alert(payload, ALERT_ENCODING),
+            headers=alert_headers(ALERT_ENCODING),
+            key_fn=lambda payload: vehicle_key(payload, ALERT_KEY_FIELDS)
+        )
+        producer.start()
+        kafka_producer = producer
+    except Exception as e:
+        kafka_producer = None
+        kafka_enabled = False
+        print(f"[WARN] Kafka producer init failed, disabled: {e}")
 
 # ============================================================
 # ---------------------- FASTAPI APP --------------------------
@@ -191,37 +449,50 @@ app = FastAPI(
     version="1.0.0"
 )
 
+@app.on_event("startup")
+def startup_load():
+    """Khởi tạo Kafka producer và load models (MLflow Registry trước, fallback local)."""
+    init_kafka_producer()
+    if model_store.current is not None:
+        return  # pre-fork worker: bundle đã được master load + warm trước khi fork
+    if FAST_START:
+        model_store.reload_async()
+    else:
+        reload_models()
+
 # ============================================================
 # ---------------------- TRAINING STATE ----------------------
 # ============================================================
 
-# Check if running in Docker
-IN_DOCKER = os.path.exists("/.dockerenv")
-WORKSPACE_DIR = "/workspace" if IN_DOCKER else os.getcwd()
-
-# Training state
-training_state = {
-    "status": "idle",  # idle, running, completed, failed
-    "started_at": None,
-    "completed_at": None,
-    "log": []
-}
-
-TRAINER_SCRIPT = os.getenv("TRAINER_SCRIPT", "src/train_wrapper.py")
-USE_DOCKER = os.getenv("USE_DOCKER", "true").lower() == "true"
+# Training state: idle, running, completed, failed (file dùng chung giữa pre-fork master và workers).
+# Job chạy bằng src/training_job.py (TRAINER_SCRIPT, USE_DOCKER)
+training_state = TrainingState()
 
 # =======================
 # MONITORING METRICS
 # =======================
 
+# Request latency: từ sub-millisecond (một dòng, backend compiled/ONNX) tới vài giây (batch lớn);
+# 0.5s phải là một boundary cho alert HighInferenceLatency
+REQUEST_LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+# Từng stage của cascade: phần lớn là vài chục microsecond tới vài millisecond
+STAGE_LATENCY_BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5
+)
+
 REQUEST_COUNT = Counter(
     "inference_requests_total",
-    "Total number of inference requests"
+    "Total number of HTTP requests by route template, method and status",
+    ["route", "method", "status"]
 )
 
 REQUEST_LATENCY = Histogram(
     "inference_request_latency_seconds",
-    "Inference request latency in seconds"
+    "HTTP request latency in seconds by route template, method and status",
+    ["route", "method", "status"],
+    buckets=REQUEST_LATENCY_BUCKETS
 )
 
 ANOMALY_PREDICTIONS = Counter(
@@ -229,37 +500,104 @@ ANOMALY_PREDICTIONS = Counter(
     "Total anomaly predictions"
 )
 
+STAGE_LATENCY = Histogram(
+    "inference_stage_seconds",
+    "Latency of one call of a cascade stage (one batch) by stage, model and registry version",
+    ["stage", "model", "version"],
+    buckets=STAGE_LATENCY_BUCKETS
+)
+
+STAGE_ROWS = Counter(
+    "inference_stage_rows_total",
+    "Rows reaching each cascade stage",
+    ["stage"]  # anomaly -> classifier (anomalous) -> rul (fault) ; kafka = alerts produced
+)
+
+# stage -> model của bundle (label `model`; "none" cho stage không gọi model)
+STAGE_MODELS = {
+    "parse": "none",
+    "anomaly": "anomaly",
+    "battery_rule": "none",
+    "classifier": "classifier",
+    "decode_labels": "classifier",
+    "rul": "rul",
+    "kafka_produce": "none",
+}
+
+STAGE_ROW_COUNTERS = {stage: STAGE_ROWS.labels(stage=stage) for stage in ("anomaly", "classifier", "rul", "kafka")}
+
+_stage_timers: Dict[int, Dict[str, Any]] = {}
+
+def _stage_timer_children(bundle: ModelBundle) -> Dict[str, Any]:
+    """Histogram children của từng stage cho bundle (labels resolve một lần cho mỗi bundle version)."""
+    children = _stage_timers.get(bundle.version)
+    if children is None:
+        info = bundle.model_info or {}
+        versions = {name: str((info.get(name) or {}).get("version", "local")) for name in ("anomaly", "classifier", "rul")}
+        children = {
+            stage: STAGE_LATENCY.labels(stage=stage, model=model, version=versions.get(model, "none"))
+            for stage, model in STAGE_MODELS.items()
+        }
+        _stage_timers.clear()  # chỉ giữ bundle đang phục vụ
+        _stage_timers[bundle.version] = children
+    return children
+
+def _route_template(request: Request) -> str:
+    """Path template của route đã match (`/predict`, không phải path thật) để giới hạn cardinality."""
+    route = request.scope.get("route")
+    if route is not None:
+        return route.path
+    for route in app.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
 @app.middleware("http")
 async def prometheus_middleware(request: Request, call_next):
-    start_time = time.time()
-    response = await call_next(request)
-    REQUEST_COUNT.inc()
-    REQUEST_LATENCY.observe(time.time() - start_time)
-    return response
+    start_time = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        labels = (_route_template(request), request.method, str(status))
+        REQUEST_COUNT.labels(*labels).inc()
+        REQUEST_LATENCY.labels(*labels).observe(time.perf_counter() - start_time)
 
 @app.get("/metrics")
 def metrics():
-    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+    body, content_type = render_latest()
+    return Response(body, media_type=content_type)
 
 @app.get("/health")
 def health():
     """Health check endpoint với thông tin về models và MLflow Registry."""
+    bundle = model_store.current
     health_status = {
         "status": "healthy",
         "services": {
-            "anomaly": isof is not None and if_scaler is not None and if_features is not None,
-            "classifier": clf_model is not None and clf_scaler is not None and clf_features is not None,
-            "rul": rul_model is not None and rul_features is not None
+            "anomaly": bundle is not None and bundle.anomaly_ready,
+            "classifier": bundle is not None and bundle.clf_model is not None and bundle.clf_scaler is not None and bundle.clf_features is not None,
+            "rul": bundle is not None and bundle.rul_model is not None and bundle.rul_features is not None
         },
         "kafka": {
             "enabled": kafka_enabled,
-            "connected": kafka_producer is not None
+            "connected": kafka_producer is not None,
+            "sender_running": kafka_producer is not None and kafka_producer.running,
+            "queued_alerts": kafka_producer.pending if kafka_producer is not None else 0
         },
         "mlflow": {
             "tracking_uri": MLFLOW_TRACKING_URI,
             "registry_enabled": USE_MLFLOW_REGISTRY,
             "model_stage": MLFLOW_MODEL_STAGE if USE_MLFLOW_REGISTRY else None,
-            "model_info": model_info
+            "model_info": bundle.model_info if bundle is not None else None
+        },
+        "bundle": {
+            "version": bundle.version if bundle is not None else None,
+            "loaded_at": datetime.fromtimestamp(bundle.loaded_at).isoformat() if bundle is not None else None,
+            "reloading": model_store.reloading
         }
     }
     
@@ -273,14 +611,15 @@ def health():
     return JSONResponse(content=health_status, status_code=status_code)
 def health():
     """Health check endpoint for monitoring and load balancers."""
+    bundle = model_store.current
     health_status = {
         "status": "healthy",
         "services": {
-            "anomaly": isof is not None and if_scaler is not None and if_features is not None,
-            "classifier": clf_model is not None and clf_scaler is not None and clf_features is not None,
-            "rul": rul_model is not None and rul_features is not None
+            "anomaly": bundle is not None and bundle.anomaly_ready,
+            "classifier": bundle is not None and bundle.clf_model is not None and bundle.clf_scaler is not None and bundle.clf_features is not None,
+            "rul": bundle is not None and bundle.rul_model is not None and bundle.rul_features is not None
         },
-        "kafka": kafka_enabled and kafka_producer is not None
+        "kafka": kafka_available()
     }
     
     # Determine overall health
@@ -292,6 +631,24 @@ def health():
     status_code = 200 if health_status["status"] == "healthy" else 503
     return JSONResponse(content=health_status, status_code=status_code)
 
+@app.get("/ready")
+def ready():
+    """
+    Readiness probe: 200 khi đã có bundle đang phục vụ (đã load + warm-up xong)
+    và anomaly model sẵn sàng, ngược lại 503.
+    """
+    bundle = model_store.current
+    if bundle is None or not bundle.anomaly_ready:
+        return JSONResponse(status_code=503, content={
+            "ready": False,
+            "reloading": model_store.reloading
+        })
+    return JSONResponse(content={
+        "ready": True,
+        "version": bundle.version,
+        "startup_timings": bundle.timings
+    })
+
 @app.get("/")
 def root():
     """Root endpoint with API information."""
@@ -300,8 +657,10 @@ def root():
         "version": "1.0.0",
         "endpoints": {
             "health": "/health",
+            "ready": "/ready",
             "metrics": "/metrics",
             "predict": "/predict",
+            "predict_batch": "/predict/batch",
             "docs": "/docs",
             "training": "/api/train",
             "training_status": "/api/training/status"
@@ -315,6 +674,10 @@ def root():
 class Payload(BaseModel):
     data: Dict[str, Any]
 
+class BatchPayload(BaseModel):
+    """Nhiều dòng telemetry trong một request (gateway flush)."""
+    rows: List[Dict[str, Any]]
+
 class TrainingRequest(BaseModel):
     """Request model cho training API."""
     force: bool = False
@@ -324,334 +687,362 @@ class TrainingRequest(BaseModel):
 # ------------------- HELPERS --------------------------------
 # ============================================================
 
-def _build_row(feature_list: List[str], input_data: Dict[str, Any]):
-    return np.array([[float(input_data.get(f, 0)) for f in feature_list]])
+def _model_predict(model, X):
+    """Call predict on a raw model or a pyfunc wrapper, always returning a 1D array."""
+    if hasattr(model, 'predict'):
+        pred = model.predict(X)
+    elif callable(model):
+        pred = model(X)
+    else:
+        return None
+    return np.asarray(pred).reshape(-1)
 
-def kafka_send_prediction(data: Dict[str, Any]):
-    """Send prediction data to Kafka topic with improved error handling."""
-    if not kafka_enabled or kafka_producer is None:
-        print(f"[WARN] Kafka disabled or not reachable; skipping send to topic: {KAFKA_TOPIC}")
-        return False
-    
-    try:
-        import json
-        # Serialize to JSON string instead of str() for better compatibility
-        message_value = json.dumps(data)
-        kafka_producer.produce(
-            KAFKA_TOPIC, 
-            value=message_value,
-            callback=lambda err, msg: print(f"[ERROR] Kafka delivery failed: {err}") if err else None
-        )
-        # Trigger delivery callbacks
-        kafka_producer.poll(0)
-        return True
-    except Exception as e:
-        print(f"[ERROR] Kafka send failed to topic {KAFKA_TOPIC}: {e}")
-        import traceback
-        print(f"[ERROR] Traceback: {traceback.format_exc()}")
+def _decode_labels(codes: np.ndarray, label_encoder=None) -> Dict[int, str]:
+    """Decode each distinct class code once (label_encoder, fallback FAULT_MAP)."""
+    decoded = {}
+    for code in np.unique(codes).tolist():
+        code = int(code)
+        if label_encoder:
+            try:
+                decoded[code] = label_encoder.inverse_transform([code])[0]
+                continue
+            except Exception as decode_err:
+                print(f"[WARN] Label decoder error for code {code}: {decode_err}")
+        decoded[code] = FAULT_MAP.get(code, str(code))
+    return decoded
+
+def kafka_available() -> bool:
+    return kafka_enabled and kafka_producer is not None
+
+def _warn_kafka_disabled(skipped: int):
+    """Log alert bị bỏ qua khi Kafka tắt, gộp lại mỗi KAFKA_DISABLED_LOG_INTERVAL giây."""
+    global _kafka_disabled_logged_at, _kafka_disabled_skipped
+    _kafka_disabled_skipped += skipped
+    now = time.monotonic()
+    if _kafka_disabled_logged_at is not None and now - _kafka_disabled_logged_at < KAFKA_DISABLED_LOG_INTERVAL:
+        return
+    print(f"[WARN] Kafka disabled or not reachable; skipped {_kafka_disabled_skipped} alert(s) "
+          f"for topic: {KAFKA_TOPIC}")
+    _kafka_disabled_logged_at = now
+    _kafka_disabled_skipped = 0
+
+def kafka_send_prediction(data: Dict[str, Any]) -> bool:
+    """Đưa alert vào queue của Kafka producer (serialize + produce chạy ở thread nền)."""
+    if not kafka_available():
         return False
+    # Alert bị bỏ (queue đầy) được đếm + log có giới hạn trong AlertProducer
+    return kafka_producer.send(data)
 
 # ============================================================
 # ---------------------- TRAINING FUNCTIONS --------------------
 # ============================================================
 
-def check_docker_available():
-    """Kiểm tra xem docker command có sẵn không."""
-    try:
-        result = subprocess.run(
-            ["docker", "--version"],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            timeout=5
-        )
-        return result.returncode == 0
-    except (FileNotFoundError, subprocess.TimeoutExpired):
-        return False
-
-def run_training(rebuild: bool = True):
-    """Chạy training trong background thread."""
-    global training_state
-    
-    training_state["status"] = "running"
-    training_state["started_at"] = datetime.now().isoformat()
-    training_state["completed_at"] = None
-    training_state["log"] = []
-    
-    try:
-        docker_available = check_docker_available()
-        
-        if USE_DOCKER and docker_available:
-            # Chạy training trong Docker container
-            training_state["log"].append({
-                "timestamp": datetime.now().isoformat(),
-                "message": "Starting training in Docker container..."
-            })
-            
-            # Build trainer image nếu cần
-            if rebuild:
-                build_cmd = ["docker", "compose", "build", "trainer"]
-                training_state["log"].append({
-                    "timestamp": datetime.now().isoformat(),
-                    "message": "Building trainer image..."
-                })
-                build_process = subprocess.run(
-                    build_cmd,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.STDOUT,
-                    text=True,
-                    cwd=WORKSPACE_DIR,
-                    timeout=600  # 10 minutes timeout
-                )
-                training_state["log"].append({
-                    "timestamp": datetime.now().isoformat(),
-                    "message": f"Build output: {build_process.stdout[-500:]}"  # Last 500 chars
-                })
-            
-            # Chạy training trong Docker container
-            cmd = ["docker", "compose", "run", "--rm", "trainer"]
-            process = subprocess.Popen(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                text=True,
-                bufsize=1,
-                universal_newlines=True,
-                cwd=WORKSPACE_DIR
-            )
-        else:
-            # Fallback: Chạy training script trực tiếp
-            if USE_DOCKER and not docker_available:
-                training_state["log"].append({
-                    "timestamp": datetime.now().isoformat(),
-                    "message": "Docker not available, falling back to direct script execution..."
-                })
-            
-            training_state["log"].append({
-                "timestamp": datetime.now().isoformat(),
-                "message": f"Running training script directly: {TRAINER_SCRIPT}"
-            })
-            process = subprocess.Popen(
-                ["python", TRAINER_SCRIPT],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                text=True,
-                bufsize=1,
-                universal_newlines=True,
-                cwd=WORKSPACE_DIR
-            )
-        
-        # Đọc log real-time
-        for line in process.stdout:
-            training_state["log"].append({
-                "timestamp": datetime.now().isoformat(),
-                "message": line.strip()
-            })
-            # Giữ log không quá 1000 dòng
-            if len(training_state["log"]) > 1000:
-                training_state["log"] = training_state["log"][-1000:]
-        
-        process.wait()
-        
-        if process.returncode == 0:
-            training_state["status"] = "completed"
-            training_state["log"].append({
-                "timestamp": datetime.now().isoformat(),
-                "message": "Training completed successfully! Reloading models..."
-            })
-            # Reload models sau khi training xong
-            reload_models()
-            training_state["log"].append({
-                "timestamp": datetime.now().isoformat(),
-                "message": "Models reloaded successfully!"
-            })
-        else:
-            training_state["status"] = "failed"
-            training_state["log"].append({
-                "timestamp": datetime.now().isoformat(),
-                "message": f"Training failed with exit code {process.returncode}"
-            })
-            
-    except Exception as e:
-        training_state["status"] = "failed"
-        training_state["log"].append({
-            "timestamp": datetime.now().isoformat(),
-            "message": f"Error: {str(e)}"
-        })
-    finally:
-        training_state["completed_at"] = datetime.now().isoformat()
+def _reload_after_training():
+    """Reload tại chỗ sau training (một process); pre-fork thì master reload."""
+    reload_models()
+    training_state.log("Models reloaded successfully!")
 
 # ============================================================
 # ------------------------- ENDPOINTS --------------------------
 # ============================================================
 
-@app.post("/predict")
-def predict(payload: Payload):
+class InferenceError(Exception):
+    """Lỗi ở stage anomaly - cả request/batch trả về 500."""
+
+
+PREDICT_BATCH_MAX_ROWS = int(os.getenv("PREDICT_BATCH_MAX_ROWS", "5000"))
+
+def _score_batch(rows: List[Dict[str, Any]], bundle: Optional[ModelBundle] = None) -> List[Dict[str, Any]]:
+    """
+    Chạy cascade anomaly -> classifier -> RUL cho nhiều dòng cùng lúc.
+
+    Mỗi stage được gọi đúng một lần trên một ma trận; chỉ những dòng anomaly
+    (sau rule Battery Aging) đi tiếp vào classifier, chỉ những dòng fault đi
+    tiếp vào RUL. Kết quả trả về theo đúng thứ tự input và giống hệt `/predict`.
+    Cả batch dùng một bundle (mặc định: bundle đang phục vụ), kể cả khi có
+    reload xảy ra giữa chừng.
 
-    data = payload.data
-    result = {}
+    Raises:
+        InferenceError: nếu stage anomaly lỗi (tương đương 500 của `/predict`)
+    """
+    n = len(rows)
+    if n == 0:
+        return []
+    if bundle is None:
+        bundle = model_store.current
+    feature_layout = bundle.feature_layout
+    stage_timers = _stage_timer_children(bundle)
 
     # ========================================================
     # 1) Anomaly Detection (Isolation Forest)
     # ========================================================
-    if isof is None or if_scaler is None or if_features is None:
-        return JSONResponse(
-            status_code=503,
-            content={"error": "Anomaly model/scaler/features missing. Run anomaly pipeline first."}
-        )
-
     try:
-        x_if = _build_row(if_features, data)
-        x_if_scaled = if_scaler.transform(x_if)
-        if_pred = isof.predict(x_if_scaled)[0]  # 1 normal, -1 anomaly
-        is_anomaly = int(if_pred == -1)
+        # Parse mỗi payload đúng một lần theo layout dùng chung của 3 models
+        t0 = time.perf_counter()
+        parsed = feature_layout.parse(rows)
+        X = parsed.X
+        invalid_if = feature_layout.invalid_rows(parsed, "anomaly")
+        if invalid_if is not None and invalid_if.any():
+            raise ValueError(parsed.errors[int(np.flatnonzero(invalid_if)[0])])
+        t1 = time.perf_counter()
+        stage_timers["parse"].observe(t1 - t0)
+
+        STAGE_ROW_COUNTERS["anomaly"].inc(n)
+        if_pred = bundle.if_pipeline.predict(X)  # 1 normal, -1 anomaly
+        is_anomaly = (np.asarray(if_pred) == -1)
+        t0 = time.perf_counter()
+        stage_timers["anomaly"].observe(t0 - t1)
+
+        # ====================================================
+        # RULE OVERRIDE: Battery Aging (vectorized)
+        # ====================================================
+        # Chỉ áp dụng cho các dòng Isolation Forest đánh giá là normal
+        normal_idx = np.flatnonzero(~is_anomaly)
+        soh = np.array([float(rows[i].get("SoH", 1)) for i in normal_idx], dtype=float)
+        cycles = np.array([float(rows[i].get("Charge_Cycles", 0)) for i in normal_idx], dtype=float)
+        is_anomaly[normal_idx] = (soh < 0.6) | (cycles > 2000)
+        stage_timers["battery_rule"].observe(time.perf_counter() - t0)
     except Exception as e:
         import traceback
         error_msg = f"Anomaly inference error: {e}"
         print(f"[ERROR] {error_msg}")
         print(f"[ERROR] Traceback: {traceback.format_exc()}")
-        return JSONResponse(
-            status_code=500,
-            content={"error": error_msg}
-        )
+        raise InferenceError(error_msg) from e
+
+    results: List[Optional[Dict[str, Any]]] = [None] * n
+    for i in np.flatnonzero(~is_anomaly):
+        results[i] = {"IF_Anomaly": 0, "status": "Normal - no fault detected"}
 
-    result["IF_Anomaly"] = is_anomaly
+    anomaly_idx = np.flatnonzero(is_anomaly)
+    if anomaly_idx.size == 0:
+        return results
 
     # ========================================================
-    # RULE OVERRIDE: Battery Aging
+    # 2) Fault Classification (anomalous subset only)
     # ========================================================
-    if is_anomaly == 0:
-        soh = float(data.get("SoH", 1))
-        cycles = float(data.get("Charge_Cycles", 0))
+    m = anomaly_idx.size
+    X_anomalous = X[anomaly_idx]
+    classifier_labels: List[Optional[str]] = [None] * m
+    pred_codes = None
+    is_fault = np.zeros(m, dtype=bool)
 
-        if soh < 0.6 or cycles > 2000:
-            is_anomaly = 1
-            result["IF_Anomaly"] = 1
-        else:
-            result["status"] = "Normal - no fault detected"
-            return result
+    if bundle.classifier_ready:
+        # Dòng có feature không parse được -> lỗi classifier riêng của dòng đó
+        clf_ok = np.ones(m, dtype=bool)
+        invalid_clf = feature_layout.invalid_rows(parsed, "classifier")
+        if invalid_clf is not None:
+            clf_ok = ~invalid_clf[anomaly_idx]
+            for j in np.flatnonzero(~clf_ok):
+                error_msg = f"Classifier Error: {parsed.errors[int(anomaly_idx[j])]}"
+                print(f"[ERROR] {error_msg}")
+                classifier_labels[j] = error_msg
+        clf_pos = np.flatnonzero(clf_ok)
 
-    # ========================================================
-    # 2) Fault Classification
-    # ========================================================
-    classifier_label = None
-    pred_code = None
-    is_fault = False
+        if clf_pos.size:
+            STAGE_ROW_COUNTERS["classifier"].inc(int(clf_pos.size))
+            try:
+                t0 = time.perf_counter()
+                pred = bundle.clf_pipeline.predict(X_anomalous if clf_ok.all() else X_anomalous[clf_pos])
+                t1 = time.perf_counter()
+                stage_timers["classifier"].observe(t1 - t0)
+                pred_codes = np.zeros(m, dtype=int)
+                if pred is not None:
+                    pred_codes[clf_pos] = pred.astype(int)
 
-    if clf_model and clf_scaler and clf_features:
-        try:
-            x_clf = _build_row(clf_features, data)
-            x_clf_scaled = clf_scaler.transform(x_clf)
-            # Handle both direct model and pyfunc wrapper
-            if hasattr(clf_model, 'predict'):
-                pred = clf_model.predict(x_clf_scaled)
-                pred_code = int(pred[0] if hasattr(pred, '__len__') and len(pred) > 0 else pred)
-            else:
-                # Fallback
-                pred_code = int(clf_model(x_clf_scaled)[0]) if callable(clf_model) else 0
-            
-            # Decode label using label_encoder if available, otherwise use FAULT_MAP
-            if clf_label_encoder:
-                try:
-                    classifier_label = clf_label_encoder.inverse_transform([pred_code])[0]
-                except Exception as decode_err:
-                    print(f"[WARN] Label decoder error for code {pred_code}: {decode_err}")
-                    classifier_label = FAULT_MAP.get(pred_code, str(pred_code))
-            else:
-                classifier_label = FAULT_MAP.get(pred_code, str(pred_code))
-            
-            # Check if prediction is a fault (not normal_label)
-            if clf_normal_label is not None:
-                is_fault = (pred_code != clf_normal_label)
-            else:
-                # Fallback: assume non-zero codes are faults
-                is_fault = (pred_code != 0)
-        except Exception as e:
-            import traceback
-            error_msg = f"Classifier Error: {e}"
-            print(f"[ERROR] {error_msg}")
-            print(f"[ERROR] Traceback: {traceback.format_exc()}")
-            classifier_label = error_msg
-            is_fault = False  # Don't proceed with RUL if classifier fails
+                # Decode label using label_encoder if available, otherwise use FAULT_MAP
+                decoded = _decode_labels(pred_codes[clf_pos], bundle.clf_label_encoder)
+                for j in clf_pos:
+                    classifier_labels[j] = decoded[int(pred_codes[j])]
+                stage_timers["decode_labels"].observe(time.perf_counter() - t1)
+
+                # Check if prediction is a fault (not normal_label)
+                if bundle.clf_normal_label is not None:
+                    is_fault = pred_codes != bundle.clf_normal_label
+                else:
+                    # Fallback: assume non-zero codes are faults
+                    is_fault = pred_codes != 0
+                is_fault &= clf_ok
+            except Exception as e:
+                import traceback
+                error_msg = f"Classifier Error: {e}"
+                print(f"[ERROR] {error_msg}")
+                print(f"[ERROR] Traceback: {traceback.format_exc()}")
+                for j in clf_pos:
+                    classifier_labels[j] = error_msg
+                pred_codes = None
+                is_fault = np.zeros(m, dtype=bool)  # Don't proceed with RUL if classifier fails
     else:
         print("[WARN] Classifier model/scaler/features not available")
-        classifier_label = "Classifier unavailable"
-
-    result["classifier_label"] = classifier_label
-    result["is_fault"] = is_fault
+        classifier_labels = ["Classifier unavailable"] * m
 
     # ========================================================
-    # 3) RUL Prediction
+    # 3) RUL Prediction (faulty subset only)
     # ========================================================
-    rul_value = None
-    if is_fault and rul_model and rul_features:
+    rul_values: List[Optional[float]] = [None] * m
+    fault_pos = np.flatnonzero(is_fault)
+    invalid_rul = feature_layout.invalid_rows(parsed, "rul")
+    if invalid_rul is not None:
+        fault_pos = fault_pos[~invalid_rul[anomaly_idx[fault_pos]]]
+    if fault_pos.size and bundle.rul_ready:
+        STAGE_ROW_COUNTERS["rul"].inc(int(fault_pos.size))
         try:
-            # Build features for RUL
-            x_rul_list = []
-            for f in rul_features:
-                if f == clf_label_col and clf_label_col and pred_code is not None:
-                    # Use encoded prediction code from classifier
-                    x_rul_list.append(float(pred_code))
-                else:
-                    # Use feature from input data
-                    x_rul_list.append(float(data.get(f, 0.0)))
-            
-            x_rul = np.array([x_rul_list])
-            # Handle both direct model and pyfunc wrapper
-            if hasattr(rul_model, 'predict'):
-                rul_pred = rul_model.predict(x_rul)
-                rul_value = float(rul_pred[0] if hasattr(rul_pred, '__len__') and len(rul_pred) > 0 else rul_pred)
-            else:
-                # Fallback
-                rul_value = float(rul_model(x_rul)[0]) if callable(rul_model) else None
+            # Use encoded prediction code from classifier for the label column
+            t0 = time.perf_counter()
+            x_rul = feature_layout.rul(X_anomalous[fault_pos], pred_codes[fault_pos])
+            rul_pred = _model_predict(bundle.rul_predictor, x_rul)
+            stage_timers["rul"].observe(time.perf_counter() - t0)
+            if rul_pred is not None:
+                for j, v in zip(fault_pos, rul_pred):
+                    rul_values[j] = float(v)
         except Exception as e:
             import traceback
             print(f"[ERROR] RUL prediction failed: {e}")
             print(f"[ERROR] Traceback: {traceback.format_exc()}")
-            rul_value = None
-
-    result["RUL_estimated"] = rul_value
 
     # ========================================================
     # FINAL MONITORING HOOK (ONLY PLACE)
     # ========================================================
-    if result.get("IF_Anomaly") == 1:
-        ANOMALY_PREDICTIONS.inc()
+    ANOMALY_PREDICTIONS.inc(m)
 
     # ========================================================
-    # 4) Kafka Event - Only push alerts
+    # 4) Kafka Event - Only push alerts (every anomalous row)
     # ========================================================
-    # Format: Match alert_service expected format
-    alert_payload = {
-        "timestamp": int(time.time()),
-        "host": socket.gethostname(),
-        "input": payload.data,
-        "prediction": {
-            "IF_Anomaly": int(is_anomaly),
-            "classifier_label": str(classifier_label) if classifier_label else None,
-            "is_fault": bool(is_fault),
-            "RUL_estimated": float(rul_value) if rul_value is not None else None,
-            "failure_prob": payload.data.get("Failure_Probability", 0.0)  # Add for alert service
+    timestamp = int(time.time())
+    host = socket.gethostname()
+    t0 = time.perf_counter()
+    sent = 0
+    # Kiểm tra một lần cho cả batch; Kafka tắt -> chỉ điền results, không dựng alert
+    send_alerts = kafka_available()
+    if not send_alerts and anomaly_idx.size:
+        _warn_kafka_disabled(anomaly_idx.size)
+    for j, i in enumerate(anomaly_idx):
+        label = classifier_labels[j]
+        # Ensure all values in result are JSON serializable (Python native types)
+        prediction = {
+            "IF_Anomaly": 1,
+            "classifier_label": str(label) if label else None,
+            "is_fault": bool(is_fault[j]),
+            "RUL_estimated": rul_values[j]
         }
-    }
+        results[i] = prediction
+        if not send_alerts:
+            continue
 
-    if is_anomaly == 1 or is_fault:
-        kafka_success = kafka_send_prediction(alert_payload)
-        if not kafka_success:
-            print(f"[WARN] Failed to send alert to Kafka, but prediction completed successfully")
-
-    # Ensure all values in result are JSON serializable (Python native types)
-    json_result = {
-        "IF_Anomaly": int(result.get("IF_Anomaly", 0)),
-        "classifier_label": str(result.get("classifier_label")) if result.get("classifier_label") else None,
-        "is_fault": bool(result.get("is_fault", False)),
-        "RUL_estimated": float(result.get("RUL_estimated")) if result.get("RUL_estimated") is not None else None
-    }
-    
-    # Add status if present
-    if "status" in result:
-        json_result["status"] = str(result["status"])
-    
-    return json_result
+        # Format: Match alert_service expected format
+        alert_payload = {
+            "timestamp": timestamp,
+            "host": host,
+            "input": rows[i],
+            "prediction": {
+                **prediction,
+                "failure_prob": rows[i].get("Failure_Probability", 0.0)  # Add for alert service
+            }
+        }
+        # Chỉ đếm alert mà producer nhận (Kafka tắt / queue đầy -> không tính)
+        if kafka_send_prediction(alert_payload):
+            sent += 1
+    STAGE_ROW_COUNTERS["kafka"].inc(sent)
+    stage_timers["kafka_produce"].observe(time.perf_counter() - t0)
+
+    return results
+
+# ============================================================
+# ---------------------- MICRO-BATCHING ------------------------
+# ============================================================
+
+# Opt-in: gom các /predict đồng thời thành một batch trước khi score
+MICROBATCH_ENABLED = os.getenv("PREDICT_MICROBATCH_ENABLED", "false").lower() == "true"
+MICROBATCH_MAX_SIZE = int(os.getenv("PREDICT_MICROBATCH_MAX_SIZE", "64"))
+MICROBATCH_MAX_WAIT_MS = float(os.getenv("PREDICT_MICROBATCH_MAX_WAIT_MS", "2"))
+MICROBATCH_TIMEOUT_S = float(os.getenv("PREDICT_MICROBATCH_TIMEOUT_S", "30"))
+
+micro_batcher = None
+if MICROBATCH_ENABLED:
+    micro_batcher = MicroBatcher(
+        _score_batch,
+        max_batch_size=MICROBATCH_MAX_SIZE,
+        max_wait_ms=MICROBATCH_MAX_WAIT_MS,
+        result_timeout=MICROBATCH_TIMEOUT_S
+    )
+
+@app.on_event("startup")
+def start_micro_batcher():
+    # Thread của batcher phải được tạo trong process phục vụ (sau fork nếu chạy pre-fork)
+    if micro_batcher is not None:
+        micro_batcher.start()
+
+@app.on_event("shutdown")
+def stop_micro_batcher():
+    if micro_batcher is not None:
+        micro_batcher.stop()
+
+@app.on_event("shutdown")
+def flush_kafka_producer():
+    # Sau micro-batcher: alert của batch cuối đã vào queue trước khi drain + flush
+    if kafka_producer is not None:
+        kafka_producer.stop(timeout=KAFKA_FLUSH_TIMEOUT)
+
+@app.on_event("shutdown")
+def stop_model_store():
+    model_store.shutdown()
+
+def _anomaly_models_missing_response():
+    return JSONResponse(
+        status_code=503,
+        content={"error": "Anomaly model/scaler/features missing. Run anomaly pipeline first."}
+    )
+
+@app.post("/predict")
+def predict(payload: Payload, request: Request):
+    bundle = model_store.current
+    if bundle is None or not bundle.anomaly_ready:
+        return _anomaly_models_missing_response()
+
+    if request_profiler.enabled or (ADMIN_TOKEN and "x-profile" in request.headers):
+        force = request.headers.get("x-profile") == "1" and _admin_authorized(request)
+        if request_profiler.should_profile(force):
+            # Không qua micro-batcher để profile cả cascade trong thread của request
+            with request_profiler.profile():
+                return _predict_one(payload.data, bundle, use_batcher=False)
+    return _predict_one(payload.data, bundle)
+
+def _predict_one(data: Dict[str, Any], bundle: ModelBundle, use_batcher: bool = True):
+    try:
+        if use_batcher and micro_batcher is not None:
+            try:
+                return micro_batcher.predict(data)
+            except FuturesTimeoutError:
+                return JSONResponse(status_code=503, content={"error": "Timed out waiting for micro-batch result"})
+            except BatcherStopped as e:
+                return JSONResponse(status_code=503, content={"error": str(e)})
+        return _score_batch([data], bundle)[0]
+    except InferenceError as e:
+        return JSONResponse(status_code=500, content={"error": str(e)})
+
+@app.post("/predict/batch")
+def predict_batch(payload: BatchPayload):
+    """
+    Score nhiều dòng telemetry trong một request.
+
+    Mỗi stage (IsolationForest, classifier, RUL) chạy một lần trên cả ma trận;
+    `results[i]` có cùng format với response của `/predict` cho `rows[i]`.
+    """
+    bundle = model_store.current
+    if bundle is None or not bundle.anomaly_ready:
+        return _anomaly_models_missing_response()
+
+    if len(payload.rows) > PREDICT_BATCH_MAX_ROWS:
+        return JSONResponse(
+            status_code=413,
+            content={"error": f"Batch too large: {len(payload.rows)} rows (max {PREDICT_BATCH_MAX_ROWS})"}
+        )
+
+    try:
+        results = _score_batch(payload.rows, bundle)
+    except InferenceError as e:
+        return JSONResponse(status_code=500, content={"error": str(e)})
+
+    return {"count": len(results), "results": results}
 
 # ============================================================
 # ---------------------- TRAINING ENDPOINTS --------------------
@@ -664,22 +1055,28 @@ async def start_training(request: TrainingRequest):
     
     - **force**: Nếu True, sẽ bắt đầu training ngay cả khi đang có job đang chạy
     - **rebuild**: Nếu True, sẽ build lại Docker image trước khi chạy training
+
+    Chạy pre-fork: worker chỉ đặt state rồi báo master, master chạy job thành
+    process riêng (src/training_job.py), nên chỉ một job chạy dù request tới worker nào.
     """
-    global training_state
-    
-    if training_state["status"] == "running" and not request.force:
+    pid = prefork_worker.master_pid if prefork_worker is not None else None
+    if not training_state.begin(request.rebuild, force=request.force, pid=pid):
         return JSONResponse(
             status_code=400,
             content={
                 "message": "Training is already running!",
-                "status": training_state["status"],
+                "status": "running",
                 "hint": "Use force=true to stop current job and start new one"
             }
         )
     
-    # Start training in background thread
-    thread = threading.Thread(target=run_training, args=(request.rebuild,), daemon=True)
-    thread.start()
+    if prefork_worker is not None:
+        prefork_worker.request_training()
+    else:
+        # Start training in background thread
+        thread = threading.Thread(target=run_training, args=(training_state, request.rebuild, _reload_after_training),
+                                  daemon=True)
+        thread.start()
     
     return JSONResponse(content={
         "message": "Training started! Check status at /api/training/status",
@@ -690,27 +1087,47 @@ async def start_training(request: TrainingRequest):
 @app.get("/api/training/status")
 async def get_training_status():
     """API endpoint để lấy training status."""
-    return JSONResponse(content=training_state)
+    return JSONResponse(content=training_state.snapshot())
 
 @app.get("/api/training/logs")
 async def get_training_logs():
     """API endpoint để lấy training logs."""
+    logs = training_state.logs()
     return JSONResponse(content={
-        "logs": training_state["log"],
-        "total": len(training_state["log"])
+        "logs": logs,
+        "total": len(logs)
     })
 
 @app.post("/api/models/reload")
-async def reload_models_endpoint():
-    """API endpoint để reload models từ disk (sau khi training xong)."""
+async def reload_models_endpoint(wait: bool = False):
+    """
+    API endpoint để reload models từ disk (sau khi training xong).
+
+    Bundle mới được load + warm ở background và swap vào khi xong; request
+    đang chạy vẫn hoàn tất trên bundle cũ. `wait=true` chờ swap rồi mới trả về.
+
+    Chạy pre-fork: master load bundle mới rồi thay toàn bộ workers; `wait=true`
+    chờ tới khi thế hệ workers mới đã nhận request.
+    """
+    if prefork_worker is not None:
+        return await _prefork_reload(wait)
+
+    future = model_store.reload_async()
+    if not wait:
+        current = model_store.current
+        return JSONResponse(status_code=202, content={
+            "message": "Model reload started in background",
+            "active_version": current.version if current is not None else None
+        })
     try:
-        reload_models()
+        bundle = await asyncio.wrap_future(future)
         return JSONResponse(content={
             "message": "Models reloaded successfully!",
+            "version": bundle.version,
             "models_loaded": {
-                "anomaly": isof is not None,
-                "classifier": clf_model is not None,
-                "rul": rul_model is not None
+                "anomaly": bundle.isof is not None,
+                "classifier": bundle.clf_model is not None,
+                "rul": bundle.rul_model is not None
             }
         })
     except Exception as e:
@@ -718,3 +1135,123 @@ async def reload_models_endpoint():
             status_code=500,
             content={"error": f"Failed to reload models: {str(e)}"}
         )
+
+async def _prefork_reload(wait: bool):
+    future = prefork_worker.request_reload()
+    current = model_store.current
+    if not wait:
+        return JSONResponse(status_code=202, content={
+            "message": "Model reload requested from pre-fork master",
+            "active_version": current.version if current is not None else None
+        })
+    try:
+        version = await asyncio.wrap_future(future)
+        return JSONResponse(content={
+            "message": "Models reloaded successfully!",
+            "version": version,
+            "workers": prefork_worker.workers
+        })
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={"error": f"Failed to reload models: {str(e)}"}
+        )
+
+# ============================================================
+# ------------------- ADMIN: PROFILING -----------------------
+# ============================================================
+
+# Admin endpoints cần header `X-Admin-Token`; không đặt ADMIN_TOKEN thì tắt hẳn (404)
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "120"))
+
+request_profiler = RequestProfiler()
+_stack_sampler_lock = threading.Lock()
+
+def _admin_authorized(request: Request) -> bool:
+    token = request.headers.get("x-admin-token", "")
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode())
+
+def _admin_denied(request: Request) -> Optional[JSONResponse]:
+    if not ADMIN_TOKEN:
+        return JSONResponse(status_code=404, content={"error": "Admin endpoints disabled (set ADMIN_TOKEN)"})
+    if not _admin_authorized(request):
+        return JSONResponse(status_code=403, content={"error": "Invalid or missing X-Admin-Token"})
+    return None
+
+def _attachment(body, filename: str, media_type: str) -> Response:
+    return Response(body, media_type=media_type, headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+@app.post("/admin/profile/sample")
+async def profile_sample(request: Request, seconds: float = 10.0, interval_ms: float = 5.0):
+    """
+    Sampling profile mọi thread của process (worker nhận request) trong `seconds` giây.
+
+    Trả về collapsed stacks (`thread;frame;...;frame count`) cho flamegraph.pl / speedscope.
+    """
+    denied = _admin_denied(request)
+    if denied is not None:
+        return denied
+    if not 0 < seconds <= PROFILE_MAX_SECONDS or interval_ms < 1:
+        return JSONResponse(status_code=400, content={
+            "error": f"seconds must be in (0, {PROFILE_MAX_SECONDS:g}] and interval_ms >= 1"
+        })
+    if not _stack_sampler_lock.acquire(blocking=False):
+        return JSONResponse(status_code=409, content={"error": "A sampling profile is already running"})
+    try:
+        sampler = StackSampler(interval=interval_ms / 1000)
+        sampler.start()
+        await asyncio.sleep(seconds)
+        await asyncio.get_running_loop().run_in_executor(None, sampler.stop)
+    finally:
+        _stack_sampler_lock.release()
+    return _attachment(
+        sampler.collapsed(), f"profile-{os.getpid()}-{int(time.time())}.collapsed", "text/plain"
+    )
+
+@app.post("/admin/profile/requests")
+def profile_requests_start(request: Request, fraction: float = 0.01, max_calls: int = 100):
+    """
+    Bật cProfile cho `fraction` các lần gọi `/predict` (tối đa `max_calls`), xoá kết quả cũ.
+
+    Một call cụ thể luôn được profile nếu có header `X-Profile: 1` + `X-Admin-Token`.
+    Pre-fork: áp dụng cho mọi worker (config trong shared memory của master).
+    """
+    denied = _admin_denied(request)
+    if denied is not None:
+        return denied
+    request_profiler.configure(fraction, max_calls)
+    return JSONResponse(content=request_profiler.status())
+
+@app.get("/admin/profile/requests")
+def profile_requests_result(
+    request: Request,
+    fmt: str = Query("pstats", alias="format"),
+    sort: str = "cumulative",
+    limit: int = 50,
+):
+    """Kết quả gộp của mọi worker: `format=pstats` (file cho `pstats` / snakeviz) hoặc `format=text`."""
+    denied = _admin_denied(request)
+    if denied is not None:
+        return denied
+    if fmt == "text" and sort not in SORT_KEYS:
+        return JSONResponse(status_code=400, content={
+            "error": f"sort must be one of: {', '.join(SORT_KEYS)}"
+        })
+    if fmt == "text":
+        body = request_profiler.text(sort=sort, limit=limit)
+    else:
+        body = request_profiler.dump()
+    if body is None:
+        return JSONResponse(status_code=404, content={"error": "No profiled calls yet", **request_profiler.status()})
+    if fmt == "text":
+        return Response(body, media_type="text/plain")
+    return _attachment(body, f"predict-{os.getpid()}-{int(time.time())}.pstats", "application/octet-stream")
+
+@app.delete("/admin/profile/requests")
+def profile_requests_stop(request: Request):
+    denied = _admin_denied(request)
+    if denied is not None:
+        return denied
+    request_profiler.disable()
+    return JSONResponse(content=request_profiler.status())
@@ -0,0 +1,247 @@
+"""
+Broker Kafka in-process để chạy / benchmark streaming scorer không cần Kafka thật.
+
+Chỉ mô phỏng phần API confluent_kafka mà repo dùng:
+
+- `InMemoryProducer`: `produce`, `poll`, `flush`, `len()`; message có key vào
+  partition theo hash của key (crc32, không phải murmur2), delivery callback
+  chạy trong `poll` / `flush`. `failure_rate` giả lập delivery lỗi.
+- `InMemoryConsumer`: `subscribe`, `poll`, `consume`, `commit`, `seek`,
+  `get_watermark_offsets`, `committed_offsets`, `close`. Một consumer trong group nhận mọi partition (không
+  có rebalance); offset bắt đầu từ offset đã commit của group.
+- `TopicPartition`: (topic, partition, offset) cho `seek` khi không có confluent_kafka.
+
+Message có `timestamp()` kiểu CreateTime (ms) như Kafka.
+"""
+
+import random
+import threading
+import time
+import zlib
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+TIMESTAMP_CREATE_TIME = 1
+
+
+class TopicPartition(NamedTuple):
+    """Thay cho `confluent_kafka.TopicPartition` (chỉ các field `seek` / `commit` cần)."""
+    topic: str
+    partition: int = -1
+    offset: int = -1001
+
+
+class InMemoryMessage:
+    __slots__ = ("_topic", "_partition", "_offset", "_key", "_value", "_headers", "_timestamp")
+
+    def __init__(self, topic, partition, offset, key, value, headers, timestamp_ms):
+        self._topic = topic
+        self._partition = partition
+        self._offset = offset
+        self._key = key
+        self._value = value
+        self._headers = headers
+        self._timestamp = timestamp_ms
+
+    def topic(self):
+        return self._topic
+
+    def partition(self):
+        return self._partition
+
+    def offset(self):
+        return self._offset
+
+    def key(self):
+        return self._key
+
+    def value(self):
+        return self._value
+
+    def headers(self):
+        return self._headers
+
+    def timestamp(self) -> Tuple[int, int]:
+        return TIMESTAMP_CREATE_TIME, self._timestamp
+
+    def error(self):
+        return None
+
+
+def _as_bytes(value):
+    if value is None or isinstance(value, bytes):
+        return value
+    return str(value).encode("utf-8")
+
+
+class InMemoryBroker:
+    """
+    Topics -> partitions -> list message, cùng offsets đã commit theo group.
+
+    Args:
+        partitions: số partition của mỗi topic (tự tạo khi produce / subscribe)
+    """
+
+    def __init__(self, partitions: int = 1):
+        self.partitions = max(1, int(partitions))
+        self.topics: Dict[str, List[List[InMemoryMessage]]] = {}
+        self.committed: Dict[Tuple[str, str, int], int] = {}
+        self._round_robin = 0
+        self.cond = threading.Condition()
+
+    def _topic(self, topic: str) -> List[List[InMemoryMessage]]:
+        if topic not in self.topics:
+            self.topics[topic] = [[] for _ in range(self.partitions)]
+        return self.topics[topic]
+
+    def append(self, topic: str, value, key=None, headers=None, partition: Optional[int] = None) -> InMemoryMessage:
+        key, value = _as_bytes(key), _as_bytes(value)
+        with self.cond:
+            partitions = self._topic(topic)
+            if partition is None:
+                if key is not None:
+                    partition = zlib.crc32(key) % len(partitions)
+                else:
+                    partition = self._round_robin % len(partitions)
+                    self._round_robin += 1
+            log = partitions[partition]
+            msg = InMemoryMessage(topic, partition, len(log), key, value, headers, int(time.time() * 1000))
+            log.append(msg)
+            self.cond.notify_all()
+        return msg
+
+    def messages(self, topic: str) -> List[InMemoryMessage]:
+        """Mọi message của topic (theo partition rồi offset)."""
+        with self.cond:
+            return [msg for log in self._topic(topic) for msg in log]
+
+    def end_offsets(self, topic: str) -> Dict[int, int]:
+        with self.cond:
+            return {p: len(log) for p, log in enumerate(self._topic(topic))}
+
+
+class InMemoryProducer:
+    """
+    Args:
+        broker: InMemoryBroker
+        failure_rate: tỉ lệ message có delivery report lỗi (message không được ghi)
+    """
+
+    def __init__(self, broker: InMemoryBroker, failure_rate: float = 0.0, seed: int = 0):
+        self.broker = broker
+        self.failure_rate = failure_rate
+        self._rng = random.Random(seed)
+        self._pending: List[Tuple[Any, Any, Optional[InMemoryMessage]]] = []
+        self._lock = threading.Lock()
+
+    def produce(self, topic, value=None, key=None, headers=None, partition=None, on_delivery=None, callback=None):
+        on_delivery = on_delivery or callback
+        if self.failure_rate and self._rng.random() < self.failure_rate:
+            msg, err = None, "in-memory broker: simulated delivery failure"
+        else:
+            msg, err = self.broker.append(topic, value, key=key, headers=headers, partition=partition), None
+        with self._lock:
+            self._pending.append((on_delivery, err, msg))
+
+    def poll(self, timeout: float = 0) -> int:
+        with self._lock:
+            pending, self._pending = self._pending, []
+        for on_delivery, err, msg in pending:
+            if on_delivery is not None:
+                on_delivery(err, msg)
+        return len(pending)
+
+    def flush(self, timeout: float = None) -> int:
+        self.poll()
+        return 0
+
+    def __len__(self):
+        return len(self._pending)
+
+
+class InMemoryConsumer:
+    """
+    Args:
+        broker: InMemoryBroker
+        group_id: consumer group (offsets commit được lưu theo group)
+    """
+
+    def __init__(self, broker: InMemoryBroker, group_id: str = "in-memory"):
+        self.broker = broker
+        self.group_id = group_id
+        self.topics: List[str] = []
+        self.positions: Dict[Tuple[str, int], int] = {}
+
+    def subscribe(self, topics, on_assign=None, on_revoke=None, on_lost=None):
+        self.topics = list(topics)
+        with self.broker.cond:
+            for topic in self.topics:
+                for partition in range(len(self.broker._topic(topic))):
+                    self.positions[(topic, partition)] = self.broker.committed.get((self.group_id, topic, partition), 0)
+        if on_assign is not None:
+            on_assign(self, [_Partition(topic, partition, offset) for (topic, partition), offset in self.positions.items()])
+
+    def _available(self) -> int:
+        return sum(len(self.broker.topics[topic][partition]) - offset
+                   for (topic, partition), offset in self.positions.items())
+
+    def consume(self, num_messages: int = 1, timeout: float = -1) -> List[InMemoryMessage]:
+        """Chờ tới khi có đủ `num_messages` hoặc hết `timeout` (như confluent_kafka)."""
+        deadline = None if timeout is None or timeout < 0 else time.monotonic() + timeout
+        with self.broker.cond:
+            while self._available() < num_messages:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                self.broker.cond.wait(remaining)
+            batch = []
+            for (topic, partition), offset in self.positions.items():
+                log = self.broker.topics[topic][partition]
+                take = log[offset:offset + num_messages - len(batch)]
+                batch.extend(take)
+                self.positions[(topic, partition)] = offset + len(take)
+                if len(batch) >= num_messages:
+                    break
+        return batch
+
+    def poll(self, timeout: float = -1) -> Optional[InMemoryMessage]:
+        batch = self.consume(1, timeout)
+        return batch[0] if batch else None
+
+    def seek(self, partition):
+        """`partition`: TopicPartition (hoặc object có topic / partition / offset)."""
+        with self.broker.cond:
+            self.positions[(partition.topic, partition.partition)] = partition.offset
+
+    def commit(self, message=None, offsets=None, asynchronous: bool = True):
+        """Không tham số: commit vị trí hiện tại của mọi partition (như confluent_kafka)."""
+        with self.broker.cond:
+            if message is not None:
+                items = [((message.topic(), message.partition()), message.offset() + 1)]
+            elif offsets is not None:
+                items = [((tp.topic, tp.partition), tp.offset) for tp in offsets]
+            else:
+                items = list(self.positions.items())
+            for (topic, partition), offset in items:
+                self.broker.committed[(self.group_id, topic, partition)] = offset
+
+    def get_watermark_offsets(self, partition, timeout=None, cached=False) -> Tuple[int, int]:
+        """(low, high) của partition (`partition`: TopicPartition hoặc tương đương)."""
+        with self.broker.cond:
+            return 0, len(self.broker._topic(partition.topic)[partition.partition])
+
+    def committed_offsets(self) -> Dict[Tuple[str, int], int]:
+        with self.broker.cond:
+            return {(topic, partition): self.broker.committed.get((self.group_id, topic, partition), 0)
+                    for (topic, partition) in self.positions}
+
+    def close(self):
+        self.positions = {}
+
+
+class _Partition:
+    __slots__ = ("topic", "partition", "offset")
+
+    def __init__(self, topic, partition, offset):
+        self.topic = topic
+        self.partition = partition
+        self.offset = offset
@@ -0,0 +1,79 @@
+"""
+Prometheus metrics cho cả chạy một process lẫn pre-fork multi-worker.
+
+Khi `PROMETHEUS_MULTIPROC_DIR` được đặt (src/prefork.py tự tạo nếu chưa có),
+prometheus_client ghi giá trị của mỗi process vào file mmap
+`<dir>/<type>_<pid>.db` (một lần ghi mmap cho mỗi inc/observe, không IPC), và
+`/metrics` gộp tất cả file lúc scrape:
+
+- Counter / Histogram: cộng dồn mọi process, kể cả worker đã thoát (không tụt số).
+- Gauge: theo `multiprocess_mode` khai báo ở từng metric (`livesum`, `livemax`).
+- Worker thoát: master gọi `mark_process_dead(pid)` để bỏ gauge `live*` của nó.
+
+Lưu ý: prometheus_client chọn kiểu value (in-process / mmap) lúc nó được import
+lần đầu, nên `prepare_multiprocess_dir` phải chạy trước khi import bất kỳ
+module nào khai báo metrics. Module này chỉ import prometheus_client lazily.
+"""
+
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Optional
+
+MULTIPROC_ENV = "PROMETHEUS_MULTIPROC_DIR"
+
+
+def multiprocess_dir() -> Optional[str]:
+    return os.environ.get(MULTIPROC_ENV) or os.environ.get(MULTIPROC_ENV.lower())
+
+
+def prepare_multiprocess_dir(path: Optional[str] = None) -> str:
+    """
+    Tạo (hoặc dọn sạch) thư mục multiprocess và export env cho process hiện tại + con.
+
+    Args:
+        path: thư mục; mặc định `PROMETHEUS_MULTIPROC_DIR` hoặc một temp dir mới
+
+    Returns:
+        Đường dẫn thư mục
+    """
+    path = path or multiprocess_dir() or tempfile.mkdtemp(prefix="ev-prometheus-")
+    directory = Path(path)
+    directory.mkdir(parents=True, exist_ok=True)
+    # File .db của lần chạy trước (pid cũ) sẽ bị cộng vào counters nếu để lại
+    for stale in directory.glob("*.db"):
+        stale.unlink()
+    os.environ[MULTIPROC_ENV] = str(directory)
+    return str(directory)
+
+
+def remove_multiprocess_dir(path: str):
+    shutil.rmtree(path, ignore_errors=True)
+
+
+def mark_process_dead(pid: int):
+    """Gọi ở master khi một worker thoát: bỏ các gauge live* của pid đó."""
+    if multiprocess_dir() is None:
+        return
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(pid)
+
+
+def collector_registry():
+    """Registry để expose: registry mặc định, hoặc registry gộp mọi process nếu chạy multiprocess."""
+    from prometheus_client import REGISTRY, CollectorRegistry
+
+    if multiprocess_dir() is None:
+        return REGISTRY
+    from prometheus_client import multiprocess
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def render_latest():
+    """(body, content type) cho `/metrics`: gộp mọi worker nếu chạy multiprocess."""
+    from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+
+    return generate_latest(collector_registry()), CONTENT_TYPE_LATEST
@@ -0,0 +1,172 @@
+"""
+Server-side micro-batching cho `/predict`.
+
+Các request đơn lẻ được đưa vào queue, gom lại tối đa `max_batch_size` dòng
+hoặc chờ tối đa `max_wait_ms` kể từ dòng đầu tiên, rồi score chung một lần qua
+cascade (IsolationForest -> XGBoost -> LightGBM). Kết quả được trả lại cho
+từng caller đang chờ qua `concurrent.futures.Future`.
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from prometheus_client import Gauge, Histogram
+
+# =======================
+# MONITORING METRICS
+# =======================
+
+MICROBATCH_QUEUE_DEPTH = Gauge(
+    "inference_microbatch_queue_depth",
+    "Number of /predict rows waiting in the micro-batch queue",
+    multiprocess_mode="livesum"
+)
+
+MICROBATCH_SIZE = Histogram(
+    "inference_microbatch_size",
+    "Number of rows scored together per micro-batch",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+)
+
+MICROBATCH_WAIT = Histogram(
+    "inference_microbatch_wait_seconds",
+    "Time a row spent queued before its micro-batch started scoring",
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.002, 0.005, 0.01, 0.025, 0.05, 0.1)
+)
+
+
+class BatcherStopped(RuntimeError):
+    """Dòng không được score vì micro-batcher đã dừng (server đang shutdown)."""
+
+
+class MicroBatcher:
+    """
+    Gom các lời gọi đơn lẻ thành batch và chạy `score_fn` trên một worker thread.
+
+    Args:
+        score_fn: hàm nhận list rows và trả về list kết quả cùng thứ tự
+        max_batch_size: số dòng tối đa trong một batch
+        max_wait_ms: thời gian chờ tối đa (ms) kể từ dòng đầu tiên của batch
+        result_timeout: số giây tối đa `predict` chờ kết quả (None = không giới hạn)
+    """
+
+    def __init__(
+        self,
+        score_fn: Callable[[List[Dict[str, Any]]], List[Any]],
+        max_batch_size: int = 64,
+        max_wait_ms: float = 2.0,
+        result_timeout: Optional[float] = 30.0
+    ):
+        self.score_fn = score_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.result_timeout = result_timeout
+        self._queue: "queue.Queue[Tuple[Dict[str, Any], Future, float]]" = queue.Queue()
+        self._stop = threading.Event()
+        # submit kiểm tra _stop và put dưới cùng lock với stop(): sau khi stop()
+        # set _stop không còn dòng nào vào queue mà không được drain
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="predict-microbatcher", daemon=True)
+        self._thread.start()
+        print(f"✅ Micro-batching enabled (max_batch_size={self.max_batch_size}, "
+              f"max_wait_ms={self.max_wait * 1000:g})")
+
+    def stop(self, timeout: float = 5.0):
+        """Ngừng nhận dòng mới, chờ worker score nốt queue; dòng còn lại sau `timeout` bị fail."""
+        with self._lock:
+            self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+            self._thread = None
+        self._fail_pending(BatcherStopped("Micro-batcher is stopped"))
+
+    def submit(self, row: Dict[str, Any]) -> Future:
+        """Đưa một dòng vào queue; caller gọi `.result()` để chờ kết quả."""
+        future: Future = Future()
+        with self._lock:
+            if self._stop.is_set():
+                future.set_exception(BatcherStopped("Micro-batcher is stopped"))
+                return future
+            self._queue.put((row, future, time.perf_counter()))
+            MICROBATCH_QUEUE_DEPTH.inc()
+        return future
+
+    def predict(self, row: Dict[str, Any]):
+        """
+        Blocking helper cho endpoint sync: submit rồi chờ kết quả tối đa
+        `result_timeout` giây (`concurrent.futures.TimeoutError` nếu quá hạn).
+        """
+        return self.submit(row).result(timeout=self.result_timeout)
+
+    def _fail_pending(self, error: Exception):
+        """Fail các dòng còn trong queue (worker đã dừng nên không còn ai score chúng)."""
+        while True:
+            try:
+                _, future, _ = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            MICROBATCH_QUEUE_DEPTH.dec()
+            if not future.done():
+                future.set_exception(error)
+
+    def _collect(self) -> List[Tuple[Dict[str, Any], Future, float]]:
+        try:
+            first = self._queue.get(timeout=0.1)
+        except queue.Empty:
+            return []
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                if remaining <= 0:
+                    # Hết thời gian chờ: vẫn lấy những gì đã sẵn trong queue
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        MICROBATCH_QUEUE_DEPTH.dec(len(batch))
+        return batch
+
+    def _run(self):
+        while not self._stop.is_set() or not self._queue.empty():
+            batch = self._collect()
+            if not batch:
+                continue
+
+            started = time.perf_counter()
+            for _, _, enqueued in batch:
+                MICROBATCH_WAIT.observe(started - enqueued)
+            MICROBATCH_SIZE.observe(len(batch))
+
+            rows = [row for row, _, _ in batch]
+            try:
+                results = self.score_fn(rows)
+            except Exception as e:
+                if len(batch) == 1:
+                    batch[0][1].set_exception(e)
+                    continue
+                # Một dòng lỗi không được làm fail các request khác trong batch:
+                # score lại từng dòng để cô lập lỗi
+                self._score_individually(batch)
+                continue
+
+            for (_, future, _), result in zip(batch, results):
+                future.set_result(result)
+
+    def _score_individually(self, batch):
+        for row, future, _ in batch:
+            try:
+                future.set_result(self.score_fn([row])[0])
+            except Exception as e:
+                future.set_exception(e)
@@ -0,0 +1,98 @@
+"""
+Truy cập MLflow tối thiểu cho inference, không import `mlflow`.
+
+`import mlflow` tốn ~1s và hơn 100 MB RSS. Khi model đã có trong local
+model cache, server chỉ cần (1) version hiện tại của stage và (2) load
+estimator từ thư mục MLflow model đã download:
+
+- `get_latest_version_info` gọi thẳng REST API của tracking server
+  (`registered-models/get-latest-versions`), trả về cùng format với
+  `mlflow_utils.get_model_info`; None nếu tracking URI không phải http(s).
+- `load_model_dir` đọc file MLmodel và load model bằng chính thư viện của
+  flavor (pickle cho sklearn/lightgbm, `load_model` cho xgboost); None nếu
+  format không hỗ trợ - khi đó caller dùng `mlflow_utils.load_native_model`.
+"""
+
+import importlib
+import json
+import pickle
+import urllib.request
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import yaml
+
+# Model registry names
+MODEL_NAMES = {
+    "anomaly": "EV_Anomaly_Detector",
+    "classifier": "EV_Fault_Classifier",
+    "rul": "EV_RUL_Predictor"
+}
+
+
+def get_latest_version_info(
+    tracking_uri: str, registered_name: str, stage: str, timeout: float = 10.0
+) -> Optional[Dict[str, Any]]:
+    """
+    Version mới nhất của `registered_name` ở `stage` qua MLflow REST API.
+
+    Returns:
+        Dict như `get_model_info` (name, version, stage, run_id, creation_timestamp, flavor),
+        `{"error": ...}` nếu stage không có version nào, None nếu không dùng được REST
+    """
+    if not tracking_uri.startswith(("http://", "https://")):
+        return None
+    request = urllib.request.Request(
+        f"{tracking_uri.rstrip('/')}/api/2.0/mlflow/registered-models/get-latest-versions",
+        data=json.dumps({"name": registered_name, "stages": [stage]}).encode(),
+        headers={"Content-Type": "application/json"},
+        method="POST"
+    )
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        versions = json.loads(response.read()).get("model_versions", [])
+    if not versions:
+        return {"error": f"No model found in {stage} stage"}
+    version = versions[0]
+    tags = {t["key"]: t.get("value") for t in version.get("tags", [])}
+    return {
+        "name": registered_name,
+        "version": version["version"],
+        "stage": version.get("current_stage"),
+        "run_id": version.get("run_id"),
+        "creation_timestamp": int(version.get("creation_timestamp", 0)),
+        "flavor": tags.get("flavor")
+    }
+
+
+def _load_pickle(path: Path):
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+def load_model_dir(model_dir) -> Optional[Any]:
+    """
+    Load estimator gốc từ thư mục MLflow model (có file MLmodel) mà không import mlflow.
+
+    Returns:
+        Estimator, hoặc None nếu flavor/format không được hỗ trợ ở đây
+    """
+    model_dir = Path(model_dir)
+    with open(model_dir / "MLmodel") as f:
+        flavors = yaml.safe_load(f).get("flavors", {})
+
+    conf = flavors.get("xgboost")
+    if conf and conf.get("model_class") and conf.get("data"):
+        module_name, class_name = conf["model_class"].rsplit(".", 1)
+        model = getattr(importlib.import_module(module_name), class_name)()
+        model.load_model(str(model_dir / conf["data"]))
+        return model
+
+    conf = flavors.get("sklearn")
+    if conf and conf.get("serialization_format", "cloudpickle") in ("pickle", "cloudpickle"):
+        return _load_pickle(model_dir / conf.get("pickled_model", "model.pkl"))
+
+    conf = flavors.get("lightgbm")
+    if conf and str(conf.get("data", "")).endswith(".pkl"):
+        return _load_pickle(model_dir / conf["data"])
+
+    return None
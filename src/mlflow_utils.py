@@ -3,17 +3,26 @@ Utility functions for MLflow Model Registry integration
 """
 
 import os
+import shutil
 import mlflow
 import joblib
 from pathlib import Path
 from typing import Optional, Dict, Any
 from mlflow.tracking import MlflowClient
 
-# Model registry names
-MODEL_NAMES = {
-    "anomaly": "EV_Anomaly_Detector",
-    "classifier": "EV_Fault_Classifier",
-    "rul": "EV_RUL_Predictor"
+# Model registry names (định nghĩa trong mlflow_lite để server dùng được mà không import mlflow);
+# training chạy với src/ trên sys.path, inference import qua package src
+try:
+    from src.mlflow_lite import MODEL_NAMES
+except ImportError:
+    from mlflow_lite import MODEL_NAMES
+
+# MLflow flavor used to save each model; recorded as the "flavor" tag of every
+# registered version so serving can load the raw estimator with the native loader
+MODEL_FLAVORS = {
+    "anomaly": "sklearn",
+    "classifier": "xgboost",
+    "rul": "lightgbm"
 }
 
 def get_mlflow_client() -> MlflowClient:
@@ -21,6 +30,11 @@ def get_mlflow_client() -> MlflowClient:
     tracking_uri = os.getenv("MLFLOW_TRACKING_URI", "http://localhost:6969")
     return MlflowClient(tracking_uri=tracking_uri)
 
+def _tag_flavor(model_name: str, version: str):
+    """Record the flavor of a registered model version (tag "flavor")."""
+    client = get_mlflow_client()
+    client.set_model_version_tag(MODEL_NAMES[model_name], str(version), "flavor", MODEL_FLAVORS[model_name])
+
 def register_anomaly_model(
     model_dir: Path,
     run_id: Optional[str] = None,
@@ -69,6 +83,8 @@ def register_anomaly_model(
         mlflow.log_artifact(str(model_dir / "scaler.joblib"), "anomaly_artifacts")
     if (model_dir / "isofeat.joblib").exists():
         mlflow.log_artifact(str(model_dir / "isofeat.joblib"), "anomaly_artifacts")
+    if (model_dir / "anomaly.onnx").exists():
+        mlflow.log_artifact(str(model_dir / "anomaly.onnx"), "anomaly_artifacts")
     
     # Register model to Model Registry (separate step)
     try:
@@ -79,6 +95,7 @@ def register_anomaly_model(
         
         # Get version from ModelVersion object
         version = mv.version
+        _tag_flavor("anomaly", version)
         
         # Transition to stage if needed
         if stage and stage != "None":
@@ -141,7 +158,7 @@ def register_classifier_model(
     
     # Log additional artifacts
     artifacts = ["scaler.joblib", "features.joblib", "label_encoder.joblib", 
-                 "normal_label.joblib", "label_col.joblib"]
+                 "normal_label.joblib", "label_col.joblib", "classifier.onnx"]
     for artifact in artifacts:
         if (model_dir / artifact).exists():
             mlflow.log_artifact(str(model_dir / artifact), "classifier_artifacts")
@@ -155,6 +172,7 @@ def register_classifier_model(
         
         # Get version from ModelVersion object
         version = mv.version
+        _tag_flavor("classifier", version)
         
         # Transition to stage if needed
         if stage and stage != "None":
@@ -217,6 +235,8 @@ def register_rul_model(
     # Log features
     if (model_dir / "rul_features.joblib").exists():
         mlflow.log_artifact(str(model_dir / "rul_features.joblib"), "rul_artifacts")
+    if (model_dir / "rul.onnx").exists():
+        mlflow.log_artifact(str(model_dir / "rul.onnx"), "rul_artifacts")
     
     # Register model to Model Registry
     try:
@@ -227,6 +247,7 @@ def register_rul_model(
         
         # Get version from ModelVersion object
         version = mv.version
+        _tag_flavor("rul", version)
         
         # Transition to stage if needed
         if stage and stage != "None":
@@ -246,21 +267,66 @@ def register_rul_model(
         print(f"   Model logged at: {model_uri}")
         raise
 
+def get_model_flavor(model_path: str) -> Optional[str]:
+    """
+    Read the flavor of a local MLflow model directory from its MLmodel file.
+    
+    Returns:
+        First native flavor found (sklearn, xgboost, lightgbm) or None
+    """
+    from mlflow.models import Model
+    
+    flavors = Model.load(str(model_path)).flavors
+    for flavor in ("sklearn", "xgboost", "lightgbm"):
+        if flavor in flavors:
+            return flavor
+    return None
+
+def load_native_model(model_uri: str, flavor: Optional[str] = None):
+    """
+    Load a model with its native flavor loader (raw sklearn/xgboost/lightgbm estimator).
+    
+    Unlike `mlflow.pyfunc.load_model`, the returned object's `predict` takes the
+    numpy matrix directly, without converting every call into a pandas DataFrame.
+    
+    Args:
+        model_uri: MLflow model URI or local model directory
+        flavor: sklearn, xgboost or lightgbm (if None, read from the MLmodel file)
+    
+    Returns:
+        Raw estimator
+    """
+    if flavor is None:
+        flavor = get_model_flavor(model_uri)
+    
+    if flavor == "sklearn":
+        import mlflow.sklearn
+        return mlflow.sklearn.load_model(model_uri)
+    if flavor == "xgboost":
+        import mlflow.xgboost
+        return mlflow.xgboost.load_model(model_uri)
+    if flavor == "lightgbm":
+        import mlflow.lightgbm
+        return mlflow.lightgbm.load_model(model_uri)
+    raise ValueError(f"No native loader for flavor {flavor!r} ({model_uri})")
+
 def load_model_from_registry(
     model_name: str,
     stage: str = "Production",
-    version: Optional[int] = None
+    version: Optional[int] = None,
+    flavor: Optional[str] = None
 ):
     """
-    Load model from MLflow Model Registry.
+    Load model from MLflow Model Registry with its native flavor.
     
     Args:
         model_name: Name of the model (anomaly, classifier, rul)
         stage: Stage to load from (Production, Staging, Archived)
         version: Specific version to load (if None, loads latest from stage)
+        flavor: Flavor recorded at registration (if None, uses MODEL_FLAVORS)
     
     Returns:
-        Loaded model
+        Loaded model (raw estimator)
     """
     if model_name not in MODEL_NAMES:
         raise ValueError(f"Unknown model name: {model_name}. Must be one of {list(MODEL_NAMES.keys())}")
@@ -273,7 +339,7 @@ def load_model_from_registry(
         model_uri = f"models:/{registered_name}/{stage}"
     
     try:
-        model = mlflow.pyfunc.load_model(model_uri)
+        model = load_native_model(model_uri, flavor=flavor or MODEL_FLAVORS[model_name])
         print(f"✅ Loaded {registered_name} from {model_uri}")
         return model
     except Exception as e:
@@ -306,10 +372,55 @@ def get_model_info(model_name: str, stage: str = "Production") -> Dict[str, Any]
                 "version": version.version,
                 "stage": version.current_stage,
                 "run_id": version.run_id,
-                "creation_timestamp": version.creation_timestamp
+                "creation_timestamp": version.creation_timestamp,
+                "flavor": (version.tags or {}).get("flavor")
             }
         else:
             return {"error": f"No model found in {stage} stage"}
     except Exception as e:
         return {"error": str(e)}
 
+
+def download_model_version(model_name: str, version: str, dst_dir: Path) -> Path:
+    """
+    Download a registered model version together with its companion artifacts.
+    
+    Args:
+        model_name: Name of the model (anomaly, classifier, rul)
+        version: Registered model version
+        dst_dir: Target directory (created); receives `model/` (MLflow model)
+                 and `artifacts/` (`<model_name>_artifacts` of the same run)
+    
+    Returns:
+        dst_dir
+    """
+    if model_name not in MODEL_NAMES:
+        raise ValueError(f"Unknown model name: {model_name}")
+    
+    registered_name = MODEL_NAMES[model_name]
+    client = get_mlflow_client()
+    mv = client.get_model_version(registered_name, str(version))
+    
+    dst_dir = Path(dst_dir)
+    dst_dir.mkdir(parents=True, exist_ok=True)
+    
+    # Model (source = runs:/<run_id>/<model_name>_model hoặc URI artifact store)
+    model_path = mlflow.artifacts.download_artifacts(artifact_uri=mv.source, dst_path=str(dst_dir / "_model"))
+    os.replace(model_path, dst_dir / "model")
+    shutil.rmtree(dst_dir / "_model", ignore_errors=True)
+    
+    # Companion artifacts (scaler, features, label encoder, .onnx, ...) của cùng run
+    artifacts_dir = dst_dir / "artifacts"
+    try:
+        path = mlflow.artifacts.download_artifacts(
+            run_id=mv.run_id,
+            artifact_path=f"{model_name}_artifacts",
+            dst_path=str(dst_dir / "_artifacts")
+        )
+        os.replace(path, artifacts_dir)
+        shutil.rmtree(dst_dir / "_artifacts", ignore_errors=True)
+    except Exception as e:
+        print(f"⚠️ No companion artifacts for {registered_name} v{version}: {e}")
+        artifacts_dir.mkdir(exist_ok=True)
+    
+    return dst_dir
@@ -0,0 +1,166 @@
+"""
+Versioned model bundle và hot-swap không downtime.
+
+Tất cả models/artifacts của cascade (anomaly, classifier, RUL cùng scaler,
+feature lists, layout và pipelines dựng từ chúng) được gom vào một
+`ModelBundle` bất biến. `ModelStore` load + warm bundle mới ở background
+thread rồi thay bằng một phép gán reference duy nhất; request đang chạy giữ
+reference tới bundle cũ và kết thúc trên bundle đó, request mới thấy bundle
+mới - không bao giờ thấy classifier mới đi với scaler cũ.
+"""
+
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, NamedTuple, Optional
+
+from prometheus_client import Gauge, Histogram
+
+MODEL_BUNDLE_VERSION = Gauge(
+    "inference_model_bundle_version",
+    "Version of the model bundle currently serving requests",
+    multiprocess_mode="livemax"
+)
+
+MODEL_BUNDLE_LOAD_SECONDS = Histogram(
+    "inference_model_bundle_load_seconds",
+    "Time to load and warm a model bundle in the background",
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+)
+
+MODEL_BUNDLE_SWAP_SECONDS = Histogram(
+    "inference_model_bundle_swap_seconds",
+    "Time requests are blocked while the active model bundle is swapped",
+    buckets=(1e-6, 5e-6, 1e-5, 5e-5, 1e-4, 5e-4, 1e-3, 5e-3, 1e-2)
+)
+
+MODEL_LOAD_PHASE_SECONDS = Gauge(
+    "inference_model_load_phase_seconds",
+    "Duration of each phase of the most recent model bundle load",
+    ["phase"],
+    multiprocess_mode="livemax"
+)
+
+STARTUP_SECONDS = Gauge(
+    "inference_startup_seconds",
+    "Time from process start until the first model bundle was serving",
+    multiprocess_mode="livemax"
+)
+
+
+class ModelBundle(NamedTuple):
+    """Một phiên bản đầy đủ của 3 models + artifacts; không sửa sau khi tạo."""
+
+    version: int
+    loaded_at: float
+    isof: Any = None
+    if_scaler: Any = None
+    if_features: Any = None
+    clf_model: Any = None
+    clf_scaler: Any = None
+    clf_features: Any = None
+    clf_label_encoder: Any = None
+    clf_normal_label: Any = None
+    clf_label_col: Any = None
+    rul_model: Any = None
+    rul_features: Any = None
+    feature_layout: Any = None
+    if_pipeline: Any = None
+    clf_pipeline: Any = None
+    rul_predictor: Any = None
+    model_info: Optional[Dict[str, Any]] = None
+    timings: Optional[Dict[str, float]] = None  # phase -> giây (load_<model>, build, warmup, total)
+
+    @property
+    def anomaly_ready(self) -> bool:
+        return self.isof is not None and self.if_scaler is not None and self.if_features is not None
+
+    @property
+    def classifier_ready(self) -> bool:
+        return bool(self.clf_model) and bool(self.clf_scaler) and bool(self.clf_features)
+
+    @property
+    def rul_ready(self) -> bool:
+        return bool(self.rul_model) and bool(self.rul_features)
+
+
+class ModelStore:
+    """
+    Giữ bundle đang phục vụ và load bundle mới ở background.
+
+    Args:
+        loader: hàm `loader(version) -> ModelBundle`, load + warm một bundle hoàn chỉnh
+        started_at: thời điểm process khởi động (time.time()), cho `inference_startup_seconds`
+    """
+
+    def __init__(self, loader: Callable[[int], ModelBundle], started_at: Optional[float] = None):
+        self._loader = loader
+        self._started_at = started_at if started_at is not None else time.time()
+        self._current: Optional[ModelBundle] = None
+        self._next_version = 1
+        self._swap_lock = threading.Lock()
+        self._pending_lock = threading.Lock()
+        self._pending: Optional[Future] = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="model-loader")
+
+    @property
+    def current(self) -> Optional[ModelBundle]:
+        """Bundle đang phục vụ; đọc một lần ở đầu request và dùng cho cả request."""
+        return self._current
+
+    @property
+    def reloading(self) -> bool:
+        pending = self._pending
+        return pending is not None and not pending.done()
+
+    def _load_and_swap(self) -> ModelBundle:
+        with self._swap_lock:
+            version = self._next_version
+            self._next_version += 1
+
+        start = time.perf_counter()
+        bundle = self._loader(version)
+        MODEL_BUNDLE_LOAD_SECONDS.observe(time.perf_counter() - start)
+        for phase, seconds in (bundle.timings or {}).items():
+            MODEL_LOAD_PHASE_SECONDS.labels(phase=phase).set(seconds)
+
+        start = time.perf_counter()
+        with self._swap_lock:
+            # Load chậm hơn một lần reload sau -> không ghi đè bundle mới hơn
+            if self._current is None:
+                STARTUP_SECONDS.set(time.time() - self._started_at)
+            if self._current is None or bundle.version > self._current.version:
+                self._current = bundle
+                MODEL_BUNDLE_VERSION.set(bundle.version)
+        MODEL_BUNDLE_SWAP_SECONDS.observe(time.perf_counter() - start)
+        return bundle
+
+    def reload(self) -> ModelBundle:
+        """Load + swap đồng bộ (dùng lúc khởi động hoặc từ thread đã chạy nền)."""
+        return self.reload_async().result()
+
+    def reload_in_thread(self) -> ModelBundle:
+        """
+        Load + swap ngay trong thread gọi, không qua executor.
+
+        Dùng ở pre-fork master (src/prefork.py): không để lại thread loader
+        nào trước khi fork workers.
+        """
+        return self._load_and_swap()
+
+    def reload_async(self) -> Future:
+        """
+        Load + swap ở background; trả về Future của bundle mới.
+
+        Nếu đang có một lần load chưa bắt đầu chạy thì dùng lại nó, để các
+        reload dồn dập chỉ load thêm một bundle mới nhất.
+        """
+        with self._pending_lock:
+            pending = self._pending
+            if pending is not None and not pending.running() and not pending.done():
+                return pending
+            self._pending = self._executor.submit(self._load_and_swap)
+            return self._pending
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
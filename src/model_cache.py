@@ -0,0 +1,231 @@
+"""
+Local on-disk model cache theo registered model name + version.
+
+Mỗi entry giữ MLflow model *và* companion artifacts (scaler, feature lists,
+label encoder, .onnx, ...) của đúng version đó, nên server không còn đọc
+artifacts từ `models/` local có thể lệch với version trên registry.
+
+Layout (content-addressed, dùng chung được giữa các pod qua một volume):
+
+    <root>/blobs/<sha256[:2]>/<sha256>            nội dung file, read-only, dedupe giữa các version
+    <root>/entries/<name>/<version>/files/...      hardlink tới blobs (cây thư mục như lúc download)
+    <root>/entries/<name>/<version>/manifest.json  path -> sha256/size; mtime = lần dùng gần nhất (LRU)
+
+Trên filesystem không hỗ trợ hardlink, file của entry là bản copy riêng (không
+vào blobs, `"linked": false` trong manifest) và được tính riêng vào dung lượng.
+
+Entry mới được dựng trong `<root>/tmp` rồi rename vào chỗ, nên reader không
+bao giờ thấy entry dở dang. Ghi/evict lấy file lock (`fcntl.flock`) trên
+`<root>/.lock` để nhiều process không download trùng.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from prometheus_client import Counter
+
+try:
+    import fcntl
+except ImportError:  # Windows dev: không có lock liên process
+    fcntl = None
+
+MODEL_CACHE_REQUESTS = Counter(
+    "inference_model_cache_requests_total",
+    "Model cache lookups by result",
+    ["result"]  # hit | miss
+)
+
+MANIFEST = "manifest.json"
+
+
+def _sha256(path: Path, chunk_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _safe_name(value: str) -> str:
+    return "".join(c if c.isalnum() or c in "-_." else "_" for c in str(value))
+
+
+class ModelCache:
+    """
+    Cache model theo (name, version), LRU theo tổng dung lượng.
+
+    Args:
+        root: thư mục cache
+        max_bytes: dung lượng tối đa (blobs sau dedupe + file copy riêng của entries); None = không giới hạn
+    """
+
+    def __init__(self, root, max_bytes: Optional[int] = None):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.blobs_dir = self.root / "blobs"
+        self.entries_dir = self.root / "entries"
+        self.tmp_dir = self.root / "tmp"
+        for d in (self.blobs_dir, self.entries_dir, self.tmp_dir):
+            d.mkdir(parents=True, exist_ok=True)
+
+    def _entry_dir(self, name: str, version) -> Path:
+        return self.entries_dir / _safe_name(name) / _safe_name(version)
+
+    @contextmanager
+    def _lock(self):
+        if fcntl is None:
+            yield
+            return
+        with open(self.root / ".lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def get(self, name: str, version) -> Optional[Path]:
+        """Thư mục files của entry nếu đã có trong cache (và đánh dấu vừa dùng), ngược lại None."""
+        entry = self._entry_dir(name, version)
+        manifest = entry / MANIFEST
+        if not manifest.exists():
+            return None
+        try:
+            os.utime(manifest)
+        except OSError:
+            pass
+        return entry / "files"
+
+    def fetch(self, name: str, version, download: Callable[[Path], None]) -> Path:
+        """
+        Trả về thư mục files của (name, version), download nếu chưa có.
+
+        Args:
+            name: registered model name
+            version: registered model version
+            download: `download(dst_dir)` ghi model + artifacts vào dst_dir (chưa tồn tại)
+        """
+        hit = self.get(name, version)
+        if hit is not None:
+            MODEL_CACHE_REQUESTS.labels(result="hit").inc()
+            return hit
+
+        with self._lock():
+            # Process khác có thể đã download xong trong lúc chờ lock
+            hit = self.get(name, version)
+            if hit is not None:
+                MODEL_CACHE_REQUESTS.labels(result="hit").inc()
+                return hit
+            MODEL_CACHE_REQUESTS.labels(result="miss").inc()
+
+            staging = Path(tempfile.mkdtemp(prefix=f"{_safe_name(name)}-", dir=self.tmp_dir))
+            try:
+                download(staging / "files")
+                manifest = {
+                    "name": name,
+                    "version": str(version),
+                    "created_at": time.time(),
+                    "files": self._ingest(staging / "files"),
+                }
+                (staging / MANIFEST).write_text(json.dumps(manifest, indent=2))
+
+                entry = self._entry_dir(name, version)
+                entry.parent.mkdir(parents=True, exist_ok=True)
+                os.rename(staging, entry)
+            except BaseException:
+                shutil.rmtree(staging, ignore_errors=True)
+                raise
+
+            self._evict(keep=entry)
+        print(f"✅ Cached {name} v{version} in {entry}")
+        return entry / "files"
+
+    def _ingest(self, files_dir: Path) -> Dict[str, Dict[str, object]]:
+        """
+        Hardlink từng file với blob cùng sha256 (dedupe). Không link được thì
+        file giữ nguyên là bản copy riêng của entry: không tạo blob, vì blob chỉ
+        có một link sẽ bị `_gc_blobs` xoá.
+        """
+        files = {}
+        for path in sorted(p for p in files_dir.rglob("*") if p.is_file()):
+            digest = _sha256(path)
+            size = path.stat().st_size
+            blob = self.blobs_dir / digest[:2] / digest
+            try:
+                if blob.exists():
+                    linked_tmp = path.with_name(path.name + ".link")
+                    os.link(blob, linked_tmp)
+                    os.replace(linked_tmp, path)
+                else:
+                    blob.parent.mkdir(parents=True, exist_ok=True)
+                    os.link(path, blob)
+                    os.chmod(blob, 0o444)
+                linked = True
+            except OSError:
+                linked = False
+            files[path.relative_to(files_dir).as_posix()] = {"sha256": digest, "size": size, "linked": linked}
+        return files
+
+    def verify(self, name: str, version) -> bool:
+        """Kiểm tra nội dung entry khớp sha256 trong manifest."""
+        entry = self._entry_dir(name, version)
+        try:
+            manifest = json.loads((entry / MANIFEST).read_text())
+        except (OSError, ValueError):
+            return False
+        return all(
+            (entry / "files" / rel).is_file() and _sha256(entry / "files" / rel) == meta["sha256"]
+            for rel, meta in manifest["files"].items()
+        )
+
+    def entries(self) -> List[Tuple[float, Path]]:
+        """(lần dùng gần nhất, thư mục entry), cũ nhất trước."""
+        found = []
+        for manifest in self.entries_dir.glob(f"*/*/{MANIFEST}"):
+            try:
+                found.append((manifest.stat().st_mtime, manifest.parent))
+            except OSError:
+                continue
+        return sorted(found)
+
+    def size_bytes(self) -> int:
+        """Blobs (mỗi nội dung một lần) + file của entries không link tới blob (copy riêng)."""
+        total = 0
+        for path in self.blobs_dir.rglob("*"):
+            if path.is_file():
+                total += path.stat().st_size
+        for path in self.entries_dir.glob("*/*/files/**/*"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            if path.is_file() and stat.st_nlink <= 1:
+                total += stat.st_size
+        return total
+
+    def _gc_blobs(self):
+        """Xoá blobs không còn entry nào link tới."""
+        for blob in self.blobs_dir.rglob("*"):
+            if blob.is_file() and blob.stat().st_nlink <= 1:
+                blob.unlink()
+
+    def _evict(self, keep: Optional[Path] = None):
+        """Xoá entries ít dùng nhất tới khi tổng blobs <= max_bytes (không xoá `keep`)."""
+        if self.max_bytes is None:
+            return
+        total = self.size_bytes()
+        for _, entry in self.entries():
+            if total <= self.max_bytes:
+                break
+            if keep is not None and entry == keep:
+                continue
+            print(f"🗑️ Evicting cached model {entry.parent.name} v{entry.name}")
+            shutil.rmtree(entry, ignore_errors=True)
+            self._gc_blobs()
+            total = self.size_bytes()
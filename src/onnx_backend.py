@@ -0,0 +1,229 @@
+"""
+ONNX export (training) và ONNX Runtime backend (inference).
+
+Training: `export_onnx_models` chuyển mỗi model kèm scaler của nó sang ONNX
+(`anomaly/anomaly.onnx`, `classifier/classifier.onnx`, `rul/rul.onnx`) trong
+thư mục `models/`, cạnh các artifacts joblib.
+
+Inference: `load_onnx_predictor` mở một onnxruntime session (CPU) với số
+thread intra-op cấu hình được; predictor nhận ma trận đã parse theo
+`FeatureLayout` và trả về label/giá trị 1D như model gốc.
+
+skl2onnx/onnxmltools (training) và onnxruntime (inference) là optional:
+thiếu package thì bỏ qua export / dùng lại backend native.
+"""
+
+import os
+from pathlib import Path
+from typing import Callable, Dict, Optional, Union
+
+import numpy as np
+
+ONNX_FILES = {
+    "anomaly": "anomaly/anomaly.onnx",
+    "classifier": "classifier/classifier.onnx",
+    "rul": "rul/rul.onnx",
+}
+
+# ONNX chạy float32 nên không bit-compatible với đường float64 của sklearn;
+# chấp nhận nếu ít nhất 99% prediction trên probe rows trùng với model gốc
+MIN_AGREEMENT = 0.99
+
+ONNX_TARGET_OPSET = int(os.getenv("ONNX_TARGET_OPSET", "15"))
+ONNX_INTRA_OP_THREADS = int(os.getenv("ONNX_INTRA_OP_THREADS", "1"))
+ONNX_INTER_OP_THREADS = int(os.getenv("ONNX_INTER_OP_THREADS", "1"))
+
+Index = Union[slice, np.ndarray]
+
+
+# ============================================================
+# ------------------------- EXPORT ----------------------------
+# ============================================================
+
+def _export_anomaly(model_dir: Path, opset: int):
+    import joblib
+    from sklearn.pipeline import Pipeline
+    from skl2onnx import convert_sklearn
+    from skl2onnx.common.data_types import FloatTensorType
+
+    model = joblib.load(model_dir / "isolation_forest.joblib")
+    scaler = joblib.load(model_dir / "scaler.joblib")
+    features = joblib.load(model_dir / "isofeat.joblib")
+    pipeline = Pipeline([("scaler", scaler), ("model", model)])
+    return convert_sklearn(
+        pipeline,
+        initial_types=[("input", FloatTensorType([None, len(features)]))],
+        target_opset={"": opset, "ai.onnx.ml": 3}
+    )
+
+
+def _export_classifier(model_dir: Path, opset: int):
+    import joblib
+    from sklearn.pipeline import Pipeline
+    from skl2onnx import convert_sklearn, update_registered_converter
+    from skl2onnx.common.data_types import FloatTensorType
+    from skl2onnx.common.shape_calculator import calculate_linear_classifier_output_shapes
+    from onnxmltools.convert.xgboost.operator_converters.XGBoost import convert_xgboost
+    from xgboost import XGBClassifier
+
+    update_registered_converter(
+        XGBClassifier, "XGBoostXGBClassifier",
+        calculate_linear_classifier_output_shapes, convert_xgboost,
+        options={"nocl": [True, False], "zipmap": [True, False, "columns"]}
+    )
+    model = joblib.load(model_dir / "classifier.joblib")
+    scaler = joblib.load(model_dir / "scaler.joblib")
+    features = joblib.load(model_dir / "features.joblib")
+    pipeline = Pipeline([("scaler", scaler), ("model", model)])
+    return convert_sklearn(
+        pipeline,
+        initial_types=[("input", FloatTensorType([None, len(features)]))],
+        target_opset={"": opset, "ai.onnx.ml": 3},
+        options={id(model): {"zipmap": False}}
+    )
+
+
+def _export_rul(model_dir: Path, opset: int):
+    import joblib
+    from onnxmltools import convert_lightgbm
+    from skl2onnx.common.data_types import FloatTensorType
+
+    model = joblib.load(model_dir / "lgbm_rul.joblib")
+    features = joblib.load(model_dir / "rul_features.joblib")
+    return convert_lightgbm(
+        model,
+        initial_types=[("input", FloatTensorType([None, len(features)]))],
+        target_opset=opset,
+        zipmap=False
+    )
+
+
+_EXPORTERS = {
+    "anomaly": _export_anomaly,
+    "classifier": _export_classifier,
+    "rul": _export_rul,
+}
+
+
+def export_onnx_models(models_dir: Path, target_opset: int = ONNX_TARGET_OPSET) -> Dict[str, Path]:
+    """
+    Export anomaly (scaler + IsolationForest), classifier (scaler + XGBoost)
+    và RUL (LightGBM) sang ONNX, cạnh các artifacts joblib.
+
+    Args:
+        models_dir: thư mục `models/` chứa anomaly/, classifier/, rul/
+        target_opset: ONNX opset (ai.onnx.ml luôn là 3)
+
+    Returns:
+        Dict model name -> đường dẫn file .onnx đã export
+    """
+    exported = {}
+    for name, exporter in _EXPORTERS.items():
+        out_path = Path(models_dir) / ONNX_FILES[name]
+        if not out_path.parent.exists():
+            print(f"⚠️ Skipping ONNX export for {name}: {out_path.parent} not found")
+            continue
+        try:
+            onx = exporter(out_path.parent, target_opset)
+            out_path.write_bytes(onx.SerializeToString())
+            exported[name] = out_path
+            print(f"✅ Exported {name} to ONNX: {out_path}")
+        except ImportError as e:
+            print(f"⚠️ ONNX export skipped for {name} (missing package: {e.name})")
+        except Exception as e:
+            print(f"⚠️ ONNX export failed for {name}: {e}")
+    return exported
+
+
+# ============================================================
+# ------------------------ INFERENCE --------------------------
+# ============================================================
+
+class OnnxPredictor:
+    """
+    onnxruntime session với interface giống model gốc (`predict` -> mảng 1D).
+
+    Args:
+        session: onnxruntime.InferenceSession
+        index: cột của model trong ma trận đã parse (None = dùng nguyên X)
+        name: tên model dùng khi log
+    """
+
+    backend = "onnx"
+
+    def __init__(self, session, index: Optional[Index] = None, name: str = "model"):
+        self.session = session
+        self.index = index
+        self.name = name
+        self.input_name = session.get_inputs()[0].name
+        # Output đầu tiên: label (anomaly/classifier) hoặc giá trị (RUL)
+        self.output_names = [session.get_outputs()[0].name]
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        if self.index is not None:
+            X = X[:, self.index]
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        out = self.session.run(self.output_names, {self.input_name: X})[0]
+        return np.asarray(out).reshape(-1)
+
+
+def _session_options():
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = ONNX_INTRA_OP_THREADS
+    options.inter_op_num_threads = ONNX_INTER_OP_THREADS
+    options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    return options
+
+
+def _agreement(predicted: np.ndarray, expected: np.ndarray) -> float:
+    if np.issubdtype(expected.dtype, np.floating) and not np.issubdtype(predicted.dtype, np.integer):
+        return float(np.mean(np.isclose(predicted, expected, rtol=1e-3, atol=1e-3)))
+    return float(np.mean(predicted.astype(np.int64) == expected.astype(np.int64)))
+
+
+def load_onnx_predictor(
+    path: Union[str, Path],
+    name: str,
+    index: Optional[Index] = None,
+    reference: Optional[Callable[[np.ndarray], np.ndarray]] = None,
+    probe: Optional[np.ndarray] = None
+) -> Optional[OnnxPredictor]:
+    """
+    Load ONNX model thành predictor; None nếu thiếu file/onnxruntime hoặc lệch model gốc.
+
+    Args:
+        path: file .onnx
+        name: tên model (anomaly, classifier, rul)
+        index: cột của model trong ma trận đã parse
+        reference: predict của đường native để so sánh (tùy chọn)
+        probe: các dòng dùng để so sánh với `reference`
+    """
+    path = Path(path)
+    if not path.exists():
+        print(f"⚠️ {name}: ONNX model not found at {path}, using native")
+        return None
+    try:
+        import onnxruntime as ort
+    except ImportError:
+        print(f"⚠️ {name}: onnxruntime not installed, using native")
+        return None
+
+    try:
+        session = ort.InferenceSession(
+            str(path), sess_options=_session_options(), providers=["CPUExecutionProvider"]
+        )
+        predictor = OnnxPredictor(session, index=index, name=name)
+        if reference is not None and probe is not None:
+            agreement = _agreement(predictor.predict(probe), np.asarray(reference(probe)).reshape(-1))
+            if agreement < MIN_AGREEMENT:
+                print(f"⚠️ {name}: ONNX agrees with native on only {agreement:.2%} of probe rows, using native")
+                return None
+            print(f"✅ {name}: ONNX Runtime backend (agreement {agreement:.2%}, "
+                  f"intra_op_threads={ONNX_INTRA_OP_THREADS})")
+        return predictor
+    except Exception as e:
+        print(f"⚠️ {name}: failed to load ONNX model ({e}), using native")
+        return None
@@ -0,0 +1,163 @@
+"""
+Training out-of-core cho dataset lớn hơn RAM.
+
+Ở chế độ thường, ba trainers giữ toàn bộ dataset trong một DataFrame, rồi
+`fillna().astype(float)` và `StandardScaler.fit_transform` cả ma trận. Tính
+ra khoảng 4 bản float64 của các cột đang dùng. Ở chế độ out-of-core, dataset
+được đọc từ cache Parquet (src/dataset_cache.py) theo từng row group
+(`ParquetChunks`):
+
+- scaler: `StandardScaler.partial_fit` qua từng chunk (thống kê streaming)
+- IsolationForest: fit trên reservoir sample (`ReservoirSample`, một lượt
+  đọc). Mỗi cây vốn chỉ dùng `max_samples` = 256 dòng. `IF_Anomaly` của từng
+  dòng được ghi ra file memmap int8, rồi gắn lại vào chunk cho classifier / RUL
+- XGBoost: `ExtMemQuantileDMatrix`, trang dữ liệu nằm trên đĩa
+- LightGBM: `Dataset` build từ `lgb.Sequence` theo row group. Chỉ giữ dữ liệu
+  đã bin (1 byte / feature / dòng), không giữ ma trận float
+
+Train / holdout split là mask cố định theo (SEED, chunk). Label, prediction
+của holdout và target RUL là mảng 1 chiều, được giữ trong memory.
+
+| Env | Mặc định | Ý nghĩa |
+|-----|----------|---------|
+| `TRAIN_OUT_OF_CORE` | `auto` | `true` / `false`; `auto` = out-of-core khi ước lượng memory in-memory vượt `TRAIN_MEMORY_LIMIT_MB` |
+| `TRAIN_MEMORY_LIMIT_MB` | `0` | Trần RSS của process training (0 = không giới hạn) |
+| `TRAIN_IF_SAMPLE_ROWS` | `262144` | Số dòng reservoir sample để fit IsolationForest |
+"""
+
+import os
+import resource
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+OUT_OF_CORE = os.getenv("TRAIN_OUT_OF_CORE", "auto").lower()
+MEMORY_LIMIT_MB = float(os.getenv("TRAIN_MEMORY_LIMIT_MB", "0"))
+IF_SAMPLE_ROWS = int(os.getenv("TRAIN_IF_SAMPLE_ROWS", "262144"))
+
+# Chế độ in-memory giữ ~4 bản float64 của các cột dùng (frame, X, X đã scale, train/test split)
+IN_MEMORY_COPIES = 4
+
+
+def rss_mb(field: str = "VmRSS") -> float:
+    """RSS hiện tại (`VmRSS`) / peak (`VmHWM`) của process, MB. Ngoài Linux dùng ru_maxrss."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def estimate_in_memory_mb(rows: int, n_columns: int) -> float:
+    """Ước lượng memory (MB) mà ba trainers cần khi load cả dataset vào pandas."""
+    return rows * n_columns * 8 * IN_MEMORY_COPIES / 1e6
+
+
+def should_run_out_of_core(
+    rows: int,
+    n_columns: int,
+    mode: str = OUT_OF_CORE,
+    memory_limit_mb: float = MEMORY_LIMIT_MB
+) -> Tuple[bool, str]:
+    """(chạy out-of-core?, lý do) theo `TRAIN_OUT_OF_CORE` và trần memory."""
+    if mode in ("true", "false"):
+        return mode == "true", f"TRAIN_OUT_OF_CORE={mode}"
+    if memory_limit_mb <= 0:
+        return False, "no TRAIN_MEMORY_LIMIT_MB"
+    needed = estimate_in_memory_mb(rows, n_columns)
+    available = memory_limit_mb - rss_mb()
+    return needed > available, f"estimated {needed:.0f} MB in-memory vs {available:.0f} MB available"
+
+
+def holdout_mask(chunk_index: int, n_rows: int, test_size: float, seed: int) -> np.ndarray:
+    """True = dòng thuộc holdout. Cố định theo (seed, chunk) nên mọi lượt đọc cùng một split."""
+    return np.random.default_rng([seed, chunk_index]).random(n_rows) < test_size
+
+
+def holdout_rows(chunks: "ParquetChunks", test_size: float, seed: int) -> np.ndarray:
+    """`holdout_mask` của mọi chunk ghép theo thứ tự dòng (bool, dài `chunks.rows`)."""
+    masks = [holdout_mask(index, int(n_rows), test_size, seed) for index, n_rows in enumerate(np.diff(chunks.offsets))]
+    return np.concatenate(masks) if masks else np.zeros(0, dtype=bool)
+
+
+class ParquetChunks:
+    """
+    Đọc file Parquet theo row group, mỗi row group là một chunk.
+
+    Args:
+        path: cache Parquet (src/dataset_cache.py)
+        columns: các cột được đọc (cột không có trong file bị bỏ qua)
+    """
+
+    def __init__(self, path: Path, columns: Optional[Iterable[str]] = None):
+        import pyarrow.parquet as pq
+
+        self.path = Path(path)
+        self.file = pq.ParquetFile(self.path)
+        names = self.file.schema_arrow.names
+        self.columns = names if columns is None else [c for c in dict.fromkeys(columns) if c in names]
+        sizes = [self.file.metadata.row_group(i).num_rows for i in range(self.file.num_row_groups)]
+        self.offsets = np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64)
+        self.rows = int(self.offsets[-1])
+        # Cột thêm theo dòng (vd. IF_Anomaly từ anomaly), mảng / memmap dài `rows`
+        self.extra: Dict[str, np.ndarray] = {}
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    @property
+    def available(self) -> List[str]:
+        return self.columns + [c for c in self.extra if c not in self.columns]
+
+    def bounds(self, index: int) -> Tuple[int, int]:
+        return int(self.offsets[index]), int(self.offsets[index + 1])
+
+    def read(self, index: int, columns: Optional[Iterable[str]] = None) -> pd.DataFrame:
+        """Chunk `index` (chỉ `columns` nếu có), kèm các cột `extra`."""
+        wanted = self.available if columns is None else [c for c in dict.fromkeys(columns) if c in self.available]
+        from_file = [c for c in wanted if c in self.columns and c not in self.extra]
+        df = self.file.read_row_group(index, columns=from_file).to_pandas()
+        start, stop = self.bounds(index)
+        for name in wanted:
+            if name in self.extra:
+                df[name] = np.asarray(self.extra[name][start:stop])
+        return df
+
+    def iter_columns(self, columns: Iterable[str]) -> Iterator[Tuple[int, pd.DataFrame]]:
+        columns = list(columns)
+        for index in range(len(self)):
+            yield index, self.read(index, columns)
+
+
+class ReservoirSample:
+    """
+    Sample đều `size` dòng trong một lượt đọc: mỗi dòng nhận một key ngẫu nhiên
+    và sample là `size` dòng có key nhỏ nhất. Memory chỉ gồm sample và chunk đang đọc.
+    """
+
+    def __init__(self, size: int, seed: int):
+        self.size = size
+        self.rng = np.random.default_rng(seed)
+        self.keys = np.empty(0)
+        self.rows: Optional[np.ndarray] = None
+
+    def add(self, X: np.ndarray):
+        keys = self.rng.random(len(X))
+        if self.rows is None:
+            self.rows = X[:0]
+        keys = np.concatenate([self.keys, keys])
+        rows = np.concatenate([self.rows, X])
+        if len(keys) > self.size:
+            keep = np.argpartition(keys, self.size)[:self.size]
+            keep.sort()
+            keys, rows = keys[keep], rows[keep]
+        self.keys, self.rows = keys, rows
+
+    @property
+    def sample(self) -> np.ndarray:
+        return self.rows if self.rows is not None else np.empty((0, 0))
@@ -0,0 +1,405 @@
+"""
+Pre-fork multi-worker server cho `src/inference_server.py`.
+
+Một uvicorn process chỉ dùng được một core cho tree inference (GIL). Chạy
+nhiều worker độc lập thì mỗi worker lại download + deserialize toàn bộ models.
+Ở đây master process:
+
+1. import app (không load gì lúc import), bind socket dùng chung,
+2. load + warm model bundle đúng một lần (`ModelStore.reload_in_thread`),
+3. `gc.freeze()` rồi fork N workers chạy uvicorn trên socket đó: bundle nằm
+   trong memory của master và được chia sẻ copy-on-write (numpy arrays của
+   trees không bị ghi); freeze để cycle GC của worker không chạm vào header
+   các object cũ và làm copy các page của chúng.
+
+Reload được điều phối ở master: SIGHUP (worker gửi khi có `/api/models/reload`
+hoặc training xong, hoặc `kill -HUP <master>`) -> master load bundle mới trong
+lúc workers cũ vẫn phục vụ, fork thế hệ workers mới, chờ chúng sẵn sàng rồi
+SIGTERM workers cũ (uvicorn graceful shutdown: request đang chạy vẫn hoàn tất).
+Worker chết bất thường được fork lại từ bundle hiện tại.
+
+Training (`/api/train`) do master điều phối: worker đặt state "running" trong
+file dùng chung (src/training_state.py, có lock nên chỉ một job) rồi gửi
+SIGUSR1; master spawn job thành process riêng (src/training_job.py, process
+group riêng), nên job và log không mất khi workers bị thay. Job train xong gửi
+SIGHUP như một reload thường. Master luôn chỉ có một thread: fork workers
+không bao giờ kế thừa lock của thread khác hay pipe của trainer.
+
+Metrics: master bật prometheus multiprocess mode (`PROMETHEUS_MULTIPROC_DIR`,
+tự tạo temp dir nếu chưa đặt) trước khi import app, để `/metrics` trên bất kỳ
+worker nào trả về số gộp của mọi process (src/metrics.py).
+
+Usage:
+    python -m src.prefork [--workers 4] [--host 0.0.0.0] [--port 8000]
+"""
+
+import argparse
+import gc
+import importlib
+import multiprocessing
+import os
+import select
+import signal
+import socket
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import Future
+from typing import Dict, Set, Tuple
+
+from src.metrics import mark_process_dead, multiprocess_dir, prepare_multiprocess_dir, remove_multiprocess_dir
+
+PREFORK_WORKERS = int(os.getenv("INFERENCE_WORKERS", "2"))
+PREFORK_READY_TIMEOUT = float(os.getenv("PREFORK_READY_TIMEOUT", "60"))
+PREFORK_RELOAD_TIMEOUT = float(os.getenv("PREFORK_RELOAD_TIMEOUT", "600"))
+
+# Trạng thái master publish cho workers (shared memory, tạo trước khi fork)
+_VERSION, _RELOAD_OK_AT, _RELOAD_FAILED_AT = range(3)
+
+
+class PreforkWorker:
+    """
+    Phía worker: chuyển reload lên master và chờ kết quả.
+
+    Args:
+        master_pid: pid của master (nhận SIGHUP)
+        shared: RawArray("d", 3) - version đang phục vụ, thời điểm bắt đầu
+            của lần reload thành công / thất bại gần nhất
+        worker_id: số thứ tự worker (0..workers-1)
+        workers: tổng số workers
+    """
+
+    def __init__(self, master_pid: int, shared, worker_id: int, workers: int):
+        self.master_pid = master_pid
+        self.worker_id = worker_id
+        self.workers = workers
+        self._shared = shared
+
+    def request_reload(self) -> Future:
+        """
+        Gửi SIGHUP cho master; Future nhận version mới khi một lần reload
+        *bắt đầu sau* yêu cầu này đã xong và workers mới đã nhận request.
+        """
+        requested_at = time.time()
+        future: Future = Future()
+
+        def wait():
+            deadline = time.monotonic() + PREFORK_RELOAD_TIMEOUT
+            while time.monotonic() < deadline:
+                if self._shared[_RELOAD_FAILED_AT] >= requested_at:
+                    future.set_exception(RuntimeError("Pre-fork master failed to reload models (see master log)"))
+                    return
+                if self._shared[_RELOAD_OK_AT] >= requested_at:
+                    future.set_result(int(self._shared[_VERSION]))
+                    return
+                time.sleep(0.05)
+            future.set_exception(TimeoutError(f"No reload from pre-fork master after {PREFORK_RELOAD_TIMEOUT:g}s"))
+
+        os.kill(self.master_pid, signal.SIGHUP)
+        threading.Thread(target=wait, name="prefork-reload-wait", daemon=True).start()
+        return future
+
+    def request_training(self):
+        """Gửi SIGUSR1 cho master: chạy training theo state đã đặt bằng `training_state.begin`."""
+        os.kill(self.master_pid, signal.SIGUSR1)
+
+
+class _WorkerIdHeader:
+    """ASGI wrapper thêm header `X-Worker-Id` (debug / bench phân bố tải giữa workers)."""
+
+    def __init__(self, app, worker_id: int):
+        self.app = app
+        self.header = (b"x-worker-id", str(worker_id).encode())
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        async def send_with_header(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [self.header]
+            await send(message)
+
+        return await self.app(scope, receive, send_with_header)
+
+
+class PreforkServer:
+    """
+    Master process: load bundle một lần, fork workers, điều phối reload.
+
+    Args:
+        app_module: module chứa `app`, `model_store`, `prefork_worker`
+        host, port: địa chỉ listen (socket bind ở master, workers dùng chung)
+        workers: số worker processes
+        ready_timeout: thời gian chờ một thế hệ workers mới sẵn sàng
+    """
+
+    def __init__(self, app_module: str = "src.inference_server", host: str = "0.0.0.0", port: int = 8000,
+                 workers: int = PREFORK_WORKERS, ready_timeout: float = PREFORK_READY_TIMEOUT):
+        self.app_module = app_module
+        self.host = host
+        self.port = port
+        self.workers = max(1, workers)
+        self.ready_timeout = ready_timeout
+        self._server = None
+        self._sock = None
+        self._ready_r = self._ready_w = None
+        self._shared = multiprocessing.RawArray("d", 3)
+        self._generation = 0
+        self._children: Dict[int, Tuple[int, int]] = {}  # pid -> (generation, worker_id)
+        self._reload_requested = False
+        self._training_requested = False
+        self._training_pid = None  # process của training job đang chạy (src/training_job.py)
+        self._stopping = False
+        self._metrics_dir = None
+        self._owns_metrics_dir = False
+
+    # ---------------------------------------------------------------- master
+
+    def _bind(self) -> socket.socket:
+        sock = socket.socket(socket.AF_INET6 if ":" in self.host else socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, self.port))
+        sock.listen(2048)
+        sock.set_inheritable(True)
+        return sock
+
+    def _on_hup(self, signum, frame):
+        self._reload_requested = True
+
+    def _on_train(self, signum, frame):
+        self._training_requested = True
+
+    def _on_stop(self, signum, frame):
+        self._stopping = True
+
+    def run(self):
+        # Phải trước khi import app (và prometheus_client)
+        self._owns_metrics_dir = multiprocess_dir() is None
+        self._metrics_dir = prepare_multiprocess_dir()
+        self._server = importlib.import_module(self.app_module)
+        self._sock = self._bind()
+        self._ready_r, self._ready_w = os.pipe()
+        os.set_blocking(self._ready_r, False)
+        signal.signal(signal.SIGHUP, self._on_hup)
+        signal.signal(signal.SIGUSR1, self._on_train)
+        signal.signal(signal.SIGTERM, self._on_stop)
+        signal.signal(signal.SIGINT, self._on_stop)
+        print(f"✅ Pre-fork master {os.getpid()} listening on {self.host}:{self.port} ({self.workers} workers)")
+
+        started = time.time()
+        try:
+            bundle = self._server.model_store.reload_in_thread()
+            self._publish(bundle.version, _RELOAD_OK_AT, started)
+        except Exception as e:
+            # Workers tự load trong startup hook (mỗi worker một bản, không share)
+            print(f"⚠️ Pre-fork master failed to load models, workers will load their own: {e}")
+        self._spawn_generation()
+
+        while not self._stopping:
+            self._read_ready(timeout=0.5)
+            self._reap()
+            if self._training_requested and not self._stopping:
+                self._training_requested = False
+                self._start_training()
+            if self._reload_requested and not self._stopping:
+                self._reload_requested = False
+                self._reload()
+        self._shutdown()
+
+    def _publish(self, version: int, field: int, started: float):
+        if version is not None:
+            self._shared[_VERSION] = version
+        self._shared[field] = started
+
+    def _reload(self):
+        started = time.time()
+        print(f"🔄 Pre-fork master reloading models (generation {self._generation + 1})")
+        gc.unfreeze()  # cho phép GC dọn bundle cũ ở master
+        try:
+            bundle = self._server.model_store.reload_in_thread()
+        except Exception as e:
+            print(f"⚠️ Pre-fork reload failed, keeping current workers: {e}")
+            self._publish(None, _RELOAD_FAILED_AT, started)
+            self._training_reloaded(False)
+            return
+        self._shared[_VERSION] = bundle.version
+        self._spawn_generation()
+        self._publish(bundle.version, _RELOAD_OK_AT, started)
+        self._training_reloaded(True)
+
+    def _start_training(self):
+        """Spawn training job (process group riêng); `force=true` khi đang chạy thì dừng job cũ trước."""
+        if self._training_pid is not None:
+            print(f"⚠️ Stopping training job {self._training_pid} (force)")
+            self._kill_group(self._training_pid, signal.SIGTERM)
+        state = self._server.training_state
+        env = dict(os.environ, TRAINING_STATE_DIR=str(state.root))
+        self._training_pid = os.posix_spawn(
+            sys.executable,
+            [sys.executable, "-m", "src.training_job", "--notify-pid", str(os.getpid())],
+            env,
+            file_actions=[(os.POSIX_SPAWN_CLOSE, self._sock.fileno())],  # socket inheritable cho workers
+            setsid=True
+        )
+        print(f"▶ Pre-fork master started training job {self._training_pid}")
+
+    def _training_exited(self, pid: int, status: int):
+        """Job thoát mà state vẫn "running" (bị kill, crash): đánh dấu failed để job mới chạy được."""
+        self._training_pid = None
+        state = self._server.training_state
+        if state.read()["status"] == "running":
+            state.finish("failed")
+            state.log(f"Training job {pid} exited unexpectedly (status {status})")
+
+    def _training_reloaded(self, ok: bool):
+        """Ghi kết quả reload vào log của training job nếu job đó yêu cầu reload."""
+        state = self._server.training_state
+        if not state.read().get("reload_pending"):
+            return
+        state.update(reload_pending=False)
+        if ok:
+            state.log("Models reloaded successfully!")
+        else:
+            state.finish("failed")
+            state.log("Model reload failed (see pre-fork master log)")
+
+    def _spawn_generation(self):
+        """Fork một thế hệ workers mới, chờ sẵn sàng rồi cho thế hệ cũ graceful shutdown."""
+        self._generation += 1
+        gc.collect()
+        gc.freeze()
+        pending = {self._spawn(worker_id) for worker_id in range(self.workers)}
+        deadline = time.monotonic() + self.ready_timeout
+        while pending and time.monotonic() < deadline and not self._stopping:
+            pending -= self._read_ready(timeout=0.2)
+            pending &= set(self._reap())
+        if pending:
+            print(f"⚠️ {len(pending)} worker(s) of generation {self._generation} not ready "
+                  f"after {self.ready_timeout:g}s")
+        old = [pid for pid, (generation, _) in self._children.items() if generation < self._generation]
+        for pid in old:
+            self._kill(pid, signal.SIGTERM)
+        print(f"✅ Generation {self._generation}: {self.workers} workers "
+              f"(bundle v{int(self._shared[_VERSION])}), retiring {len(old)}")
+
+    def _read_ready(self, timeout: float) -> Set[int]:
+        """Pids của các worker vừa báo sẵn sàng qua pipe."""
+        ready = set()
+        try:
+            readable, _, _ = select.select([self._ready_r], [], [], timeout)
+        except InterruptedError:
+            return ready
+        if readable:
+            try:
+                data = os.read(self._ready_r, 65536)
+            except BlockingIOError:
+                return ready
+            ready.update(int(line) for line in data.split() if line)
+        return ready
+
+    def _reap(self) -> Dict[int, Tuple[int, int]]:
+        """waitpid các worker đã thoát; fork lại worker của thế hệ hiện tại. Trả về workers còn sống."""
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+            if pid == self._training_pid:
+                self._training_exited(pid, status)
+                continue
+            if pid not in self._children:
+                continue  # training job cũ đã bị dừng (force)
+            generation, worker_id = self._children.pop(pid)
+            mark_process_dead(pid)
+            if generation == self._generation and not self._stopping:
+                print(f"⚠️ Worker {worker_id} (pid {pid}) exited with status {status}, respawning")
+                time.sleep(0.5)  # tránh fork loop nếu worker crash ngay lúc khởi động
+                self._spawn(worker_id)
+        return self._children
+
+    def _kill(self, pid: int, sig: int):
+        try:
+            os.kill(pid, sig)
+        except ProcessLookupError:
+            pass
+
+    def _kill_group(self, pid: int, sig: int):
+        try:
+            os.killpg(pid, sig)
+        except ProcessLookupError:
+            pass
+
+    def _shutdown(self, timeout: float = 30.0):
+        print(f"Stopping {len(self._children)} workers...")
+        for pid in list(self._children):
+            self._kill(pid, signal.SIGTERM)
+        deadline = time.monotonic() + timeout
+        while self._children and time.monotonic() < deadline:
+            self._reap()
+            time.sleep(0.1)
+        for pid in list(self._children):
+            self._kill(pid, signal.SIGKILL)
+        if self._training_pid is not None:
+            self._kill_group(self._training_pid, signal.SIGTERM)
+        self._server.model_store.shutdown()
+        self._sock.close()
+        if self._owns_metrics_dir:
+            remove_multiprocess_dir(self._metrics_dir)
+
+    # ---------------------------------------------------------------- worker
+
+    def _spawn(self, worker_id: int) -> int:
+        pid = os.fork()
+        if pid:
+            self._children[pid] = (self._generation, worker_id)
+            return pid
+        code = 0
+        try:
+            self._run_worker(worker_id)
+        except BaseException:
+            traceback.print_exc()
+            code = 1
+        finally:
+            os._exit(code)
+
+    def _run_worker(self, worker_id: int):
+        import uvicorn
+
+        for sig in (signal.SIGHUP, signal.SIGUSR1, signal.SIGTERM, signal.SIGINT):
+            signal.signal(sig, signal.SIG_DFL)
+        os.close(self._ready_r)
+        master_pid = os.getppid()
+        ready_w = self._ready_w
+
+        server = self._server
+        server.prefork_worker = PreforkWorker(master_pid, self._shared, worker_id, self.workers)
+
+        def notify_ready():
+            os.write(ready_w, f"{os.getpid()}\n".encode())
+
+        server.app.router.on_startup.append(notify_ready)
+        config = uvicorn.Config(
+            _WorkerIdHeader(server.app, worker_id),
+            lifespan="on",
+            log_level=os.getenv("UVICORN_LOG_LEVEL", "info"),
+            access_log=False
+        )
+        uvicorn.Server(config).run(sockets=[self._sock])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--app-module", default="src.inference_server")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=PREFORK_WORKERS)
+    args = parser.parse_args()
+    PreforkServer(args.app_module, args.host, args.port, args.workers).run()
+
+
+if __name__ == "__main__":
+    main()
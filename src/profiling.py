@@ -0,0 +1,225 @@
+"""
+Profiling on-demand cho inference server (không cần redeploy).
+
+- `StackSampler`: sampling profiler - một thread nền lấy stack của mọi thread
+  (`sys._current_frames()`) mỗi `interval` giây, gộp thành collapsed stacks
+  (`thread;frame;frame N`, đọc được bằng flamegraph.pl / speedscope).
+- `RequestProfiler`: deterministic profiling (cProfile) cho một phần các lần
+  gọi `/predict`, gộp vào một `pstats.Stats` để download (`.pstats` hoặc text);
+  config và kết quả dùng chung giữa các worker pre-fork.
+
+Khi không bật, chi phí trên hot path chỉ là đọc `RequestProfiler.enabled`.
+"""
+
+import cProfile
+import io
+import marshal
+import multiprocessing
+import os
+import pstats
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Optional
+
+# Giá trị `sort` hợp lệ cho RequestProfiler.text: pstats.SortKey + tên cũ (tottime, ncalls, ...)
+SORT_KEYS = sorted(pstats.Stats.sort_arg_dict_default)
+
+# Shared memory của RequestProfiler
+_EPOCH, _FRACTION, _MAX_CALLS, _CALLS, _ENABLED = range(5)
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """
+    Sampling profiler cho mọi thread của process.
+
+    Args:
+        interval: khoảng cách giữa hai lần lấy mẫu (giây)
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.samples = 0
+        self.duration = 0.0
+        self._stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> "StackSampler":
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self
+
+    def _run(self):
+        own_id = threading.get_ident()
+        started = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, f"thread-{thread_id}"))
+                self._stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+        self.duration = time.perf_counter() - started
+
+    def collapsed(self) -> str:
+        """Collapsed stacks, mỗi dòng `root;...;leaf count`, nhiều mẫu nhất trước."""
+        return "".join(f"{stack} {count}\n" for stack, count in self._stacks.most_common())
+
+
+class RequestProfiler:
+    """
+    cProfile cho một tỉ lệ các lần gọi, kết quả gộp qua nhiều request và process.
+
+    Config (fraction, max_calls) và số call đã profile nằm trong shared memory
+    tạo lúc khởi tạo; pre-fork (src/prefork.py) tạo profiler khi master import
+    app, nên mọi worker (cả các thế hệ fork sau reload) dùng chung: bật / tắt
+    trên một worker áp dụng cho tất cả và `max_calls` tính chung. Mỗi process
+    ghi stats của mình vào `<results_dir>/<epoch>-<pid>.pstats` sau mỗi call;
+    `dump` / `text` gộp file của mọi process (kể cả worker đã thoát) thuộc lần
+    `configure` hiện tại (`epoch`).
+
+    Chỉ một call mỗi process được profile tại một thời điểm (cProfile không
+    lồng nhau được); call khác đến lúc đó chạy bình thường.
+
+    Args:
+        results_dir: thư mục file `.pstats` (tạo khi cần)
+    """
+
+    def __init__(self, results_dir=None):
+        self.results_dir = Path(results_dir or os.path.join(tempfile.gettempdir(), f"inference-profile-{os.getpid()}"))
+        self._shared = multiprocessing.RawArray("d", 5)
+        self._shared_lock = multiprocessing.Lock()
+        self._epoch = 0  # epoch của `_stats` trong process này
+        self._stats: Optional[pstats.Stats] = None
+        self._lock = threading.Lock()
+        self._busy = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self._shared[_ENABLED] > 0
+
+    @property
+    def fraction(self) -> float:
+        return self._shared[_FRACTION]
+
+    @property
+    def max_calls(self) -> int:
+        return int(self._shared[_MAX_CALLS])
+
+    @property
+    def calls(self) -> int:
+        return int(self._shared[_CALLS])
+
+    def configure(self, fraction: float, max_calls: int):
+        """Bật profile cho `fraction` các lần gọi, tối đa `max_calls` lần (kết quả cũ của mọi process bị xoá)."""
+        fraction = min(max(fraction, 0.0), 1.0)
+        with self._shared_lock:
+            self._shared[_EPOCH] += 1
+            self._shared[_FRACTION] = fraction
+            self._shared[_MAX_CALLS] = max_calls
+            self._shared[_CALLS] = 0
+            self._shared[_ENABLED] = 1.0 if fraction > 0 and max_calls > 0 else 0.0
+            for path in self.results_dir.glob("*.pstats"):
+                path.unlink(missing_ok=True)
+
+    def disable(self):
+        self._shared[_ENABLED] = 0.0
+
+    def should_profile(self, force: bool = False) -> bool:
+        if force:
+            return True
+        return self.enabled and self.calls < self.max_calls and random.random() < self.fraction
+
+    @contextmanager
+    def profile(self):
+        """Profile khối code bên trong nếu không có call nào khác của process đang được profile."""
+        if not self._busy.acquire(blocking=False):
+            yield
+            return
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+            try:
+                yield
+            finally:
+                profiler.disable()
+            self._record(profiler)
+        finally:
+            self._busy.release()
+
+    def _record(self, profiler: cProfile.Profile):
+        with self._shared_lock:
+            epoch = int(self._shared[_EPOCH])
+            self._shared[_CALLS] += 1
+            if self._shared[_CALLS] >= self._shared[_MAX_CALLS]:
+                self._shared[_ENABLED] = 0.0
+        with self._lock:
+            if self._stats is None or self._epoch != epoch:
+                self._stats, self._epoch = pstats.Stats(profiler), epoch
+            else:
+                self._stats.add(profiler)
+            data = marshal.dumps(self._stats.stats)
+        self.results_dir.mkdir(parents=True, exist_ok=True)
+        path = self.results_dir / f"{epoch}-{os.getpid()}.pstats"
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)  # process khác không đọc file ghi dở
+
+    def _files(self):
+        return sorted(self.results_dir.glob(f"{int(self._shared[_EPOCH])}-*.pstats"))
+
+    def _merged(self) -> Optional[pstats.Stats]:
+        merged = None
+        for path in self._files():
+            try:
+                if merged is None:
+                    merged = pstats.Stats(str(path))
+                else:
+                    merged.add(str(path))
+            except (OSError, EOFError, ValueError, TypeError):
+                continue  # file bị xoá bởi `configure` của process khác
+        return merged
+
+    def status(self) -> Dict[str, object]:
+        return {"enabled": self.enabled, "fraction": self.fraction, "max_calls": self.max_calls, "calls": self.calls,
+                "processes": len(self._files())}
+
+    def dump(self) -> Optional[bytes]:
+        """Nội dung file `.pstats` gộp của mọi process (đọc bằng `pstats.Stats(path)`, snakeviz, ...)."""
+        merged = self._merged()
+        return None if merged is None else marshal.dumps(merged.stats)
+
+    def text(self, sort: str = "cumulative", limit: int = 50) -> Optional[str]:
+        merged = self._merged()
+        if merged is None:
+            return None
+        out = io.StringIO()
+        merged.stream = out
+        merged.sort_stats(sort).print_stats(limit)
+        return out.getvalue()
@@ -4,16 +4,29 @@
 
 import os
 import random
+import time
 from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
 import joblib
 import pandas as pd
 import numpy as np
+import lightgbm as lgb
 from lightgbm import LGBMRegressor
 from sklearn.preprocessing import LabelEncoder
 from sklearn.metrics import mean_squared_error, mean_absolute_error, r2_score
+from sklearn.model_selection import train_test_split
 from math import sqrt
 import mlflow
 
+try:
+    from src.binned_cache import lgb_dataset
+    from src.dataset_cache import label_strings, load_training_frame, read_parquet_columns
+    from src.out_of_core import ParquetChunks, holdout_rows
+except ImportError:
+    from binned_cache import lgb_dataset
+    from dataset_cache import label_strings, load_training_frame, read_parquet_columns
+    from out_of_core import ParquetChunks, holdout_rows
+
 SEED = 42
 
 
@@ -23,26 +36,12 @@ def set_seed(seed: int = SEED):
     os.environ["PYTHONHASHSEED"] = str(seed)
 
 
-set_seed()
-
 # Resolve paths relative to repository root for Docker/local consistency
 ROOT = Path(__file__).resolve().parent
 BASE_CSV = ROOT / "data" / "EV_Predictive_Maintenance_Dataset_15min.csv"
 PARQUET_IF = ROOT.parent / "data" / "features_with_anomaly.parquet"
 MODEL_DIR = ROOT.parent / "models" / "rul"
-MODEL_DIR.mkdir(parents=True, exist_ok=True)
-
-# Load data (prefer annotated)
-if PARQUET_IF.exists():
-    df = pd.read_parquet(PARQUET_IF)
-    print("Loaded annotated:", PARQUET_IF)
-else:
-    df = pd.read_csv(BASE_CSV)
-    print("Loaded CSV:", BASE_CSV)
-
-# Validate RUL target exists
-if "RUL" not in df.columns:
-    raise RuntimeError("Column 'RUL' not found in dataset. Cannot train RUL.")
+CLASSIFIER_DIR = ROOT.parent / "models" / "classifier"
 
 # Features (same numeric ones)
 FEATURES = [
@@ -54,81 +53,339 @@ FEATURES = [
     "Distance_Traveled", "Idle_Time", "Route_Roughness", "Component_Health_Score",
     "Failure_Probability", "TTF"
 ]
-features = [c for c in FEATURES if c in df.columns]
-
-# Optionally include Maintenance_Type encoded as a numeric feature
-label_col_path = "models/classifier/label_col.joblib"
-label_encoder_path = "models/classifier/label_encoder.joblib"
-if os.path.exists(label_col_path):
-    label_col = joblib.load(label_col_path)
-else:
-    label_col = None
-
-if label_col and label_col in df.columns:
-    # ensure encoder exists or build one from training data if missing
-    if os.path.exists(label_encoder_path):
-        le = joblib.load(label_encoder_path)
-    else:
-        le = LabelEncoder()
-        df[label_col] = df[label_col].astype(str)
-        df[label_col] = le.fit_transform(df[label_col])
-        joblib.dump(le, label_encoder_path)
-    # add encoded label as feature
-    df[label_col] = le.transform(df[label_col].astype(str))
-    features.append(label_col)
-
-if not features:
-    raise RuntimeError("No features available for RUL training.")
-
-# Prepare data
-X = df[features].fillna(0.0).astype(float)
-y = df["RUL"].astype(float)
-
-# Train-test split (train on full with small holdout optional)
-# We'll do a quick random split for evaluation but fit on full for deployment to maximize data
-from sklearn.model_selection import train_test_split
-Xtr, Xte, ytr, yte = train_test_split(X, y, test_size=0.15, random_state=SEED)
+# Target + các label mà classifier có thể chọn (label_col encode thành feature)
+COLUMNS = FEATURES + ["RUL", "Maintenance_Type", "Anomaly", "IF_Anomaly"]
 
-model_params = {
+TEST_SIZE = 0.15
+RUL_PARAMS = {
     "n_estimators": 400,
     "learning_rate": 0.05,
     "random_state": SEED
 }
-model = LGBMRegressor(**model_params)
-model.fit(Xtr, ytr)
-
-pred = model.predict(Xte)
-rmse = sqrt(mean_squared_error(yte, pred))
-mae = mean_absolute_error(yte, pred)
-r2 = r2_score(yte, pred)
-print("RUL model RMSE (val):", rmse)
-print("RUL model MAE (val):", mae)
-print("RUL model R2 (val):", r2)
-
-# Re-fit on full dataset before saving (recommended)
-model.fit(X, y)
-
-# Save model + features
-joblib.dump(model, os.path.join(MODEL_DIR, "lgbm_rul.joblib"))
-joblib.dump(features, os.path.join(MODEL_DIR, "rul_features.joblib"))
-
-print("Saved RUL model & feature list to", MODEL_DIR)
-
-# MLflow logging
-mlflow.set_tracking_uri(os.getenv("MLFLOW_TRACKING_URI", "http://localhost:6969"))
-mlflow.set_experiment(os.getenv("MLFLOW_EXPERIMENT", "predictive-maintenance"))
-with mlflow.start_run(run_name="rul"):
-    # Set tags for filtering in MLflow UI
-    dataset_name = BASE_CSV.stem  # e.g., "EV_Predictive_Maintenance_Dataset_15min"
-    mlflow.set_tag("dataset", dataset_name)
-    mlflow.set_tag("model", "LightGBM")
-    
-    mlflow.log_params({
-        **model_params,
-        "feature_count": len(features)
-    })
-    mlflow.log_metrics({
+# Params của lgb.Dataset (bin); feature_pre_filter=False để search đổi được min_data_in_leaf trên cùng Dataset
+DATASET_PARAMS = {
+    "seed": SEED,
+    "feature_pre_filter": False
+}
+
+
+def load_data() -> pd.DataFrame:
+    """Load data (prefer annotated; chỉ các cột cần dùng)."""
+    if PARQUET_IF.exists():
+        df = read_parquet_columns(PARQUET_IF, COLUMNS)
+        print("Loaded annotated:", PARQUET_IF)
+    else:
+        df = load_training_frame(COLUMNS, csv=BASE_CSV)
+    return df
+
+
+def fallback_label_encoder(labels: pd.Series) -> LabelEncoder:
+    """
+    Encoder của label khi classifier không có (label đã là số, vd. Anomaly):
+    RUL vẫn encode label dạng chuỗi như Maintenance_Type.
+    """
+    return LabelEncoder().fit(label_strings(labels))
+
+
+def save_label_encoder(label_encoder: LabelEncoder, classifier_dir: Path = CLASSIFIER_DIR):
+    """Ghi encoder vào artifacts của classifier (inference đọc từ đó)."""
+    classifier_dir = Path(classifier_dir)
+    classifier_dir.mkdir(parents=True, exist_ok=True)
+    joblib.dump(label_encoder, classifier_dir / "label_encoder.joblib")
+
+
+def rul_matrix(
+    df: pd.DataFrame,
+    label_col: Optional[str] = None,
+    label_encoder: Optional[LabelEncoder] = None,
+    classifier_dir: Path = CLASSIFIER_DIR
+) -> Tuple[pd.DataFrame, pd.Series]:
+    """X (features, encoded label nếu có là cột cuối) và target y của RUL."""
+    classifier_dir = Path(classifier_dir)
+
+    # Validate RUL target exists
+    if "RUL" not in df.columns:
+        raise RuntimeError("Column 'RUL' not found in dataset. Cannot train RUL.")
+
+    features = [c for c in FEATURES if c in df.columns]
+
+    # Optionally include Maintenance_Type encoded as a numeric feature
+    label_col, label_encoder = _resolve_label(label_col, label_encoder, classifier_dir)
+
+    encoded_label = None
+    if label_col and label_col in df.columns:
+        labels = label_strings(df[label_col])
+        # ensure encoder exists or build one from training data if missing
+        if label_encoder is None:
+            label_encoder = fallback_label_encoder(df[label_col])
+            save_label_encoder(label_encoder, classifier_dir)
+        encoded_label = label_encoder.transform(labels)
+
+    if not features and encoded_label is None:
+        raise RuntimeError("No features available for RUL training.")
+
+    # Prepare data: encoded label (nếu có) là feature cuối
+    X = df[features].fillna(0.0).astype(float)
+    if encoded_label is not None:
+        X[label_col] = encoded_label.astype(float)
+        features.append(label_col)
+    y = df["RUL"].astype(float)
+    return X, y
+
+
+def train_params(n_jobs: Optional[int] = None, **overrides) -> Dict[str, Any]:
+    """Params của `lgb.train` tương ứng `LGBMRegressor(**RUL_PARAMS)` (+ `overrides`, vd. trong search)."""
+    params = {
+        "objective": "regression",
+        "learning_rate": RUL_PARAMS["learning_rate"],
+        "seed": RUL_PARAMS["random_state"],
+        **DATASET_PARAMS,
+        **overrides
+    }
+    if n_jobs is not None:
+        params["num_threads"] = n_jobs
+    return params
+
+
+def train_rul(
+    df: pd.DataFrame,
+    label_col: Optional[str] = None,
+    label_encoder: Optional[LabelEncoder] = None,
+    model_dir: Path = MODEL_DIR,
+    classifier_dir: Path = CLASSIFIER_DIR,
+    n_jobs: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Train LightGBM RUL trên `df` (không sửa `df`), lưu artifacts vào `model_dir`
+    và log run "rul" lên MLflow.
+
+    Dataset được bin một lần cho toàn bộ dữ liệu và lấy qua cache
+    (src/binned_cache.py); model holdout train trên `subset` của nó nên không
+    phải bin lại cho phần train. Vì vậy bin edges của model holdout tính từ
+    toàn bộ dữ liệu (kể cả các dòng holdout): run được tag
+    `holdout_binning=shared`, rmse / mae / r2 không so trực tiếp với các run
+    trước đó (bin chỉ từ phần train, như `train_rul_chunked`).
+
+    Args:
+        label_col / label_encoder: từ `train_classifier` khi chạy trong pipeline;
+            None = đọc artifacts của classifier trong `classifier_dir`
+        n_jobs: số thread LightGBM (None = mặc định của LightGBM)
+
+    Returns:
+        metrics (rmse, mae, r2 trên holdout)
+    """
+    set_seed()
+    model_dir = Path(model_dir)
+    model_dir.mkdir(parents=True, exist_ok=True)
+
+    X, y = rul_matrix(df, label_col, label_encoder, classifier_dir)
+    features = list(X.columns)
+    full, dataset_info = lgb_dataset(X, y, DATASET_PARAMS)
+    params = train_params(n_jobs)
+
+    # Train-test split (train on full with small holdout optional)
+    # We'll do a quick random split for evaluation but fit on full for deployment to maximize data
+    train_idx, test_idx = train_test_split(np.arange(len(X)), test_size=TEST_SIZE, random_state=SEED)
+
+    started = time.perf_counter()
+    train_set = full.subset(np.sort(train_idx)).construct()
+    dataset_seconds = dataset_info["seconds"] + time.perf_counter() - started
+
+    started = time.perf_counter()
+    booster = lgb.train(params, train_set, num_boost_round=RUL_PARAMS["n_estimators"])
+    pred = booster.predict(X.values[test_idx])
+    metrics = rul_metrics(y.values[test_idx], pred)
+
+    # Re-fit on full dataset before saving (recommended)
+    model = _as_regressor(lgb.train(params, full, num_boost_round=RUL_PARAMS["n_estimators"]), n_jobs)
+    model.booster_.free_dataset()
+    fit_seconds = time.perf_counter() - started
+    print(f"⏱️ RUL dataset {dataset_seconds:.2f}s ({dataset_info['source']}), fit {fit_seconds:.2f}s")
+
+    _save_and_log(model, features, metrics, model_dir,
+                  extra_params={"dataset_cache": dataset_info["source"]},
+                  extra_metrics={"dataset_seconds": dataset_seconds, "fit_seconds": fit_seconds},
+                  tags={"holdout_binning": "shared"})
+    return metrics
+
+
+def _resolve_label(label_col, label_encoder, classifier_dir: Path):
+    """label_col / label_encoder từ pipeline, hoặc từ artifacts của classifier khi chạy riêng lẻ."""
+    label_encoder_path = classifier_dir / "label_encoder.joblib"
+    if label_col is None and (classifier_dir / "label_col.joblib").exists():
+        label_col = joblib.load(classifier_dir / "label_col.joblib")
+    if label_col and label_encoder is None and label_encoder_path.exists():
+        label_encoder = joblib.load(label_encoder_path)
+    return label_col, label_encoder
+
+
+class _ChunkMatrix:
+    """Ma trận feature float64 của row group đang đọc (chỉ giữ một row group một lúc)."""
+
+    def __init__(self, chunks: ParquetChunks, features, label_col, label_encoder):
+        self.chunks = chunks
+        self.features = features
+        self.label_col = label_col
+        self.label_encoder = label_encoder
+        self._index = None
+        self._X = None
+
+    def get(self, index: int) -> np.ndarray:
+        if index != self._index:
+            self._X = None  # giải phóng row group trước khi đọc row group mới
+            chunk = self.chunks.read(index, self.features + [self.label_col] if self.label_col else self.features)
+            X = chunk[self.features].fillna(0.0).astype(float)
+            if self.label_col:
+                X[self.label_col] = self.label_encoder.transform(label_strings(chunk[self.label_col])).astype(float)
+            self._index, self._X = index, X.values
+        return self._X
+
+
+class _RowGroupSequence(lgb.Sequence):
+    """Các dòng `rows` của một row group cho `lgb.Dataset` (LightGBM sample rồi đọc theo batch, tuần tự)."""
+
+    def __init__(self, matrix: _ChunkMatrix, index: int, rows: np.ndarray):
+        self.matrix = matrix
+        self.index = index
+        self.rows = rows
+        self.batch_size = max(1, len(rows))
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __getitem__(self, idx):
+        return self.matrix.get(self.index)[self.rows[idx]]
+
+
+def _binned_dataset(matrix: _ChunkMatrix, y: np.ndarray, mask: np.ndarray, names, params) -> lgb.Dataset:
+    """`lgb.Dataset` của các dòng `mask`, đọc theo row group; chỉ giữ dữ liệu đã bin."""
+    seqs = []
+    for index in range(len(matrix.chunks)):
+        start, stop = matrix.chunks.bounds(index)
+        rows = np.flatnonzero(mask[start:stop])
+        if len(rows):
+            seqs.append(_RowGroupSequence(matrix, index, rows))
+    return lgb.Dataset(seqs, label=y[mask], feature_name=names, params=params)
+
+
+def _as_regressor(booster: lgb.Booster, n_jobs: Optional[int]) -> LGBMRegressor:
+    """
+    Booster train bằng `lgb.train` -> LGBMRegressor (artifact giống bản in-memory:
+    `predict`, `booster_`). LightGBM không có API công khai cho việc này nên gán
+    các thuộc tính mà `LGBMRegressor.fit` đặt; chúng đổi theo version nên
+    lightgbm được pin cùng version cho training và inference (round-trip
+    kiểm tra trong scripts/bench_binned_cache.py).
+    """
+    model = LGBMRegressor(**RUL_PARAMS, n_jobs=n_jobs)
+    model._Booster = booster
+    model._n_features = model._n_features_in = booster.num_feature()
+    model._fitted_with_feature_names = True
+    model._evals_result = {}
+    model._best_iteration = booster.best_iteration
+    model._best_score = booster.best_score
+    model.fitted_ = True
+    return model
+
+
+def train_rul_chunked(
+    chunks: ParquetChunks,
+    label_col: Optional[str] = None,
+    label_encoder: Optional[LabelEncoder] = None,
+    model_dir: Path = MODEL_DIR,
+    classifier_dir: Path = CLASSIFIER_DIR,
+    n_jobs: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Bản out-of-core của `train_rul` (src/out_of_core.py): `lgb.Dataset` build
+    từ các row group (`lgb.Sequence`), chỉ giữ dữ liệu đã bin. Như bản
+    in-memory: fit trên phần train, đánh giá holdout, rồi fit lại trên toàn bộ;
+    Dataset của phần train được giải phóng trước khi build Dataset toàn bộ.
+    """
+    set_seed()
+    model_dir = Path(model_dir)
+    classifier_dir = Path(classifier_dir)
+
+    if "RUL" not in chunks.columns:
+        raise RuntimeError("Column 'RUL' not found in dataset. Cannot train RUL.")
+
+    features = [c for c in FEATURES if c in chunks.columns]
+    label_col, label_encoder = _resolve_label(label_col, label_encoder, classifier_dir)
+    if label_col not in chunks.available:
+        label_col = None
+    if label_col and label_encoder is None:
+        classes = set()
+        for _, chunk in chunks.iter_columns([label_col]):
+            classes.update(label_strings(chunk[label_col]).unique())
+        label_encoder = LabelEncoder().fit(np.array(sorted(classes)))
+        save_label_encoder(label_encoder, classifier_dir)
+
+    if not features and label_col is None:
+        raise RuntimeError("No features available for RUL training.")
+
+    y = np.concatenate([chunk["RUL"].astype(float).values for _, chunk in chunks.iter_columns(["RUL"])])
+    holdout = holdout_rows(chunks, TEST_SIZE, SEED)
+
+    matrix = _ChunkMatrix(chunks, features, label_col, label_encoder)
+    names = features + ([label_col] if label_col else [])
+    params = train_params(n_jobs)
+    booster = lgb.train(params, _binned_dataset(matrix, y, ~holdout, names, params),
+                        num_boost_round=RUL_PARAMS["n_estimators"])
+    booster.free_dataset()
+    preds = [booster.predict(matrix.get(index)[holdout[slice(*chunks.bounds(index))]]) for index in range(len(chunks))]
+    metrics = rul_metrics(y[holdout], np.concatenate(preds) if preds else np.empty(0))
+    del booster
+
+    # Re-fit on full dataset before saving (recommended)
+    full = _binned_dataset(matrix, y, np.ones(len(y), dtype=bool), names, params)
+    model = _as_regressor(lgb.train(params, full, num_boost_round=RUL_PARAMS["n_estimators"]), n_jobs)
+    model.booster_.free_dataset()
+
+    _save_and_log(model, names, metrics, model_dir, extra_params={"out_of_core": True},
+                  tags={"holdout_binning": "train_only"})
+    return metrics
+
+
+def rul_metrics(yte, pred) -> Dict[str, float]:
+    rmse = sqrt(mean_squared_error(yte, pred))
+    mae = mean_absolute_error(yte, pred)
+    r2 = r2_score(yte, pred)
+    print("RUL model RMSE (val):", rmse)
+    print("RUL model MAE (val):", mae)
+    print("RUL model R2 (val):", r2)
+    return {
         "rmse": rmse,
         "mae": mae,
         "r2": r2
-    })
+    }
+
+
+def _save_and_log(model, features, metrics, model_dir: Path, extra_params: Optional[Dict] = None,
+                  extra_metrics: Optional[Dict] = None, tags: Optional[Dict] = None):
+    model_dir.mkdir(parents=True, exist_ok=True)
+
+    # Save model + features
+    joblib.dump(model, os.path.join(model_dir, "lgbm_rul.joblib"))
+    joblib.dump(features, os.path.join(model_dir, "rul_features.joblib"))
+
+    print("Saved RUL model & feature list to", model_dir)
+
+    # MLflow logging (nested khi chạy trong run của pipeline)
+    mlflow.set_tracking_uri(os.getenv("MLFLOW_TRACKING_URI", "http://localhost:6969"))
+    mlflow.set_experiment(os.getenv("MLFLOW_EXPERIMENT", "predictive-maintenance"))
+    with mlflow.start_run(run_name="rul", nested=mlflow.active_run() is not None):
+        # Set tags for filtering in MLflow UI
+        dataset_name = BASE_CSV.stem  # e.g., "EV_Predictive_Maintenance_Dataset_15min"
+        mlflow.set_tag("dataset", dataset_name)
+        mlflow.set_tag("model", "LightGBM")
+        mlflow.set_tags(tags or {})
+
+        mlflow.log_params({
+            **RUL_PARAMS,
+            "feature_count": len(features),
+            **(extra_params or {})
+        })
+        mlflow.log_metrics({**metrics, **(extra_metrics or {})})
+
+
+if __name__ == "__main__":
+    train_rul(load_data())
@@ -0,0 +1,301 @@
+"""
+Streaming scorer: score telemetry thô từ Kafka theo batch.
+
+Consume topic telemetry (`STREAM_TELEMETRY_TOPIC`, mỗi message là JSON của một
+dòng, dạng `{"data": {...}}` như body `/predict` hoặc dict phẳng), gom tối đa
+`STREAM_BATCH_SIZE` records hoặc chờ tối đa `STREAM_MAX_WAIT_MS`, rồi chạy đúng
+cascade của src/inference_server.py (`_score_batch`: cùng model bundle, cùng rule
+Battery Aging, cùng format alert). Alert của các dòng anomaly được gửi lên
+`ev_predictions` qua Kafka producer của server (key theo xe).
+
+Offsets chỉ được commit sau khi batch đã score xong và mọi alert của batch đã
+được broker xác nhận; nếu không (broker lỗi, queue đầy), consumer seek về đầu
+batch và score lại (at-least-once: alert có thể bị gửi trùng, không bị mất).
+Dòng score lỗi (thiếu / sai feature) được đếm `failed`, bỏ qua và commit như
+dòng đã score, kể cả khi đó là mọi dòng của batch (vd. batch một dòng lúc ít
+traffic), để partition không bị kẹt ở một record hỏng. Khi model bundle chưa
+dùng được (chưa load / load lỗi), scorer không consume mà chờ
+`STREAM_RETRY_BACKOFF` rồi thử lại.
+
+Metrics (port `STREAM_PROM_PORT`): records/s (`stream_records_total`), batch
+size / thời gian, lag end-to-end (Kafka timestamp -> commit), cùng các metrics
+stage của cascade (`inference_stage_seconds`, ...).
+
+Usage:
+    python -m src.stream_scorer
+    SIGHUP: reload models (MLflow Registry / local) ở background
+"""
+
+import json
+import os
+import signal
+import threading
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+from prometheus_client import Counter, Histogram
+
+STREAM_TOPIC = os.getenv("STREAM_TELEMETRY_TOPIC", "raw_sensor_data")
+STREAM_GROUP = os.getenv("STREAM_GROUP", "stream-scorer")
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", "500"))
+STREAM_MAX_WAIT_MS = float(os.getenv("STREAM_MAX_WAIT_MS", "200"))
+STREAM_FLUSH_TIMEOUT = float(os.getenv("STREAM_FLUSH_TIMEOUT", "30"))
+STREAM_RETRY_BACKOFF = float(os.getenv("STREAM_RETRY_BACKOFF", "1"))
+STREAM_OFFSET_RESET = os.getenv("STREAM_OFFSET_RESET", "earliest")
+STREAM_PROM_PORT = int(os.getenv("STREAM_PROM_PORT", "9102"))
+STREAM_STATS_INTERVAL = float(os.getenv("STREAM_STATS_INTERVAL", "30"))
+
+# =======================
+# MONITORING METRICS
+# =======================
+
+STREAM_RECORDS = Counter(
+    "stream_records_total",
+    "Telemetry records consumed by the streaming scorer",
+    ["outcome"]  # scored | invalid (không parse được) | failed (cascade lỗi)
+)
+
+STREAM_BATCH_SIZE_HIST = Histogram(
+    "stream_batch_size",
+    "Records per streaming batch",
+    buckets=(1, 8, 32, 64, 128, 256, 512, 1024, 2048, 4096)
+)
+
+STREAM_BATCH_SECONDS = Histogram(
+    "stream_batch_seconds",
+    "Time to score a batch, deliver its alerts and commit offsets",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+)
+
+STREAM_LAG = Histogram(
+    "stream_end_to_end_lag_seconds",
+    "Time from a record's Kafka timestamp to the commit of its batch",
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+)
+
+STREAM_RETRIES = Counter(
+    "stream_batch_retries_total",
+    "Batches rewound and rescored because their alerts were not delivered"
+)
+
+
+class BatchResult(NamedTuple):
+    records: int
+    scored: int
+    invalid: int
+    failed: int
+    seconds: float
+    lags: List[float]
+
+
+def decode_record(value: Optional[bytes]) -> Optional[Dict[str, Any]]:
+    """Một dòng telemetry từ message (`{"data": {...}}` hoặc dict phẳng); None nếu không hợp lệ."""
+    try:
+        record = json.loads(value)
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(record, dict):
+        return None
+    data = record.get("data")
+    return data if isinstance(data, dict) else record
+
+
+class StreamScorer:
+    """
+    Consume -> score -> giao alert -> commit, từng batch.
+
+    Args:
+        consumer: consumer kiểu confluent_kafka (đã subscribe), `enable.auto.commit=False`
+        score_fn: list rows -> list kết quả (vd. `inference_server._score_batch`); tự gửi alert
+        flush_alerts: hàm(timeout) -> bool, True nếu mọi alert đã gửi được broker xác nhận
+            (vd. `AlertProducer.flush`); None = không chờ
+        ready: hàm() -> bool, False khi model bundle chưa dùng được (không consume
+            tới khi True); None = luôn sẵn sàng
+        batch_size: số records tối đa mỗi batch
+        max_wait_ms: thời gian chờ tối đa để gom đủ batch
+    """
+
+    def __init__(
+        self,
+        consumer,
+        score_fn: Callable[[List[Dict[str, Any]]], List[Any]],
+        flush_alerts: Optional[Callable[[float], bool]] = None,
+        batch_size: int = 500,
+        max_wait_ms: float = 200.0,
+        flush_timeout: float = 30.0,
+        retry_backoff: float = 1.0,
+        ready: Optional[Callable[[], bool]] = None
+    ):
+        self.consumer = consumer
+        self.score_fn = score_fn
+        self.flush_alerts = flush_alerts
+        self.ready = ready
+        self.batch_size = max(1, int(batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.flush_timeout = flush_timeout
+        self.retry_backoff = retry_backoff
+        self._stop = threading.Event()
+
+    def stop(self):
+        self._stop.set()
+
+    def run(self, on_batch: Optional[Callable[[BatchResult], None]] = None):
+        """Chạy tới khi `stop()`; `on_batch` nhận kết quả của mỗi batch đã commit."""
+        while not self._stop.is_set():
+            result = self.step()
+            if result is not None and on_batch is not None:
+                on_batch(result)
+
+    def step(self) -> Optional[BatchResult]:
+        """Xử lý một batch; None nếu không có message, bundle chưa sẵn sàng hoặc batch phải score lại."""
+        if self.ready is not None and not self.ready():
+            # Lỗi hệ thống chứ không phải dữ liệu hỏng: chưa consume gì, không có gì phải rewind
+            print(f"[WARN] Model bundle not ready; retrying in {self.retry_backoff:g}s")
+            self._stop.wait(self.retry_backoff)
+            return None
+        messages = self.consumer.consume(num_messages=self.batch_size, timeout=self.max_wait)
+        if not messages:
+            return None
+        started = time.perf_counter()
+
+        rows, timestamps, valid_messages = [], [], []
+        invalid = 0
+        for msg in messages:
+            if msg.error():
+                print(f"[WARN] Kafka consume error: {msg.error()}")
+                continue
+            valid_messages.append(msg)
+            row = decode_record(msg.value())
+            if row is None:
+                invalid += 1
+                continue
+            rows.append(row)
+            timestamps.append(msg.timestamp()[1])
+
+        failed = self._score(rows)
+
+        if self.flush_alerts is not None and not self.flush_alerts(self.flush_timeout):
+            # Alert của batch chưa chắc tới broker: không commit, score lại từ đầu batch
+            STREAM_RETRIES.inc()
+            print(f"[WARN] Alerts of a {len(messages)}-record batch were not delivered; rewinding and retrying")
+            self._rewind(valid_messages)
+            self._stop.wait(self.retry_backoff)
+            return None
+
+        try:
+            self.consumer.commit(asynchronous=False)
+        except Exception as e:
+            # Commit lỗi (vd. rebalance): batch có thể bị score lại bởi consumer khác
+            print(f"[WARN] Offset commit failed: {e}")
+
+        now_ms = time.time() * 1000
+        lags = [max(0.0, (now_ms - ts) / 1000) for ts in timestamps if ts > 0]
+        for lag in lags:
+            STREAM_LAG.observe(lag)
+        scored = len(rows) - failed
+        STREAM_RECORDS.labels(outcome="scored").inc(scored)
+        if invalid:
+            STREAM_RECORDS.labels(outcome="invalid").inc(invalid)
+        if failed:
+            STREAM_RECORDS.labels(outcome="failed").inc(failed)
+        STREAM_BATCH_SIZE_HIST.observe(len(messages))
+        seconds = time.perf_counter() - started
+        STREAM_BATCH_SECONDS.observe(seconds)
+        return BatchResult(len(messages), scored, invalid, failed, seconds, lags)
+
+    def _score(self, rows: List[Dict[str, Any]]) -> int:
+        """Score batch; trả về số dòng lỗi. Batch lỗi được score lại từng dòng để cô lập dòng hỏng."""
+        if not rows:
+            return 0
+        try:
+            self.score_fn(rows)
+            return 0
+        except Exception as e:
+            print(f"[WARN] Batch scoring failed ({e}); scoring {len(rows)} records individually")
+        failed = 0
+        for row in rows:
+            try:
+                self.score_fn([row])
+            except Exception:
+                failed += 1
+        return failed
+
+    def _rewind(self, messages):
+        try:
+            from confluent_kafka import TopicPartition
+        except ImportError:
+            from src.inmemory_kafka import TopicPartition
+
+        first: Dict[Any, int] = {}
+        for msg in messages:
+            key = (msg.topic(), msg.partition())
+            first[key] = min(first.get(key, msg.offset()), msg.offset())
+        for (topic, partition), offset in first.items():
+            self.consumer.seek(TopicPartition(topic, partition, offset))
+
+
+def _create_consumer():
+    from confluent_kafka import Consumer
+
+    consumer = Consumer({
+        "bootstrap.servers": os.getenv("KAFKA_BOOTSTRAP_SERVERS", "kafka:9092"),
+        "group.id": STREAM_GROUP,
+        "auto.offset.reset": STREAM_OFFSET_RESET,
+        "enable.auto.commit": False,
+        "partition.assignment.strategy": "cooperative-sticky",
+    })
+    consumer.subscribe([STREAM_TOPIC])
+    return consumer
+
+
+def main():
+    from prometheus_client import start_http_server
+
+    import src.inference_server as server
+
+    server.init_kafka_producer()
+    server.reload_models()
+    bundle = server.model_store.current
+    if bundle is None or not bundle.anomaly_ready:
+        raise SystemExit("❌ Anomaly model/scaler/features missing. Run anomaly pipeline first.")
+
+    consumer = _create_consumer()
+    scorer = StreamScorer(
+        consumer,
+        server._score_batch,
+        flush_alerts=server.kafka_producer.flush if server.kafka_producer is not None else None,
+        batch_size=STREAM_BATCH_SIZE,
+        max_wait_ms=STREAM_MAX_WAIT_MS,
+        flush_timeout=STREAM_FLUSH_TIMEOUT,
+        retry_backoff=STREAM_RETRY_BACKOFF,
+        ready=lambda: server.model_store.current is not None and server.model_store.current.anomaly_ready
+    )
+    signal.signal(signal.SIGTERM, lambda signum, frame: scorer.stop())
+    signal.signal(signal.SIGINT, lambda signum, frame: scorer.stop())
+    signal.signal(signal.SIGHUP, lambda signum, frame: server.model_store.reload_async())
+
+    start_http_server(STREAM_PROM_PORT)
+    print(f"✅ Stream scorer: {STREAM_TOPIC} -> {server.KAFKA_TOPIC} (batch {STREAM_BATCH_SIZE}, "
+          f"max wait {STREAM_MAX_WAIT_MS:g}ms, model bundle v{bundle.version}), metrics at :{STREAM_PROM_PORT}/")
+
+    window = {"start": time.monotonic(), "records": 0, "max_lag": 0.0}
+
+    def report(result: BatchResult):
+        window["records"] += result.records
+        window["max_lag"] = max([window["max_lag"], *result.lags])
+        elapsed = time.monotonic() - window["start"]
+        if elapsed >= STREAM_STATS_INTERVAL:
+            print(f"[stream] {window['records'] / elapsed:.1f} records/s, max end-to-end lag {window['max_lag']:.2f}s")
+            window.update(start=time.monotonic(), records=0, max_lag=0.0)
+
+    try:
+        scorer.run(on_batch=report)
+    finally:
+        consumer.close()
+        if server.kafka_producer is not None:
+            server.kafka_producer.stop(timeout=server.KAFKA_FLUSH_TIMEOUT)
+        server.model_store.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,4 @@
 import os
-import subprocess
 import mlflow
 import shutil
 from pathlib import Path
@@ -8,6 +7,10 @@ from mlflow_utils import (
     register_classifier_model,
     register_rul_model
 )
+from binned_cache import USE_BINNED_CACHE
+from onnx_backend import export_onnx_models
+from out_of_core import MEMORY_LIMIT_MB, OUT_OF_CORE
+from training_pipeline import STAGES, TRAIN_CPUS, TRAIN_PARALLEL, TRAIN_STAGE_CPUS, run_pipeline
 
 # ==============================
 # CONFIG
@@ -15,12 +18,6 @@ from mlflow_utils import (
 MLFLOW_URI = os.getenv("MLFLOW_TRACKING_URI", "http://localhost:6969")
 EXPERIMENT_NAME = os.getenv("MLFLOW_EXPERIMENT", "predictive-maintenance")
 
-SCRIPTS = [
-    "src/anomaly.py",      # Must run first to generate parquet with IF_Anomaly
-    "src/classifier.py",   # Uses parquet from anomaly
-    "src/rul.py"           # Uses parquet and classifier artifacts
-]
-
 MODELS_DIR = Path("models")
 MODEL_SUBDIRS = ["anomaly", "classifier", "rul"]
 
@@ -40,12 +37,13 @@ MODELS_DIR.mkdir(parents=True, exist_ok=True)
 # ==============================
 # HELPERS
 # ==============================
-def run_scripts_or_fail():
-    for script in SCRIPTS:
-        print(f"▶ Running {script}")
-        ret = subprocess.run(["python", script])
-        if ret.returncode != 0:
-            raise RuntimeError(f"❌ Training failed in {script}")
+def run_stages_or_fail():
+    """anomaly -> classifier -> RUL in-process (src/training_pipeline.py); log wall time từng stage."""
+    try:
+        timings = run_pipeline()
+    except Exception as e:
+        raise RuntimeError(f"❌ Training failed: {e}") from e
+    mlflow.log_metrics({f"stage_seconds_{stage}": seconds for stage, seconds in timings.items()})
 
 def log_models():
     """Log models as artifacts to MLflow."""
@@ -118,10 +116,19 @@ if __name__ == "__main__":
         mlflow.set_tag("model", "ensemble")  # Pipeline includes multiple models
         
         mlflow.log_param("pipeline", "ev_predictive_maintenance")
-        mlflow.log_param("scripts", ",".join(SCRIPTS))
+        mlflow.log_param("stages", ",".join(STAGES))
+        mlflow.log_param("train_parallel", TRAIN_PARALLEL)
+        mlflow.log_param("train_cpus", TRAIN_CPUS)
+        if TRAIN_STAGE_CPUS:
+            mlflow.log_param("train_stage_cpus", TRAIN_STAGE_CPUS)
+        mlflow.log_param("train_out_of_core", OUT_OF_CORE)
+        if MEMORY_LIMIT_MB > 0:
+            mlflow.log_param("train_memory_limit_mb", MEMORY_LIMIT_MB)
+        mlflow.log_param("train_binned_cache", USE_BINNED_CACHE)
         mlflow.log_param("model_stage", initial_stage)
 
-        run_scripts_or_fail()
+        run_stages_or_fail()
+        export_onnx_models(MODELS_DIR)  # .onnx cạnh joblib, log cùng log_models()
         log_models()
         
         # Register models to Model Registry
@@ -0,0 +1,141 @@
+"""
+Training job của inference server (`/api/train`): chạy trainer (Docker hoặc
+script trực tiếp), ghi state / log vào `TrainingState` (src/training_state.py)
+rồi reload models.
+
+- Một process (uvicorn thường): `run_training` chạy trong background thread
+  của server và reload tại chỗ.
+- Pre-fork (src/prefork.py): master chạy module này thành process riêng
+  (`python -m src.training_job --notify-pid <master>`, process group riêng nên
+  `force=true` dừng được cả trainer). Master giữ một thread duy nhất, nên fork
+  workers sau reload không kế thừa lock của thread khác hay pipe của trainer.
+  Train xong, job đánh dấu `reload_pending` trong state rồi gửi SIGHUP cho
+  master; master ghi kết quả reload vào log của job.
+
+| Env | Mặc định | Ý nghĩa |
+|-----|----------|---------|
+| `TRAINER_SCRIPT` | `src/train_wrapper.py` | Script chạy khi không dùng Docker |
+| `USE_DOCKER` | `true` | Chạy `docker compose run trainer` nếu có docker |
+"""
+
+import argparse
+import os
+import signal
+import subprocess
+from typing import Callable
+
+from src.training_state import TrainingState
+
+# Check if running in Docker
+IN_DOCKER = os.path.exists("/.dockerenv")
+WORKSPACE_DIR = "/workspace" if IN_DOCKER else os.getcwd()
+
+TRAINER_SCRIPT = os.getenv("TRAINER_SCRIPT", "src/train_wrapper.py")
+USE_DOCKER = os.getenv("USE_DOCKER", "true").lower() == "true"
+
+
+def check_docker_available():
+    """Kiểm tra xem docker command có sẵn không."""
+    try:
+        result = subprocess.run(
+            ["docker", "--version"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            timeout=5
+        )
+        return result.returncode == 0
+    except (FileNotFoundError, subprocess.TimeoutExpired):
+        return False
+
+
+def run_training(state: TrainingState, rebuild: bool, reload: Callable[[], None]):
+    """
+    Chạy training (blocking) rồi gọi `reload`.
+
+    Caller đã đặt "running" bằng `state.begin`. Kết quả training được ghi vào
+    `state` trước khi reload (pre-fork: reload thay toàn bộ workers).
+    """
+    try:
+        docker_available = check_docker_available()
+
+        if USE_DOCKER and docker_available:
+            # Chạy training trong Docker container
+            state.log("Starting training in Docker container...")
+
+            # Build trainer image nếu cần
+            if rebuild:
+                build_cmd = ["docker", "compose", "build", "trainer"]
+                state.log("Building trainer image...")
+                build_process = subprocess.run(
+                    build_cmd,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.STDOUT,
+                    text=True,
+                    cwd=WORKSPACE_DIR,
+                    timeout=600  # 10 minutes timeout
+                )
+                state.log(f"Build output: {build_process.stdout[-500:]}")  # Last 500 chars
+
+            # Chạy training trong Docker container
+            cmd = ["docker", "compose", "run", "--rm", "trainer"]
+            process = subprocess.Popen(
+                cmd,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                text=True,
+                bufsize=1,
+                universal_newlines=True,
+                cwd=WORKSPACE_DIR
+            )
+        else:
+            # Fallback: Chạy training script trực tiếp
+            if USE_DOCKER and not docker_available:
+                state.log("Docker not available, falling back to direct script execution...")
+
+            state.log(f"Running training script directly: {TRAINER_SCRIPT}")
+            process = subprocess.Popen(
+                ["python", TRAINER_SCRIPT],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                text=True,
+                bufsize=1,
+                universal_newlines=True,
+                cwd=WORKSPACE_DIR
+            )
+
+        # Đọc log real-time (API trả về MAX_LOG_LINES dòng cuối)
+        for line in process.stdout:
+            state.log(line.strip())
+
+        process.wait()
+
+        if process.returncode == 0:
+            state.finish("completed")
+            state.log("Training completed successfully! Reloading models...")
+            reload()
+        else:
+            state.finish("failed")
+            state.log(f"Training failed with exit code {process.returncode}")
+
+    except Exception as e:
+        state.finish("failed")
+        state.log(f"Error: {str(e)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--notify-pid", type=int, required=True, help="pid của pre-fork master (nhận SIGHUP)")
+    args = parser.parse_args()
+
+    # TRAINING_STATE_DIR do master truyền vào: cùng thư mục với workers
+    state = TrainingState()
+
+    def request_reload():
+        state.update(reload_pending=True)
+        os.kill(args.notify_pid, signal.SIGHUP)
+
+    run_training(state, bool(state.read().get("rebuild", True)), request_reload)
+
+
+if __name__ == "__main__":
+    main()
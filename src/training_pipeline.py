@@ -0,0 +1,312 @@
+"""
+Training pipeline in-process: anomaly -> (classifier || RUL).
+
+Trước đây `train_wrapper.py` chạy ba scripts bằng ba subprocess `python`: mỗi
+stage import lại pandas / sklearn / mlflow, đọc lại CSV hoặc
+`features_with_anomaly.parquet` mà anomaly vừa ghi. Ở đây dataset được đọc
+một lần, frame đã gắn `IF_Anomaly` và artifacts của classifier (`label_col`,
+`label_encoder`) được truyền thẳng giữa các stage trong memory.
+
+Chỉ anomaly phải chạy trước (gắn IF_Anomaly vào frame). RUL chỉ cần
+`label_col` / `label_encoder` của classifier, tính được mà không cần fit
+(`classifier_labels`), nên classifier và RUL chạy song song trong process pool
+(fork: worker dùng chung frame của process cha, không serialize). Mỗi stage có
+CPU budget riêng (`n_jobs` của model + giới hạn thread BLAS/OpenMP):
+
+| Env | Mặc định | Ý nghĩa |
+|-----|----------|---------|
+| `TRAIN_PARALLEL` | `true` | Chạy song song các stage độc lập |
+| `TRAIN_CPUS` | số CPU | Tổng CPU cho training |
+| `TRAIN_STAGE_CPUS` | (trống) | Budget theo stage, vd. `classifier=12,rul=20`; stage không khai báo chia đều phần còn lại của đợt |
+
+Dataset không vừa `TRAIN_MEMORY_LIMIT_MB` được train out-of-core theo row
+group của cache (`TRAIN_OUT_OF_CORE`, src/out_of_core.py); khi đó các stage
+chạy lần lượt.
+
+Scripts vẫn chạy riêng lẻ được (`python src/anomaly.py`, ...); khi đó classifier
+/ RUL đọc parquet do anomaly ghi. `TRAIN_SAVE_ANNOTATED=true` để pipeline cũng
+ghi parquet này.
+
+Usage:
+    python src/training_pipeline.py     # train không register (train_wrapper.py để log + register)
+"""
+
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import mlflow
+import pandas as pd
+
+# training chạy với src/ trên sys.path, import qua package src khi dùng từ repo root
+try:
+    from src import anomaly, classifier, rul
+    from src.dataset_cache import USE_CACHE, load_training_frame, prepare_dataset
+    from src.out_of_core import ParquetChunks, rss_mb, should_run_out_of_core
+except ImportError:
+    import anomaly
+    import classifier
+    import rul
+    from dataset_cache import USE_CACHE, load_training_frame, prepare_dataset
+    from out_of_core import ParquetChunks, rss_mb, should_run_out_of_core
+
+STAGES = ("anomaly", "classifier", "rul")
+# Stage -> các stage phải xong trước. RUL chỉ cần labels của classifier (có trước khi classifier fit)
+STAGE_DEPS = {
+    "anomaly": (),
+    "classifier": ("anomaly",),
+    "rul": ("anomaly",),
+}
+
+SAVE_ANNOTATED = os.getenv("TRAIN_SAVE_ANNOTATED", "false").lower() == "true"
+TRAIN_PARALLEL = os.getenv("TRAIN_PARALLEL", "true").lower() == "true"
+TRAIN_CPUS = int(os.getenv("TRAIN_CPUS", "0")) or os.cpu_count() or 1
+TRAIN_STAGE_CPUS = os.getenv("TRAIN_STAGE_CPUS", "")
+
+# Frame dùng chung cho worker processes (gán qua initializer: fork thì kế thừa, spawn thì pickle)
+_FRAME: Optional[pd.DataFrame] = None
+
+
+def dataset_columns() -> List[str]:
+    """Các cột mà ba stage dùng."""
+    return anomaly.COLUMNS + classifier.COLUMNS + rul.COLUMNS
+
+
+def load_dataset(csv: Path = anomaly.CSV) -> pd.DataFrame:
+    """
+    Đọc dataset một lần cho cả pipeline: chỉ các cột mà ba stage dùng, qua cache
+    Parquet có kiểu (src/dataset_cache.py).
+    """
+    return load_training_frame(dataset_columns(), csv=csv)
+
+
+def parse_stage_cpus(spec: str) -> Dict[str, int]:
+    """`"classifier=12,rul=20"` -> {"classifier": 12, "rul": 20}."""
+    budgets = {}
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        stage, _, cpus = item.partition("=")
+        stage = stage.strip()
+        if stage not in STAGE_DEPS:
+            raise ValueError(f"Unknown training stage in TRAIN_STAGE_CPUS: {stage!r}")
+        budgets[stage] = max(1, int(cpus))
+    return budgets
+
+
+def stage_waves(deps: Dict[str, Tuple[str, ...]] = STAGE_DEPS) -> List[List[str]]:
+    """Các đợt stage theo thứ tự topo: stage trong cùng đợt không phụ thuộc nhau."""
+    done, waves = set(), []
+    while len(done) < len(deps):
+        ready = [stage for stage in deps if stage not in done and all(d in done for d in deps[stage])]
+        if not ready:
+            raise ValueError(f"Cycle in training stage dependencies: {deps}")
+        waves.append(ready)
+        done.update(ready)
+    return waves
+
+
+def wave_budgets(wave: List[str], total_cpus: int, explicit: Dict[str, int]) -> Dict[str, int]:
+    """CPU budget của từng stage trong đợt: khai báo trong TRAIN_STAGE_CPUS, còn lại chia đều."""
+    budgets = {stage: explicit[stage] for stage in wave if stage in explicit}
+    rest = [stage for stage in wave if stage not in budgets]
+    if rest:
+        share = max(1, (total_cpus - sum(budgets.values())) // len(rest))
+        budgets.update({stage: share for stage in rest})
+    return budgets
+
+
+def _init_worker(frame: pd.DataFrame, parent_run_id: Optional[str]):
+    global _FRAME
+    _FRAME = frame
+    if parent_run_id is not None:
+        # Active run của MLflow không theo sang process con: gắn lại run của pipeline
+        # (không end) để run của từng stage vẫn nested dưới nó
+        mlflow.start_run(run_id=parent_run_id)
+
+
+def _run_stage(stage: str, cpus: int, context: Dict[str, Any]) -> Tuple[str, Any, float]:
+    """Chạy một stage trên `_FRAME` với `cpus` thread; trả về (stage, kết quả, giây)."""
+    from threadpoolctl import threadpool_limits
+
+    started = time.perf_counter()
+    with threadpool_limits(limits=cpus):
+        if stage == "anomaly":
+            result = anomaly.train_anomaly(_FRAME, n_jobs=cpus)
+        elif stage == "classifier":
+            result = classifier.train_classifier(_FRAME, n_jobs=cpus)
+        elif stage == "rul":
+            result = rul.train_rul(_FRAME, label_col=context["label_col"], label_encoder=context["label_encoder"],
+                                   n_jobs=cpus)
+        else:
+            raise ValueError(f"Unknown training stage: {stage}")
+    return stage, result, time.perf_counter() - started
+
+
+def _stage_context(stage: str, df: pd.DataFrame) -> Dict[str, Any]:
+    """
+    Input nhỏ mà stage cần từ stage khác, tính ở process cha trước khi submit.
+
+    Label số (classifier không có encoder): encoder dự phòng của RUL cũng được
+    fit ở đây thay vì trong worker, và chỉ process cha ghi nó vào artifacts của
+    classifier sau khi đợt xong (`fallback_encoder`), nên worker RUL không ghi
+    vào thư mục mà classifier đang ghi song song.
+    """
+    if stage == "rul":
+        label_col, _, label_encoder = classifier.classifier_labels(df)
+        fallback = label_encoder is None
+        if fallback:
+            label_encoder = rul.fallback_label_encoder(df[label_col])
+        return {"label_col": label_col, "label_encoder": label_encoder, "fallback_encoder": fallback}
+    return {}
+
+
+def run_pipeline(
+    df: Optional[pd.DataFrame] = None,
+    save_annotated_frame: bool = SAVE_ANNOTATED,
+    parallel: bool = TRAIN_PARALLEL,
+    total_cpus: int = TRAIN_CPUS,
+    stage_cpus: Optional[Dict[str, int]] = None
+) -> Dict[str, float]:
+    """
+    Chạy các stage theo `STAGE_DEPS` trên cùng một DataFrame, hoặc out-of-core
+    theo row group của cache khi dataset không vừa `TRAIN_MEMORY_LIMIT_MB`
+    (`TRAIN_OUT_OF_CORE`, src/out_of_core.py).
+
+    Đợt chỉ có một stage (anomaly) chạy ngay trong process này vì nó sửa frame
+    dùng chung; đợt nhiều stage chạy song song trong process pool (`parallel`),
+    hoặc lần lượt nếu `parallel=False`.
+
+    Args:
+        df: dataset đã load (None = `load_dataset()`); anomaly thêm cột IF_Anomaly vào frame này
+        total_cpus / stage_cpus: CPU budget (mặc định `TRAIN_CPUS` / `TRAIN_STAGE_CPUS`)
+
+    Returns:
+        Wall time (giây) theo stage (load, anomaly, classifier, rul), của mỗi đợt
+        song song (`parallel_classifier_rul`) và total
+    """
+    explicit = parse_stage_cpus(TRAIN_STAGE_CPUS) if stage_cpus is None else stage_cpus
+    timings: Dict[str, float] = {}
+    started = time.perf_counter()
+
+    chunks = None
+    if df is None and USE_CACHE:
+        chunks = ParquetChunks(prepare_dataset(anomaly.CSV), dataset_columns())
+        chunked, reason = should_run_out_of_core(chunks.rows, len(chunks.columns))
+        print(f"▶ {'Out-of-core' if chunked else 'In-memory'} training ({chunks.rows} rows): {reason}")
+        if not chunked:
+            chunks = None
+
+    if chunks is not None:
+        if save_annotated_frame:
+            print("[WARN] TRAIN_SAVE_ANNOTATED is ignored in out-of-core mode")
+        timings["load"] = time.perf_counter() - started
+        timings.update(run_out_of_core(chunks, total_cpus, explicit))
+    else:
+        if df is None:
+            df = load_dataset()
+        timings["load"] = time.perf_counter() - started
+        timings.update(_run_waves(df, save_annotated_frame, parallel, total_cpus, explicit))
+
+    timings["total"] = time.perf_counter() - started
+    print("\n⏱️ Stage wall time:")
+    for stage, seconds in timings.items():
+        print(f"  {stage:<24} {seconds:8.2f}s")
+    return timings
+
+
+def _run_waves(
+    df: pd.DataFrame,
+    save_annotated_frame: bool,
+    parallel: bool,
+    total_cpus: int,
+    explicit: Dict[str, int]
+) -> Dict[str, float]:
+    global _FRAME
+
+    timings: Dict[str, float] = {}
+    _FRAME = df
+    for wave in stage_waves():
+        budgets = wave_budgets(wave, total_cpus, explicit)
+        contexts = {stage: _stage_context(stage, df) for stage in wave}
+        wave_start = time.perf_counter()
+        if len(wave) == 1 or not parallel:
+            for stage in wave:
+                # Chạy lần lượt: stage không khai báo budget dùng toàn bộ TRAIN_CPUS
+                cpus = wave_budgets([stage], total_cpus, explicit)[stage]
+                print(f"▶ Stage {stage} ({cpus} CPUs)")
+                _, _, timings[stage] = _run_stage(stage, cpus, contexts[stage])
+        else:
+            print("▶ Stages " + ", ".join(f"{stage} ({budgets[stage]} CPUs)" for stage in wave) + " in parallel")
+            # fork: worker kế thừa frame (đã có IF_Anomaly) thay vì nhận bản pickle
+            methods = multiprocessing.get_all_start_methods()
+            mp_context = multiprocessing.get_context("fork" if "fork" in methods else None)
+            parent_run = mlflow.active_run()
+            with ProcessPoolExecutor(
+                max_workers=len(wave), mp_context=mp_context, initializer=_init_worker,
+                initargs=(df, parent_run.info.run_id if parent_run is not None else None)
+            ) as pool:
+                pending = {pool.submit(_run_stage, stage, budgets[stage], contexts[stage]) for stage in wave}
+                while pending:
+                    finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        stage, _, timings[stage] = future.result()
+                        print(f"✅ Stage {stage} finished in {timings[stage]:.2f}s")
+        if len(wave) > 1:
+            timings["parallel_" + "_".join(wave)] = time.perf_counter() - wave_start
+        for context in contexts.values():
+            if context.get("fallback_encoder"):
+                rul.save_label_encoder(context["label_encoder"], classifier.MODEL_DIR)
+        if "anomaly" in wave and save_annotated_frame:
+            anomaly.save_annotated(df)
+    return timings
+
+
+def run_out_of_core(
+    chunks: ParquetChunks,
+    total_cpus: int = TRAIN_CPUS,
+    stage_cpus: Optional[Dict[str, int]] = None,
+    models_dir: Optional[Path] = None
+) -> Dict[str, float]:
+    """
+    Các stage out-of-core (`train_*_chunked`) đọc `chunks` theo row group. Chạy
+    lần lượt, không song song, để peak memory chỉ là của một stage. File tạm
+    (IF_Anomaly memmap, trang của XGBoost) nằm trong một thư mục tạm cạnh cache.
+
+    Args:
+        models_dir: thư mục chứa anomaly/ classifier/ rul/ (None = `models/` như các trainers)
+    """
+    from threadpoolctl import threadpool_limits
+
+    explicit = parse_stage_cpus(TRAIN_STAGE_CPUS) if stage_cpus is None else stage_cpus
+    dirs = {stage: Path(models_dir) / stage for stage in STAGES} if models_dir is not None else {
+        "anomaly": anomaly.MODEL_DIR, "classifier": classifier.MODEL_DIR, "rul": rul.MODEL_DIR}
+    timings: Dict[str, float] = {}
+    with tempfile.TemporaryDirectory(prefix="train-", dir=chunks.path.parent) as work_dir:
+        labels = None
+        for stage in STAGES:
+            cpus = wave_budgets([stage], total_cpus, explicit)[stage]
+            print(f"▶ Stage {stage} ({cpus} CPUs, out-of-core)")
+            started = time.perf_counter()
+            with threadpool_limits(limits=cpus):
+                if stage == "anomaly":
+                    anomaly.train_anomaly_chunked(chunks, work_dir, dirs[stage], n_jobs=cpus)
+                elif stage == "classifier":
+                    labels = classifier.classifier_labels_chunked(chunks)
+                    classifier.train_classifier_chunked(chunks, work_dir, dirs[stage], n_jobs=cpus, labels=labels)
+                else:
+                    label_col, _, label_encoder = labels
+                    rul.train_rul_chunked(chunks, label_col=label_col, label_encoder=label_encoder,
+                                          model_dir=dirs[stage], classifier_dir=dirs["classifier"], n_jobs=cpus)
+            timings[stage] = time.perf_counter() - started
+            print(f"✅ Stage {stage} finished in {timings[stage]:.2f}s (peak RSS {rss_mb('VmHWM'):.0f} MB)")
+        chunks.extra.clear()  # đóng memmap trước khi xoá thư mục tạm
+    return timings
+
+
+if __name__ == "__main__":
+    run_pipeline()
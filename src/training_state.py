@@ -0,0 +1,165 @@
+"""
+Trạng thái training job (`/api/train`, `/api/training/status`, `/api/training/logs`)
+lưu trên file thay vì dict trong process.
+
+Chạy pre-fork (src/prefork.py) mỗi worker là một process riêng và bị thay khi
+reload models, nên dict trong worker vừa cho phép hai training chạy trùng
+(mỗi worker tự kiểm tra "running"), vừa mất log / kết quả khi worker bị
+SIGTERM. Ở đây mọi process đọc / ghi cùng một thư mục:
+
+    <dir>/state.json   status, started_at, completed_at, rebuild, pid (ghi đè atomic)
+    <dir>/log.jsonl    mỗi dòng một {"timestamp", "message"} (append)
+
+Kiểm tra + đặt "running" (`begin`) giữ `fcntl.flock` trên `<dir>/.lock`, nên
+chỉ một request thắng. State "running" của process đã chết (vd. server
+restart giữa chừng với `TRAINING_STATE_DIR` cố định) được coi như không chạy.
+
+| Env | Mặc định | Ý nghĩa |
+|-----|----------|---------|
+| `TRAINING_STATE_DIR` | `<tmp>/inference-training-<pid>` | Thư mục state; pid là của process import module (pre-fork: master, workers kế thừa) |
+"""
+
+import json
+import os
+import tempfile
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows dev: không có lock liên process
+    fcntl = None
+
+TRAINING_STATE_DIR = os.getenv("TRAINING_STATE_DIR") or os.path.join(
+    tempfile.gettempdir(), f"inference-training-{os.getpid()}")
+MAX_LOG_LINES = 1000
+
+IDLE_STATE = {"status": "idle", "started_at": None, "completed_at": None}
+
+
+def _alive(pid: Optional[int]) -> bool:
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class TrainingState:
+    """
+    State + log của training job, dùng chung giữa các process qua `root`.
+
+    Args:
+        root: thư mục state (tạo nếu chưa có)
+        max_log_lines: số dòng log trả về (dòng cũ hơn vẫn ở file tới lần `begin` sau)
+    """
+
+    def __init__(self, root=TRAINING_STATE_DIR, max_log_lines: int = MAX_LOG_LINES):
+        self.root = Path(root)
+        self.max_log_lines = max_log_lines
+        self.state_path = self.root / "state.json"
+        self.log_path = self.root / "log.jsonl"
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    @contextmanager
+    def _lock(self):
+        if fcntl is None:
+            yield
+            return
+        with open(self.root / ".lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def read(self) -> Dict[str, Any]:
+        try:
+            return json.loads(self.state_path.read_text())
+        except (OSError, ValueError):
+            return dict(IDLE_STATE)
+
+    def _write(self, state: Dict[str, Any]):
+        tmp_path = self.state_path.with_suffix(f".tmp{os.getpid()}")
+        tmp_path.write_text(json.dumps(state))
+        os.replace(tmp_path, self.state_path)  # reader không thấy file ghi dở
+
+    def running(self) -> bool:
+        state = self.read()
+        return state["status"] == "running" and _alive(state.get("pid"))
+
+    def begin(self, rebuild: bool, force: bool = False, pid: Optional[int] = None) -> bool:
+        """
+        Đặt "running" (xoá log cũ) nếu chưa có job đang chạy hoặc `force`.
+
+        Args:
+            pid: process sẽ chạy training (None = process gọi hàm)
+
+        Returns:
+            False nếu đã có job đang chạy và không `force`
+        """
+        with self._lock():
+            if self.running() and not force:
+                return False
+            self._write({
+                "status": "running",
+                "started_at": datetime.now().isoformat(),
+                "completed_at": None,
+                "rebuild": rebuild,
+                "pid": pid or os.getpid(),
+            })
+            self.log_path.write_text("")
+        return True
+
+    def update(self, **fields):
+        """Sửa các field của state (vd. status, completed_at)."""
+        with self._lock():
+            state = self.read()
+            state.update(fields)
+            self._write(state)
+
+    def finish(self, status: str):
+        self.update(status=status, completed_at=datetime.now().isoformat())
+
+    def log(self, message: str):
+        line = json.dumps({"timestamp": datetime.now().isoformat(), "message": message}) + "\n"
+        # O_APPEND: dòng của nhiều process không chen vào nhau
+        fd = os.open(self.log_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line.encode("utf-8"))
+        finally:
+            os.close(fd)
+
+    def logs(self) -> List[Dict[str, Any]]:
+        """`max_log_lines` dòng log gần nhất."""
+        try:
+            with open(self.log_path, encoding="utf-8") as f:
+                lines = deque(f, maxlen=self.max_log_lines)
+        except OSError:
+            return []
+        entries = []
+        for line in lines:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                continue
+        return entries
+
+    def snapshot(self) -> Dict[str, Any]:
+        """State như dict `training_state` trước đây: status, started_at, completed_at, log."""
+        state = self.read()
+        if state["status"] == "running" and not _alive(state.get("pid")):
+            state["status"] = "failed"
+        return {
+            "status": state["status"],
+            "started_at": state.get("started_at"),
+            "completed_at": state.get("completed_at"),
+            "log": self.logs(),
+        }
@@ -0,0 +1,437 @@
+"""
+Compiled tree evaluator cho inference một dòng / batch nhỏ.
+
+Với input 9-28 features, `IsolationForest.predict`, `XGBClassifier.predict` và
+`LGBMRegressor.predict` tốn phần lớn thời gian vào overhead cố định (validate
+input, DMatrix/Dataset, thread pool) chứ không phải duyệt cây. Module này làm
+phẳng cả ensemble thành các mảng NumPy (feature, threshold, left, right, value)
+và duyệt tất cả cây cùng lúc theo từng tầng, vectorized trên (rows x trees).
+
+Kết quả được so với model gốc khi load (`select_backend`); nếu lệch thì dùng
+lại model gốc.
+"""
+
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Missing-value handling của từng node (theo LightGBM; XGBoost = MISSING_NAN)
+MISSING_NONE = 0
+MISSING_ZERO = 1
+MISSING_NAN = 2
+_ZERO_THRESHOLD = 1e-35  # LightGBM kZeroThreshold
+
+# "onnx" được xử lý bởi src/onnx_backend.py; ở đây chỉ trả lại model gốc
+BACKENDS = ("native", "compiled", "onnx")
+
+
+class CompiledTrees:
+    """
+    Node arrays của một tree ensemble, nối liền các cây.
+
+    Leaf trỏ về chính nó (left = right = self, threshold = +inf) nên mọi dòng
+    chỉ cần duyệt đúng `max_depth` tầng, không cần kiểm tra leaf ở mỗi tầng.
+    """
+
+    def __init__(self, input_dtype, strict: bool):
+        self.input_dtype = np.dtype(input_dtype)
+        self.strict = strict  # XGBoost: x < thr; sklearn/LightGBM: x <= thr
+        self._feature: List[int] = []
+        self._threshold: List[float] = []
+        self._left: List[int] = []
+        self._right: List[int] = []
+        self._value: List[float] = []
+        self._default_left: List[bool] = []
+        self._missing: List[int] = []
+        self._roots: List[int] = []
+        self.max_depth = 0
+
+    def add_tree(
+        self,
+        feature, threshold, left, right, value,
+        default_left=None, missing=None
+    ):
+        """Thêm một cây; `left`/`right` < 0 đánh dấu leaf, index là local của cây."""
+        offset = len(self._feature)
+        n = len(feature)
+        left = np.asarray(left)
+        right = np.asarray(right)
+        is_leaf = left < 0
+        for i in range(n):
+            if is_leaf[i]:
+                self._feature.append(0)
+                self._threshold.append(np.inf)
+                self._left.append(offset + i)
+                self._right.append(offset + i)
+                self._default_left.append(True)
+                self._missing.append(MISSING_NONE)
+            else:
+                self._feature.append(int(feature[i]))
+                self._threshold.append(float(threshold[i]))
+                self._left.append(offset + int(left[i]))
+                self._right.append(offset + int(right[i]))
+                self._default_left.append(bool(default_left[i]) if default_left is not None else True)
+                self._missing.append(int(missing[i]) if missing is not None else MISSING_NONE)
+            self._value.append(float(value[i]))
+        self._roots.append(offset)
+        self.max_depth = max(self.max_depth, int(_node_path_lengths(left, right).max()) - 1)
+
+    def finalize(self, value_dtype):
+        self.feature = np.asarray(self._feature, dtype=np.intp)
+        self.threshold = np.asarray(self._threshold, dtype=self.input_dtype if self.strict else np.float64)
+        self.left = np.asarray(self._left, dtype=np.intp)
+        self.right = np.asarray(self._right, dtype=np.intp)
+        self.value = np.asarray(self._value, dtype=value_dtype)
+        self.default_left = np.asarray(self._default_left, dtype=bool)
+        self.missing = np.asarray(self._missing, dtype=np.int8)
+        self.roots = np.asarray(self._roots, dtype=np.intp)
+        self.has_zero_missing = bool((self.missing == MISSING_ZERO).any())
+        self.n_features = int(self.feature.max()) + 1 if len(self.feature) else 0
+        for name in ("_feature", "_threshold", "_left", "_right", "_value",
+                     "_default_left", "_missing", "_roots"):
+            delattr(self, name)
+        return self
+
+    @property
+    def n_trees(self) -> int:
+        return len(self.roots)
+
+    def leaves(self, X: np.ndarray) -> np.ndarray:
+        """Index leaf (global) của mỗi dòng trong mỗi cây, shape (n_rows, n_trees)."""
+        X = np.ascontiguousarray(X, dtype=self.input_dtype)
+        n_rows = X.shape[0]
+        flat = X.ravel()
+        row_offset = (np.arange(n_rows, dtype=np.intp) * X.shape[1])[:, None]
+        node = np.broadcast_to(self.roots, (n_rows, self.n_trees)).copy()
+
+        handle_missing = self.has_zero_missing or bool(np.isnan(flat).any())
+        for _ in range(self.max_depth):
+            v = flat[row_offset + self.feature[node]]
+            thr = self.threshold[node]
+            if handle_missing:
+                go_left = self._decide_missing(v, thr, node)
+            else:
+                go_left = v < thr if self.strict else v <= thr
+            node = np.where(go_left, self.left[node], self.right[node])
+        return node
+
+    def _decide_missing(self, v, thr, node):
+        missing = self.missing[node]
+        nan = np.isnan(v)
+        # LightGBM: NaN ở node không phải MISSING_NAN được coi như 0
+        v = np.where(nan & (missing != MISSING_NAN), 0, v)
+        is_missing = ((missing == MISSING_ZERO) & (np.abs(v) <= _ZERO_THRESHOLD)) | (
+            (missing == MISSING_NAN) & nan
+        )
+        go_left = v < thr if self.strict else v <= thr
+        return np.where(is_missing, self.default_left[node], go_left)
+
+    def probe(self, n_rows: int, seed: int = 0, boundary_fraction: float = 0.2) -> np.ndarray:
+        """
+        Dòng test cho parity check: giá trị quanh các threshold, kể cả đúng bằng threshold.
+
+        `boundary_fraction` là tỉ lệ giá trị đặt đúng bằng threshold; dùng 0 khi so
+        với backend chạy float32 (ONNX), nơi các dòng đó được phép lệch nhánh.
+        """
+        rng = np.random.default_rng(seed)
+        X = rng.normal(size=(n_rows, self.n_features))
+        internal = np.isfinite(self.threshold)
+        for f in range(self.n_features):
+            thr = self.threshold[internal & (self.feature == f)].astype(float)
+            if thr.size == 0:
+                continue
+            lo, hi = thr.min(), thr.max()
+            pad = max(hi - lo, 1.0) * 0.1
+            X[:, f] = rng.uniform(lo - pad, hi + pad, size=n_rows)
+            on_boundary = rng.random(n_rows) < boundary_fraction
+            X[on_boundary, f] = rng.choice(thr, size=int(on_boundary.sum()))
+        return X
+
+
+def _node_path_lengths(left: np.ndarray, right: np.ndarray) -> np.ndarray:
+    """Số node trên đường từ root tới mỗi node (root = 1), như sklearn decision_path."""
+    length = np.ones(len(left), dtype=np.int64)
+    stack = [0]
+    while stack:
+        i = stack.pop()
+        if left[i] >= 0:
+            length[left[i]] = length[right[i]] = length[i] + 1
+            stack.extend((left[i], right[i]))
+    return length
+
+
+def _average_path_length(n_samples_leaf) -> np.ndarray:
+    """Giống `sklearn.ensemble._iforest._average_path_length`."""
+    n = np.asarray(n_samples_leaf, dtype=float).reshape(-1)
+    result = np.zeros(n.shape)
+    mask_1 = n <= 1
+    mask_2 = n == 2
+    not_mask = ~np.logical_or(mask_1, mask_2)
+    result[mask_2] = 1.0
+    result[not_mask] = (
+        2.0 * (np.log(n[not_mask] - 1.0) + np.euler_gamma)
+        - 2.0 * (n[not_mask] - 1.0) / n[not_mask]
+    )
+    return result
+
+
+def _sequential_sum(values: np.ndarray, start=None) -> np.ndarray:
+    """Cộng dồn theo đúng thứ tự cây (như các thư viện gốc), không dùng pairwise sum."""
+    if start is not None:
+        values = np.concatenate([np.full((values.shape[0], 1), start, dtype=values.dtype), values], axis=1)
+    if values.shape[1] == 0:
+        return np.zeros(values.shape[0], dtype=values.dtype)
+    return np.cumsum(values, axis=1, dtype=values.dtype)[:, -1]
+
+
+class _CompiledModel:
+    """
+    Base cho các predictor compiled.
+
+    Batch lớn hơn `max_rows` được chuyển cho model gốc: duyệt vectorized trên
+    (rows x trees) thắng ở batch nhỏ nhưng thua thư viện native ở batch lớn.
+    """
+
+    backend = "compiled"
+    native: Any = None
+    trees: CompiledTrees
+    max_rows: Optional[int] = None
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        if self.max_rows is not None and X.shape[0] > self.max_rows:
+            return self.native.predict(X)
+        return self._predict(X)
+
+    def _predict(self, X: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+
+# ============================================================
+# ------------------- ISOLATION FOREST ------------------------
+# ============================================================
+
+class CompiledIsolationForest(_CompiledModel):
+    """`IsolationForest.predict` (1 normal, -1 anomaly) trên node arrays."""
+
+    def __init__(self, model):
+        self.native = model
+        trees = CompiledTrees(np.float32, strict=False)
+        for tree, features in zip(model.estimators_, model.estimators_features_):
+            t = tree.tree_
+            left, right = t.children_left, t.children_right
+            # Map feature của cây con về cột của input đầy đủ
+            feature = np.where(left >= 0, np.asarray(features)[np.maximum(t.feature, 0)], 0)
+            # Đóng góp vào depth của mỗi leaf, cùng thứ tự phép tính với sklearn
+            depth_value = _node_path_lengths(left, right) + _average_path_length(t.n_node_samples) - 1.0
+            trees.add_tree(feature, t.threshold, left, right, depth_value)
+        self.trees = trees.finalize(np.float64)
+
+        max_samples = getattr(model, "_max_samples", None) or model.max_samples_
+        self.denominator = len(model.estimators_) * _average_path_length([max_samples])
+        self.offset = model.offset_
+
+    def score_samples(self, X: np.ndarray) -> np.ndarray:
+        if np.isnan(X).any():
+            raise ValueError("Input X contains NaN.")
+        depths = _sequential_sum(self.trees.value[self.trees.leaves(X)])
+        scores = 2 ** (
+            -np.divide(depths, self.denominator, out=np.ones_like(depths), where=self.denominator != 0)
+        )
+        return -scores
+
+    def _predict(self, X: np.ndarray) -> np.ndarray:
+        decision = self.score_samples(X) - self.offset
+        is_inlier = np.ones_like(decision, dtype=int)
+        is_inlier[decision < 0] = -1
+        return is_inlier
+
+
+# ============================================================
+# ------------------------- XGBOOST ---------------------------
+# ============================================================
+
+def _parse_float_vector(value: str) -> np.ndarray:
+    return np.asarray([float(v) for v in str(value).strip("[]").split(",") if v.strip()], dtype=np.float32)
+
+
+class CompiledXGBClassifier(_CompiledModel):
+    """`XGBClassifier.predict` (class index) trên node arrays, so sánh float32 `x < thr`."""
+
+    def __init__(self, model):
+        self.native = model
+        booster = model.get_booster()
+        learner = json.loads(booster.save_raw(raw_format="json"))["learner"]
+        gbm = learner["gradient_booster"]
+        if gbm.get("name") != "gbtree":
+            raise NotImplementedError(f"Unsupported XGBoost booster: {gbm.get('name')}")
+
+        objective = learner["objective"]["name"]
+        params = learner["learner_model_param"]
+        self.n_classes = int(model.n_classes_)
+        n_groups = max(1, int(params.get("num_class", "0") or 0))
+
+        tree_dicts = gbm["model"]["trees"]
+        tree_info = gbm["model"]["tree_info"]
+        # Như XGBClassifier.predict: chỉ dùng tới best_iteration nếu có early stopping
+        try:
+            best_iteration = model.best_iteration
+        except AttributeError:
+            best_iteration = None
+        if best_iteration is not None:
+            indptr = gbm["model"].get("iteration_indptr")
+            n_used = indptr[best_iteration + 1] if indptr else (best_iteration + 1) * n_groups
+            tree_dicts, tree_info = tree_dicts[:n_used], tree_info[:n_used]
+
+        trees = CompiledTrees(np.float32, strict=True)
+        for t in tree_dicts:
+            if any(t.get("split_type", [])):
+                raise NotImplementedError("Categorical XGBoost splits are not supported")
+            left = np.asarray(t["left_children"])
+            # Leaf value của XGBoost nằm trong split_conditions
+            trees.add_tree(
+                t["split_indices"], np.float32(t["split_conditions"]), left, t["right_children"],
+                np.float32(t["split_conditions"]),
+                default_left=t["default_left"],
+                missing=np.full(len(left), MISSING_NAN)
+            )
+        self.trees = trees.finalize(np.float32)
+        self.group_trees = [np.flatnonzero(np.asarray(tree_info) == g) for g in range(n_groups)]
+
+        base = _parse_float_vector(params.get("base_score", "0.5"))
+        if objective in ("binary:logistic", "reg:logistic"):
+            base = np.log(base / (np.float32(1) - base)).astype(np.float32)
+        elif objective not in ("multi:softprob", "multi:softmax", "binary:logitraw"):
+            raise NotImplementedError(f"Unsupported XGBoost objective: {objective}")
+        self.base_margin = np.broadcast_to(base, (n_groups,)).astype(np.float32)
+
+    def margins(self, X: np.ndarray) -> np.ndarray:
+        values = self.trees.value[self.trees.leaves(X)]
+        return np.stack(
+            [_sequential_sum(values[:, idx], start=self.base_margin[g]) for g, idx in enumerate(self.group_trees)],
+            axis=1
+        )
+
+    def _predict(self, X: np.ndarray) -> np.ndarray:
+        margins = self.margins(X)
+        if margins.shape[1] > 1:
+            return np.argmax(margins, axis=1)
+        return (margins[:, 0] > 0).astype(int)
+
+
+# ============================================================
+# ------------------------- LIGHTGBM --------------------------
+# ============================================================
+
+_LGBM_IDENTITY_OBJECTIVES = ("regression", "regression_l1", "huber", "fair", "quantile", "mape")
+
+
+class CompiledLGBMRegressor(_CompiledModel):
+    """`LGBMRegressor.predict` trên node arrays, so sánh float64 `x <= thr` + missing rules."""
+
+    def __init__(self, model):
+        self.native = model
+        dump = model.booster_.dump_model()
+        objective = str(dump.get("objective", "")).split(" ")[0]
+        if objective not in _LGBM_IDENTITY_OBJECTIVES:
+            raise NotImplementedError(f"Unsupported LightGBM objective: {objective}")
+        if dump.get("average_output") or dump.get("num_tree_per_iteration", 1) != 1:
+            raise NotImplementedError("Only plain single-output LightGBM regressors are supported")
+
+        trees = CompiledTrees(np.float64, strict=False)
+        for info in dump["tree_info"]:
+            trees.add_tree(*_flatten_lgbm_tree(info["tree_structure"]))
+        self.trees = trees.finalize(np.float64)
+
+    def _predict(self, X: np.ndarray) -> np.ndarray:
+        return _sequential_sum(self.trees.value[self.trees.leaves(X)])
+
+
+def _flatten_lgbm_tree(root: Dict[str, Any]) -> Tuple[list, list, list, list, list, list, list]:
+    missing_codes = {"None": MISSING_NONE, "Zero": MISSING_ZERO, "NaN": MISSING_NAN}
+    feature, threshold, left, right, value, default_left, missing = [], [], [], [], [], [], []
+    order = [root]
+    i = 0
+    while i < len(order):  # BFS: children luôn có index lớn hơn parent
+        node = order[i]
+        if "leaf_value" in node:
+            feature.append(0)
+            threshold.append(np.inf)
+            left.append(-1)
+            right.append(-1)
+            value.append(node["leaf_value"])
+            default_left.append(True)
+            missing.append(MISSING_NONE)
+        else:
+            if node.get("decision_type", "<=") != "<=":
+                raise NotImplementedError("Categorical LightGBM splits are not supported")
+            feature.append(node["split_feature"])
+            threshold.append(node["threshold"])
+            left.append(len(order))
+            right.append(len(order) + 1)
+            order.extend((node["left_child"], node["right_child"]))
+            value.append(node.get("internal_value", 0.0))
+            default_left.append(node.get("default_left", True))
+            missing.append(missing_codes.get(node.get("missing_type", "None"), MISSING_NONE))
+        i += 1
+    return feature, threshold, left, right, value, default_left, missing
+
+
+# ============================================================
+# ---------------------- BACKEND SELECTION --------------------
+# ============================================================
+
+def compile_model(model):
+    """Compile model sang node arrays; NotImplementedError nếu loại model không hỗ trợ."""
+    kind = type(model).__name__
+    if kind == "IsolationForest":
+        return CompiledIsolationForest(model)
+    if kind == "XGBClassifier":
+        return CompiledXGBClassifier(model)
+    if kind == "LGBMRegressor":
+        return CompiledLGBMRegressor(model)
+    raise NotImplementedError(f"No compiled backend for {kind}")
+
+
+def verify_compiled(compiled, n_rows: int = 512) -> bool:
+    """Parity check: prediction của compiled phải giống hệt model gốc (batch và từng dòng)."""
+    X = compiled.trees.probe(n_rows)
+    expected = np.asarray(compiled.native.predict(X)).reshape(-1)
+    if not np.array_equal(compiled._predict(X), expected):
+        return False
+    return all(
+        np.array_equal(compiled._predict(X[i:i + 1]), expected[i:i + 1]) for i in range(min(n_rows, 16))
+    )
+
+
+def select_backend(model, name: str, backend: str = "native", max_rows: Optional[int] = None):
+    """
+    Trả về predictor cho một model theo backend đã cấu hình.
+
+    Args:
+        model: model gốc đã load (có thể None)
+        name: tên model (anomaly, classifier, rul) dùng khi log
+        backend: "native" (model gốc), "compiled" (node arrays) hoặc "onnx"
+            (trả lại model gốc, làm fallback cho ONNX Runtime)
+        max_rows: batch lớn hơn giá trị này vẫn chạy bằng model gốc (None = luôn compiled)
+
+    Returns:
+        Compiled predictor nếu backend là "compiled" và parity check pass,
+        ngược lại là model gốc.
+    """
+    if backend not in BACKENDS:
+        print(f"⚠️ Unknown tree backend '{backend}' for {name}, using native")
+        return model
+    if model is None or backend != "compiled":
+        return model
+    try:
+        compiled = compile_model(model)
+        compiled.max_rows = max_rows
+        if verify_compiled(compiled):
+            print(f"✅ {name}: compiled tree backend "
+                  f"({compiled.trees.n_trees} trees, max depth {compiled.trees.max_depth})")
+            return compiled
+        print(f"⚠️ {name}: compiled tree backend does not match native predictions, using native")
+    except Exception as e:
+        print(f"⚠️ {name}: cannot compile model ({e}), using native")
+    return model